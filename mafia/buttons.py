@@ -0,0 +1,64 @@
+import badge
+
+#event kinds
+PRESS = 0
+RELEASE = 1
+LONG = 2
+REPEAT = 3
+
+DEBOUNCE = 0.03  # a level has to hold this long before it counts
+LONG_PRESS = 0.8  # held this long fires one LONG event
+REPEAT_DELAY = 0.5  # held this long starts REPEAT events on repeating buttons
+REPEAT_RATE = 0.15
+
+
+class ButtonState():
+    def __init__(self, now: float):
+        self.raw = False  # last level read from the pin
+        self.stable = False  # debounced level
+        self.changed_at = now  # when raw last flipped
+        self.pressed_at = now
+        self.long_sent = False
+        self.next_repeat = 0.0
+
+
+class InputEvents:
+    """Turns polled button levels into debounced press/release/long/repeat events"""
+    def __init__(self, buttons, repeating=(), now: float = 0.0):
+        self.states = {}
+        for button in buttons:
+            self.states[button] = ButtonState(now)
+        self.repeating = set(repeating)
+        self.events = []  # (button, kind) waiting for dispatch
+
+    def poll(self, now: float):
+        """Read every button once, never blocks, returns the queued events"""
+        for button, state in self.states.items():
+            level = bool(badge.input.get_button(button))
+            if level != state.raw:
+                state.raw = level
+                state.changed_at = now
+            elif level != state.stable and now - state.changed_at >= DEBOUNCE:
+                state.stable = level
+                if level:
+                    state.pressed_at = now
+                    state.long_sent = False
+                    state.next_repeat = now + REPEAT_DELAY
+                    self.events.append((button, PRESS))
+                else:
+                    self.events.append((button, RELEASE))
+            elif state.stable:
+                if not state.long_sent and now - state.pressed_at >= LONG_PRESS:
+                    state.long_sent = True
+                    self.events.append((button, LONG))
+                if button in self.repeating and now >= state.next_repeat:
+                    state.next_repeat = now + REPEAT_RATE
+                    self.events.append((button, REPEAT))
+        return self.events
+
+    def held(self, button) -> bool:
+        """Debounced level, for hold-to-show style controls"""
+        return self.states[button].stable
+
+    def clear(self) -> None:
+        self.events = []
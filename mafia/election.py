@@ -0,0 +1,126 @@
+import array
+
+import protocol
+from roster import MAX_PLAYERS
+
+HEARTBEAT_INTERVAL = 1.0  # host says it's alive after this long without broadcasting anything else
+HOST_TIMEOUT = 4.0  # seconds of silence from the host before its successor takes over
+
+
+def newer_term(a: int, b: int) -> bool:
+    """Whether term a comes after b, terms are one byte and wrap"""
+    return a != b and ((a - b) & 0xFF) < 0x80
+
+
+def successor(roster, host_slot: int) -> int:
+    """Who takes over from host_slot, whoever joined next and still has a badge we can reach, -1 if nobody
+
+    The dead can host too, so deaths don't change who's next. Only the host
+    knows every address, it announces the result in its heartbeats.
+    """
+    count = len(roster)
+    for step in range(1, count):
+        slot = (host_slot + step) % count
+        if roster.ids[slot]:
+            return slot
+    return -1
+
+
+class HostWatch():
+    """When a client last heard from its host"""
+    def __init__(self, timeout: float = HOST_TIMEOUT):
+        self.timeout = timeout
+        self.last_heard = None  # None until there's a host to watch
+        self.reported = False  # logged the silence already
+
+    def heard(self, now: float) -> None:
+        self.last_heard = now
+        self.reported = False
+
+    def stop(self) -> None:
+        self.last_heard = None
+        self.reported = False
+
+    def slept(self, seconds: float) -> None:
+        """Our receiver was off, that silence isn't the host's"""
+        if self.last_heard is not None:
+            self.last_heard += seconds
+
+    def expired(self, now: float) -> bool:
+        return self.last_heard is not None and now - self.last_heard > self.timeout
+
+
+class Replica():
+    """The host's secrets, kept by its successor only: every radio address and role, plus the stage and who's alive"""
+    def __init__(self, capacity: int = MAX_PLAYERS):
+        self.ids = array.array("H", bytes(2 * capacity))
+        self.roles = bytearray(capacity)
+        self.alive = bytearray(capacity)
+        self.seq = None  # host's seq when it sent this replica
+        self.stage = 0
+        self.total = 0  # slots in the host's roster
+        self.count = 0  # slots received so far
+        self.chunks = set()  # first slot of every chunk received, chunks can arrive in any order
+        self.paused_stage = protocol.NO_SLOT
+        self.left = None  # time the paused phase had left
+
+    def clear(self) -> None:
+        self.seq = None
+        self.total = 0
+        self.count = 0
+        self.chunks.clear()
+        self.paused_stage = protocol.NO_SLOT
+        self.left = None
+
+    def complete(self, players: int) -> bool:
+        return self.seq is not None and self.count >= self.total >= players
+
+    def load(self, buf) -> None:
+        """Take one REPLICA chunk, a retransmitted older replica can turn up after a newer one"""
+        seq, stage, total, first, paused, left, entries = protocol.read_replica(buf)
+        if seq != self.seq:
+            if self.seq is not None and protocol.newer_seq(self.seq, seq):
+                return  # Older than what we have
+            self.clear()
+            self.seq = seq
+            self.stage = stage
+            self.total = total
+        if first in self.chunks:
+            return  # The host resent the whole replica
+        self.chunks.add(first)
+        for i, (address, role, alive) in enumerate(entries):
+            self.ids[first + i] = address
+            self.roles[first + i] = role
+            self.alive[first + i] = alive
+        self.count += len(entries)
+        self.paused_stage = paused
+        self.left = left
+
+    def ahead_of(self, game) -> bool:
+        """Whether this replica knows more than our mirror: the mirror missed deltas or is older"""
+        if self.seq is None or self.count < self.total:
+            return False
+        return not game.in_sync or protocol.newer_seq(self.seq, game.seq)
+
+    def apply(self, game) -> int:
+        """Copy addresses and roles onto the mirrored roster, returns how many slots it covered
+
+        A mirror behind the replica also takes its stage and who's alive, and
+        loses its votes since the replica doesn't carry them.
+        """
+        roster = game.roster
+        covered = min(self.total, len(roster)) if self.count >= self.total else 0
+        ahead = self.ahead_of(game)
+        for slot in range(covered):
+            roster.set_id(slot, self.ids[slot])
+            roster.roles[slot] = self.roles[slot]
+            if ahead:
+                roster.set_alive(slot, bool(self.alive[slot]))
+                roster.votes[slot] = protocol.NO_SLOT
+        if ahead:
+            game.seq = self.seq
+            game.stage = self.stage
+            game.changed("players")
+            game.changed("stage")
+            game.changed("votes")
+        return covered
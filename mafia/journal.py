@@ -0,0 +1,134 @@
+import os
+import struct
+
+import protocol
+
+try:
+    BASE_DIR = __file__.rsplit("/", 1)[0]
+except NameError:
+    BASE_DIR = "."
+JOURNAL_DIR = BASE_DIR  # the desktop tools point this at a scratch directory per badge
+
+#record: [kind][payload length u16][payload]
+RECORD_HEADER = "<BH"
+RECORD_HEADER_SIZE = 3
+J_OP = 0        # a GameState delta op exactly as broadcast (join, stage, alive, vote)
+J_ID = 1        # slot, radio address u16
+J_ROLES = 2     # one role byte per slot
+J_PHASE = 3     # stage, tenths left u16, detail, stage it was paused in
+J_SELF = 4      # is host, slot, host address u16, role, term, host slot, then teammate slots
+J_SNAPSHOT = 5  # seq u16, stage, then (address u16, role, alive, vote, name) per slot
+
+FLUSH_INTERVAL = 2.0  # seconds records may wait in RAM, flash writes are slow and wear it out
+FLUSH_BYTES = 256  # write sooner once this much is waiting
+COMPACT_RECORDS = 256  # appended records before the file is rewritten as one snapshot
+
+
+def snapshot(game) -> bytes:
+    """The whole roster, roles included since this never leaves the badge"""
+    roster = game.roster
+    parts = [struct.pack("<HB", game.seq, game.stage)]
+    for slot in range(len(roster)):
+        parts.append(struct.pack("<HBBB", roster.ids[slot], roster.roles[slot], roster.is_alive(slot), roster.votes[slot]))
+        parts.append(protocol.pack_name(roster.names[slot]))
+    return b"".join(parts)
+
+
+def load_snapshot(game, buf) -> None:
+    seq, stage = struct.unpack_from("<HB", buf, 0)
+    roster = game.roster
+    roster.clear()
+    offset = 3
+    while offset < len(buf):
+        address, role, alive, vote = struct.unpack_from("<HBBB", buf, offset)
+        name, offset = protocol.unpack_name(buf, offset + 5)
+        slot = roster.add(name, address)
+        roster.roles[slot] = role
+        roster.set_alive(slot, bool(alive))
+        roster.votes[slot] = vote
+    game.seq = seq
+    game.stage = stage
+
+
+class Journal:
+    """Append-only log of game events on flash, rewritten as a compact snapshot now and then"""
+    def __init__(self, name: str = "journal.bin"):
+        self.path = f"{JOURNAL_DIR}/{name}"
+        self.pending = []  # encoded records not on flash yet
+        self.pending_size = 0
+        self.records = 0  # records on flash since the last snapshot
+        self.last_flush = 0.0
+        self.writes = 0
+        self.bytes_written = 0
+
+    def append(self, kind: int, payload: bytes) -> None:
+        self.pending.append(struct.pack(RECORD_HEADER, kind, len(payload)) + payload)
+        self.pending_size += RECORD_HEADER_SIZE + len(payload)
+
+    def flush(self, now: float, force: bool = False) -> bool:
+        """Write what's waiting in one append, returns whether flash was touched"""
+        if not self.pending:
+            return False
+        if not force and now - self.last_flush < FLUSH_INTERVAL and self.pending_size < FLUSH_BYTES:
+            return False
+        data = b"".join(self.pending)
+        self.last_flush = now
+        self.records += len(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self.writes += 1
+        self.bytes_written += len(data)
+        return True
+
+    def needs_compacting(self) -> bool:
+        return self.records >= COMPACT_RECORDS
+
+    def rewrite(self, records, now: float) -> None:
+        """Replace the file with (kind, payload) records, written aside first so a crash keeps the old one"""
+        data = b"".join(struct.pack(RECORD_HEADER, kind, len(payload)) + payload for kind, payload in records)
+        temp = self.path + ".new"
+        with open(temp, "wb") as f:
+            f.write(data)
+        try:
+            os.rename(temp, self.path)
+        except OSError:
+            # Some filesystems won't rename over an existing file
+            os.remove(self.path)
+            os.rename(temp, self.path)
+        self.pending = []
+        self.pending_size = 0
+        self.records = 0
+        self.last_flush = now
+        self.writes += 1
+        self.bytes_written += len(data)
+
+    def read(self):
+        """Every (kind, payload) on flash, oldest first, a torn last record is dropped"""
+        try:
+            with open(self.path, "rb") as f:
+                data = memoryview(f.read())
+        except OSError:
+            return
+        offset = 0
+        while offset + RECORD_HEADER_SIZE <= len(data):
+            kind, size = struct.unpack_from(RECORD_HEADER, data, offset)
+            offset += RECORD_HEADER_SIZE
+            if offset + size > len(data):
+                return
+            yield kind, data[offset:offset + size]
+            offset += size
+
+    def clear(self) -> None:
+        """Forget the game, nothing to resume"""
+        self.pending = []
+        self.pending_size = 0
+        self.records = 0
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {"writes": self.writes, "bytes": self.bytes_written, "records": self.records, "pending": len(self.pending)}
@@ -0,0 +1,89 @@
+import protocol
+from player import STAGE_NAMES, WAITING
+
+BEACON_INTERVAL = 2.0  # seconds between a waiting host's beacons
+PLAYING_BEACON_INTERVAL = 10.0  # once the game is on, only so new hosts don't pick its id
+MISSED_BEACONS = 3  # a lobby drops off the browser after this many beacons don't turn up
+MAX_LOBBIES = 16  # browser rows, the rest of the hall can wait for one to fill up
+
+
+def beacon_interval(stage: int) -> float:
+    return BEACON_INTERVAL if stage == WAITING else PLAYING_BEACON_INTERVAL
+
+
+class Lobby():
+    """One host we've heard a beacon from"""
+    def __init__(self, game: int, address: int, name: str, players: int, stage: int, now: float, relayed: bool = False):
+        self.game = game
+        self.address = address
+        self.relayed = relayed  # its beacons come relayed, so joining means relaying too
+        self.update(name, players, stage, now)
+
+    def update(self, name: str, players: int, stage: int, now: float) -> None:
+        self.name = name
+        self.players = players
+        self.stage = stage
+        self.last_heard = now
+
+    def expired(self, now: float) -> bool:
+        return now - self.last_heard > MISSED_BEACONS * beacon_interval(self.stage)
+
+    def row(self) -> str:
+        if self.stage == WAITING:
+            return f"{self.name} ({self.players})"
+        return f"{self.name} - {STAGE_NAMES[self.stage]}"
+
+
+class Lobbies():
+    """Games being hosted nearby, kept in the order we first heard them so rows don't jump around"""
+    def __init__(self):
+        self.lobbies = []
+
+    def __len__(self) -> int:
+        return len(self.lobbies)
+
+    def __getitem__(self, index: int) -> Lobby:
+        return self.lobbies[index]
+
+    def clear(self) -> None:
+        self.lobbies = []
+
+    def heard(self, game: int, buf, source: int, now: float, relayed: bool = False) -> bool:
+        """Take a BEACON for game, returns whether any row changed"""
+        players, stage, name = protocol.read_beacon(buf)
+        for lobby in self.lobbies:
+            if lobby.address == source:
+                # A badge hosts one game at a time, a new id means it started over or moved off a clash
+                changed = lobby.game != game or lobby.players != players or lobby.stage != stage or lobby.name != name
+                lobby.game = game
+                lobby.relayed = relayed
+                lobby.update(name, players, stage, now)
+                return changed
+        if len(self.lobbies) >= MAX_LOBBIES:
+            return False
+        self.lobbies.append(Lobby(game, source, name, players, stage, now, relayed))
+        return True
+
+    def expire(self, now: float) -> bool:
+        """Forget hosts that went quiet, returns whether any did"""
+        count = len(self.lobbies)
+        self.lobbies = [lobby for lobby in self.lobbies if not lobby.expired(now)]
+        return len(self.lobbies) != count
+
+    def find(self, game: int, address: int = None) -> int:
+        """Browser row of a game, hosted by address if given, -1 if we haven't heard it"""
+        for index, lobby in enumerate(self.lobbies):
+            if lobby.game == game and (address is None or lobby.address == address):
+                return index
+        return -1
+
+    def first_open(self) -> int:
+        """First game still waiting for players, -1 if there isn't one"""
+        for index, lobby in enumerate(self.lobbies):
+            if lobby.stage == WAITING:
+                return index
+        return -1
+
+    def taken(self):
+        """Game ids in use nearby"""
+        return set(lobby.game for lobby in self.lobbies)
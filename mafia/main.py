@@ -1,5 +1,7 @@
-from player import Player
+from player import Player, VotingResults, ROLE_NAMES, UNASSIGNED, VILLAGER, KRAKEN, COP
 import badge
+import buttons
+from render import ListView
 
 #three screens, host, game dets, lobby
 class App(badge.BaseApp):
@@ -11,6 +13,10 @@ class App(badge.BaseApp):
         self.active_players = []
         self.stage = "unstarted"
         self.stages = ["waiting", "night", "day", "voting"]
+        self.voting = VotingResults()
+        self.is_voting = False
+        self.vote_list = ListView(5, 50, font=18)
+        self.inputs = buttons.InputEvents(("BTN_A", "BTN_LEFT", "BTN_RIGHT", "BTN_B"), repeating=("BTN_LEFT", "BTN_RIGHT"), now=self.last_time)
 
     def add_player(self, player: Player) -> None:
         self.active_players.append(player)
@@ -59,19 +65,19 @@ class App(badge.BaseApp):
     
     #render game details
     def render_dets(self) -> None:
-        if self.personal_player.role == "unassigned":
+        if self.personal_player.role == UNASSIGNED:
             badge.display.nice_text("Error. You have not\nbeen assigned\na role yet.", 0, 0, font=32, color=0)
-        elif self.personal_player.role == "Kraken":
+        elif self.personal_player.role == KRAKEN:
             badge.display.nice_text("You are a\nKraken member!", 0, 0, font=32, color=0)
-        elif self.personal_player.role == "Villager":
+        elif self.personal_player.role == VILLAGER:
             badge.display.nice_text("You are a\nVillager!", 0, 0, font=32, color=0)
-        elif self.personal_player.role == "cop":
+        elif self.personal_player.role == COP:
             badge.display.nice_text("You are a\nCop!", 0, 0, font=32, color=0)
         else:
             badge.display.nice_text("Something went wrong with your role!", 0, 0, font=32, color=0)
 
         badge.display.nice_text("Game Details", 0, 0, font=32, color=0)
-        badge.display.nice_text(f"Role: {self.personal_player.role}", 0, 0, font=32, color=0)
+        badge.display.nice_text(f"Role: {ROLE_NAMES[self.personal_player.role]}", 0, 0, font=32, color=0)
         badge.display.nice_text("Player Statuses:", 0, 64, font=24, color=0)
         y_offset = 100
         for player in self.active_players:
@@ -93,15 +99,8 @@ class App(badge.BaseApp):
         badge.display.nice_text("")
 
     def cast_vote(self, voter_name: str, voted_name: str) -> None:
-        old_vote = self.votes.get(voter_name)
-        if old_vote:
-            self.vote_counts[old_vote] = self.vote_counts.get(old_vote, 1) - 1
-            if self.vote_counts[old_vote] <= 0:
-                del self.vote_counts[old_vote]
-
-        # Register new vote
-        self.votes[voter_name] = voted_name
-        self.vote_counts[voted_name] = self.vote_counts.get(voted_name, 0) + 1
+        # Changing a vote moves it, the tally never double counts
+        self.voting.add_vote(voter_name, voted_name)
         self.logger.info(f"{voter_name} voted for {voted_name}")
     
     def render_vote_screen(self) -> None:
@@ -112,39 +111,44 @@ class App(badge.BaseApp):
             badge.display.show()
             return
 
-        # Highlight currently selected player
-        selected = self.active_players[self.voting_player_index].name
-        badge.display.nice_text(f"Vote for:", 0, 50, font=24, color=0)
-        badge.display.nice_text(selected, 0, 80, font=32, color=0)
-        badge.display.nice_text("Use Left/Right to select", 0, 130, font=18, color=0)
-        badge.display.nice_text("Press B to vote", 0, 150, font=18, color=0)
+        # Only the visible page of names is drawn, the cursor marks the selection
+        self.vote_list.draw(self, len(self.active_players), self.vote_row)
+        badge.display.nice_text("Left/Right to select, B to vote", 0, 160, font=16, color=0)
         badge.display.show()
 
+    def vote_row(self, index: int) -> str:
+        return self.active_players[index].name
+
+    def text(self, text: str, x: int, y: int, font: int = 24, color: int = 0, w: int = None) -> None:
+        """Lets a ListView draw straight to the display"""
+        badge.display.nice_text(text, x, y, font=font, color=color)
+
 
 
     def loop(self) -> None:
-        pass
-        if badge.input.get_button("BTN_A") and not self.is_voting:
+        # Debounce is timed against the clock, nothing here sleeps
+        for button, kind in self.inputs.poll(badge.time.monotonic()):
+            if kind == buttons.PRESS or kind == buttons.REPEAT:
+                self.on_vote_button(button)
+        self.inputs.clear()
+
+    def on_vote_button(self, button) -> None:
+        if button == "BTN_A" and not self.is_voting:
             self.is_voting = True
-            self.voting_player_index = 0
+            self.vote_list.reset()
             self.render_vote_screen()
-            time.sleep(0.3)
 
-        if self.is_voting:
-            if badge.input.get_button("BTN_LEFT"):
-                self.voting_player_index = (self.voting_player_index - 1) % len(self.active_players)
-                self.render_vote_screen()
-                time.sleep(0.2)
+        elif self.is_voting:
+            if button == "BTN_LEFT":
+                if self.vote_list.scroll(-1, len(self.active_players)):
+                    self.render_vote_screen()
 
-            elif badge.input.get_button("BTN_RIGHT"):
-                self.voting_player_index = (self.voting_player_index + 1) % len(self.active_players)
-                self.render_vote_screen()
-                time.sleep(0.2)
+            elif button == "BTN_RIGHT":
+                if self.vote_list.scroll(1, len(self.active_players)):
+                    self.render_vote_screen()
 
-            elif badge.input.get_button("BTN_B"):
-                voted_player = self.active_players[self.voting_player_index]
+            elif button == "BTN_B" and self.active_players:
+                voted_player = self.active_players[self.vote_list.cursor]
                 self.cast_vote(self.personal_player.name, voted_player.name)
                 self.is_voting = False
                 self.render_screen()
-                time.sleep(0.3)
-        
\ No newline at end of file
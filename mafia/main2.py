@@ -1,342 +1,1280 @@
-class Player():
-    def __init__(self, name: str):
-        self.name = name
-        self.role = "unassigned"
-        self.alive = True
-        self.id = 0
-        self.vote_target = None  # Who this player voted for
-        self.votes_received = 0  # How many votes this player received
-        self.has_voted = False   # Whether this player has voted this round
-        
-    def __repr__(self):
-        return f"{self.name} ({self.role}) - {'Alive' if self.alive else 'Dead'}"
-        
-    def assign_role(self, role: str):
-        self.role = role
-        
-    #kraken functions
-    def kill(self, player):
-        if self.role == "Kraken":
-            player.alive = False
-    
-    # Voting functions
-    def vote(self, target_player):
-        """Vote for a player to eliminate"""
-        if self.alive and not self.has_voted:
-            self.vote_target = target_player
-            self.has_voted = True
-            return True
-        return False
-    
-    def clear_vote(self):
-        """Clear the player's vote for the next round"""
-        self.vote_target = None
-        self.has_voted = False
-        self.votes_received = 0
-    
-    def receive_vote(self):
-        """Increment vote count when someone votes for this player"""
-        self.votes_received += 1
-    
-    def get_vote_info(self):
-        """Get current voting information for this player"""
-        return {
-            "name": self.name,
-            "alive": self.alive,
-            "role": self.role,
-            "votes_received": self.votes_received,
-            "has_voted": self.has_voted,
-            "vote_target": self.vote_target.name if self.vote_target else None
-        }
-
-class VotingResults:
-    """Class to track and display voting results"""
-    def __init__(self):
-        self.votes = {}  # player_name -> vote_target_name
-        self.vote_counts = {}  
-        self.total_votes_cast = 0
-        self.round_number = 0
-        
-    def add_vote(self, voter_name: str, target_name: str):
-        """Record a vote from voter to target"""
-        self.votes[voter_name] = target_name
-        self.total_votes_cast += 1
-        
-        # Update vote count for target
-        if target_name in self.vote_counts:
-            self.vote_counts[target_name] += 1
-        else:
-            self.vote_counts[target_name] = 1
-    
-    def get_vote_summary(self):
-        """Get a summary of all votes cast"""
-        return {
-            "total_votes": self.total_votes_cast,
-            "vote_breakdown": self.vote_counts.copy(),
-            "round": self.round_number
-        }
-    
-    def get_elimination_candidate(self):
-        """Get the player with the most votes (to be eliminated)"""
-        if not self.vote_counts:
-            return None
-            
-        max_votes = max(self.vote_counts.values())
-        candidates = [name for name, votes in self.vote_counts.items() if votes == max_votes]
-        
-        if len(candidates) == 1:
-            return candidates[0]  # Clear winner
-        else:
-            return candidates  # Tie - return list of tied players
-    
-    def display_results(self):
-        """Format voting results for display"""
-        if not self.vote_counts:
-            return "No votes cast yet"
-            
-        result_lines = [f"Voting Results (Round {self.round_number})"]
-        result_lines.append(f"Total votes: {self.total_votes_cast}")
-        result_lines.append("")
-        
-        # Sort by vote count (highest first)
-        sorted_votes = sorted(self.vote_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        for player_name, vote_count in sorted_votes:
-            result_lines.append(f"{player_name}: {vote_count} votes")
-        
-        # Show elimination candidate
-        candidate = self.get_elimination_candidate()
-        if isinstance(candidate, list):
-            result_lines.append(f"\nTIE: {', '.join(candidate)}")
-        elif candidate:
-            result_lines.append(f"\nEliminated: {candidate}")
-            
-        return "\n".join(result_lines)
-    
-    def reset_round(self):
-        """Reset for a new voting round"""
-        self.votes.clear()
-        self.vote_counts.clear()
-        self.total_votes_cast = 0
-        self.round_number += 1
-
 #MAIN
 
+import random
+import struct
+
 import badge
+import buttons
+import protocol
+import stats
+from player import Player, VotingResults, ROLE_NAMES, STAGE_NAMES, UNASSIGNED, KRAKEN, UNSTARTED, WAITING, NIGHT, DAY, VOTING, PAUSED, RESOLUTION, OVER
+from render import RenderScheduler
+from textcache import TextCache
+
+#imported by App.warm_up() once the welcome screen is up, the first frame only needs the above
+election = journal = lobbies = night = phases = power = relay = replay = scheduler = transport = GameState = None
+
+try:
+    radio_listen = badge.radio.listen
+except AttributeError:
+    radio_listen = None  # Firmware that can't switch the receiver off, the night windows are only estimated
+
+SNAPSHOT_INTERVAL = 5.0  # seconds between full state broadcasts while hosting
+RX_QUEUE_MAX = 64  # packets waiting for the rx task, a burst past this is dropped and left to retransmission
+RENDER_INTERVAL = 0.1  # seconds after a panel refresh before the next one may start
+POWER_SAVE = True  # idle the loop without input and sleep the receiver at night, see power.py
+RELAY = False  # games we host are relayed badge to badge so they reach past one radio hop, see relay.py
 
-#three screens, host, game dets, lobby
+#five screens, host, games nearby, game dets, lobby, picking a player
 class App(badge.BaseApp):
     def on_open(self) -> None:
-        self.personal_player = Player(badge.contacts.my_contact().name)
-        self.screens = ["host", "dets", "lobby"]
+        """Just enough to draw the welcome screen, warm_up() does the rest on the next frame"""
+        self.screens = ["host", "games", "dets", "lobby", "pick"]
         self.last_time = badge.time.monotonic()
         self.current_screen = 0  # Changed to index-based
-        self.active_players = []
-        self.stage = "unstarted"
-        self.stages = ["waiting", "night", "day", "voting"]
-
-    def add_player(self, player: Player) -> None:
-        self.active_players.append(player)
-        self.logger.info(f"Added player: {player}")
-
-    def render_screen(self) -> None:
-        badge.display.fill(1)
-        # Call the correct render method based on current_screen index
-        if self.current_screen == 0:
-            self.render_host()
-        elif self.current_screen == 1:
-            self.render_dets()
-        elif self.current_screen == 2:
-            self.render_lobby()
-        badge.display.show()
+        self.is_host = False
+        self.warm = False
+        self.stats = stats.Stats()
+        self.log = stats.Log(self.logger)  # debug messages cost nothing unless log.level is lowered
+        self.debug_screen = False  # SW11+SW12 shows live stats
+        self.collected = {}  # address -> EXPORT_FIELDS values, on a badge collecting everyone's stats
+        self.renderer = RenderScheduler(TextCache())
+        self.renderer.add_screen("welcome", self.render_welcome)
+        # The rest are registered by screens.build() the first time they're shown
+        self.lists = {}  # screen name -> its ListView, each keeps its own scroll position
+        self.long_pressed = set()  # buttons whose LONG fired, their release isn't a tap
+        self.chorded = set()  # buttons pressed as part of a chord, ignored until released
+        Buttons = badge.input.Buttons
+        self.inputs = buttons.InputEvents((Buttons.SW3, Buttons.SW4, Buttons.SW11, Buttons.SW12), repeating=(Buttons.SW12,), now=self.last_time)
+
+    def warm_up(self) -> None:
+        """Game state, radio and journal, loaded once the welcome screen is showing"""
+        global election, journal, lobbies, phases, power, relay, replay, scheduler, transport, GameState
+        import election
+        import journal
+        import lobbies
+        import phases
+        import power
+        import relay
+        import replay
+        import scheduler
+        import transport
+        from state import GameState
+
+        self.personal_player = Player(badge.contacts.my_contact().name)
+        self.stages = [WAITING, NIGHT, DAY, VOTING, RESOLUTION]
+        self.slot = None  # Our index in the host's player list once joined
+        self.team = b""  # slots of our teammates, only Krakens are told theirs
+        self.role_config = None  # None deals roles.DEFAULT_CONFIG
+        self.host_address = None  # learned from the join ack
+        self.game_id = protocol.NO_GAME  # radio traffic for any other game is dropped unread
+        self.lobbies = lobbies.Lobbies()  # hosts we've heard beacons from
+        self.last_beacon = None  # host only
+        self.foreign = 0  # packets dropped because they belonged to another game
+        self.night = None  # host only, see night_engine()
+        self.dawn = None  # (victim, outcome, watched, visited) from the host's last DAWN for us
+        self.countdown = (UNSTARTED, None, protocol.NO_SLOT)  # (stage, local deadline, detail) from the last PHASE
+        self.voting = VotingResults()
+        self.vote_queue = []  # (voter slot, target slot) received since the last frame
+        self.term = 0  # bumped each time a new host takes over, stale hosts step down
+        self.host_slot = 0  # whoever started hosting joined first, until a failover
+        self.successor = protocol.NO_SLOT  # who takes over if the host goes quiet, as the host announced it
+        self.watch = election.HostWatch()  # clients only
+        self.replica = election.Replica()  # filled in on the host's successor
+        self.replica_to = None  # address the host last sent its replica to
+        self.replica_dirty = False  # roster changed since the replica went out
+        self.heartbeat_interval = election.HEARTBEAT_INTERVAL
+        self.heartbeats = 0
+        self.handlers = {
+            protocol.JOIN_REQ: self.handle_join_request,
+            protocol.JOIN_ACK: self.handle_join_ack,
+            protocol.ROLE: self.handle_role,
+            protocol.VOTE: self.handle_vote,
+            protocol.SYNC: self.handle_sync,
+            protocol.DELTA: self.handle_delta,
+            protocol.ACTION: self.handle_action,
+            protocol.DAWN: self.handle_dawn,
+            protocol.PHASE: self.handle_phase,
+            protocol.HEARTBEAT: self.handle_heartbeat,
+            protocol.REPLICA: self.handle_replica,
+            protocol.BEACON: self.handle_beacon,
+            protocol.STATS_REQ: self.handle_stats_request,
+            protocol.STATS: self.handle_stats,
+            protocol.REPLAY_REQ: self.handle_replay_request,
+            protocol.REPLAY: self.handle_replay,
+        }
+        # Host owns this copy, clients mirror it from deltas and snapshots
+        self.game = GameState(self.on_state_change)
+        self.phases = phases.PhaseClock(self.game)  # host only, clients follow PHASE packets
+        self.transport = transport.Transport(self.radio_send, self.on_give_up)
+        self.address = badge.contacts.my_contact().badge_id  # our radio address
+        self.relays = relay.Relay(self.address)
+        self.relay_mode = False  # wrap everything we send for relaying and pass on what others wrapped
+        self.rx_queue = []  # (source, data) from on_packet, handled by the rx task
+        self.tx_queue = []  # (data, destination) for the tx task to put on the air
+        # loop() only runs a frame of these, most urgent first
+        self.scheduler = scheduler.Scheduler()
+        self.rx = self.scheduler.add("rx", self.rx_task(), scheduler.RX)
+        self.scheduler.add("input", self.input_task(), scheduler.INPUT)
+        self.scheduler.add("timers", self.timers_task(), scheduler.TIMERS)
+        self.tx = self.scheduler.add("tx", self.tx_task(), scheduler.TX)
+        self.render = self.scheduler.add("render", self.render_task(), scheduler.RENDER, preemptible=True)
+        now = badge.time.monotonic()
+        self.last_snapshot = now
+        self.last_broadcast = now
+        self.power_save = POWER_SAVE
+        self.relay_games = RELAY
+        self.meter = power.Meter()  # estimated current draw per stage
+        self.listening = True  # receiver on, only a client in power save turns it off, at night
+        self.last_frame = now
+        self.last_input = now
+        self.night_start = now  # when we last saw night fall
+        self.last_sync = now  # when the host's last PHASE arrived, the next comes SNAPSHOT_INTERVAL later
+        self.held_action = None  # tonight's target, held for our action window
+        # Everything we'd need to pick the game back up after a reboot
+        self.journal = journal.Journal()
+        self.game.journal = self.journal
+        self.replay = replay.Recorder()  # host only, what happened in the game for the desktop analyzer
+        self.fetch = None  # replay.Fetch while we're copying another badge's replay
+        self.fetched = None  # the last one that finished
+        self.warm = True
+        self.resume()
+
+    def night_engine(self):
+        """The host's NightActions, loaded the first time a game needs one"""
+        global night
+        if self.night is None:
+            import night
+            self.night = night.NightActions()
+        return self.night
+
+    def resume(self) -> bool:
+        """Replay the journal left by the last run, returns whether there was a game in it"""
+        roster = self.game.roster
+        records = 0
+        phase = None
+        try:
+            for kind, payload in self.journal.read():
+                records += 1
+                if kind == journal.J_OP:
+                    self.game.replay(payload)
+                elif kind == journal.J_ID:
+                    slot, address = struct.unpack_from("<BH", payload, 0)
+                    roster.set_id(slot, address)
+                elif kind == journal.J_ROLES:
+                    roster.roles[:len(payload)] = payload
+                elif kind == journal.J_PHASE:
+                    phase = bytes(payload)  # Only the latest one matters
+                elif kind == journal.J_SELF:
+                    self.load_self(payload)
+                elif kind == journal.J_SNAPSHOT:
+                    journal.load_snapshot(self.game, payload)
+        except Exception as e:
+            self.log.error("Journal unreadable, starting fresh: %s", e)
+            self.journal.clear()
+            self.game.reset()
+            self.is_host = False
+            self.slot = None
+            return False
+        if not records:
+            return False
+
+        now = badge.time.monotonic()
+        if phase is not None:
+            stage, left, detail = protocol.read_phase(phase)
+            paused = phase[-1]
+            if self.is_host:
+                self.phases.restore(left, None if paused == protocol.NO_SLOT else paused, now)
+            self.set_countdown(stage, left, detail, now)
+        if self.is_host:
+            self.rebuild_tally()
+            self.set_relay_mode(self.relay_games)
+            self.last_snapshot = now - SNAPSHOT_INTERVAL  # Tell everyone where we are straight away
+        elif self.host_address is not None:
+            self.watch.heard(now)  # Give the host a full timeout to show up
+        self.journal.records = records
+        self.log.info("Resumed from journal: %s records, stage %s, seq %s", records, STAGE_NAMES[self.game.stage], self.game.seq)
+        return True
+
+    def rebuild_tally(self) -> None:
+        """The tally only lives in RAM, rebuild it from the votes on the roster"""
+        roster = self.game.roster
+        self.voting.reset_round()
+        self.voting.add_votes([(roster.names[voter], roster.names[roster.votes[voter]])
+                               for voter in range(len(roster)) if roster.votes[voter] != protocol.NO_SLOT])
+
+    def save_self(self) -> bytes:
+        """J_SELF payload, who we are in this game"""
+        slot = protocol.NO_SLOT if self.slot is None else self.slot
+        host = self.host_address or 0
+        return struct.pack("<BBHBBBB", self.is_host, slot, host, self.personal_player.role, self.term, self.host_slot, self.game_id) + bytes(self.team)
+
+    def load_self(self, payload) -> None:
+        is_host, slot, host, role, self.term, self.host_slot, self.game_id = struct.unpack_from("<BBHBBBB", payload, 0)
+        self.is_host = bool(is_host)
+        self.slot = None if slot == protocol.NO_SLOT else slot
+        self.host_address = host or None
+        self.personal_player.assign_role(role)
+        self.team = bytes(payload[8:])
+
+    def save_phase(self) -> bytes:
+        """J_PHASE payload, the last PHASE we announced plus the stage a pause interrupted"""
+        paused = self.phases.paused_stage
+        left = self.phases.left(badge.time.monotonic())
+        return protocol.phase(self.game.stage, left, self.countdown[2]) + bytes((protocol.NO_SLOT if paused is None else paused,))
+
+    def maintain_journal(self, now: float) -> None:
+        """Batch journal writes, and squash the log into one snapshot once it gets long"""
+        try:
+            if self.journal.needs_compacting():
+                self.compact_journal(now)
+            else:
+                self.journal.flush(now)
+            self.replay.flush()
+        except OSError as e:
+            self.log.error("Journal write failed: %s", e)
+
+    def compact_journal(self, now: float) -> None:
+        self.journal.rewrite([
+            (journal.J_SNAPSHOT, journal.snapshot(self.game)),
+            (journal.J_PHASE, self.save_phase()),
+            (journal.J_SELF, self.save_self()),
+        ], now)
+
+    def add_player(self, name: str, address: int = 0) -> int:
+        slot = self.game.add_player(name, address)
+        if slot < 0:
+            self.log.info("Lobby full, turned away %s", name)
+        else:
+            self.replica_dirty = True
+            self.record(replay.E_JOIN, slot, address, name)
+            self.log.debug("Added player: %s in slot %s", name, slot)
+        return slot
+
+    def send(self, data: bytes, destination: int = protocol.BROADCAST) -> None:
+        """Queue a message, it goes out coalesced with others on the next flush"""
+        now = badge.time.monotonic()
+        if destination == protocol.BROADCAST:
+            self.last_broadcast = now  # Anything we broadcast doubles as a heartbeat
+        self.stats.packets_out[data[1]] += 1
+        self.transport.send(data, destination, now)
+        self.wake_tx()
+
+    def radio_send(self, data: bytes, destination: int) -> None:
+        """Queue a packet for the tx task"""
+        if self.relay_mode:
+            data = self.relays.wrap(data, destination)
+            destination = protocol.BROADCAST  # Whoever is in range passes it on
+        self.stats.radio_out += 1
+        self.tx_queue.append((protocol.link(self.game_id, data), destination))
+        self.wake_tx()
+
+    def set_relay_mode(self, on: bool) -> None:
+        if on != self.relay_mode:
+            self.log.info("Relaying %s", "on" if on else "off")
+        self.relay_mode = on
+        self.transport.retry_base = relay.RETRY_BASE if on else transport.RETRY_BASE
+        if not on:
+            self.relays.clear()
+
+    def wake_tx(self) -> None:
+        if self.tx.wake_at is None:
+            self.scheduler.wake(self.tx)  # Only idles in power save, once the transport has nothing left to do
+
+    def on_give_up(self, destination: int) -> None:
+        self.log.error("No ack from %s, dropped a frame", destination)
+        if destination == self.replica_to:
+            self.replica_to = None  # It may have been part of the replica, send it all again
+
+    def on_state_change(self, topic: str) -> None:
+        if self.is_host and topic != "votes":
+            self.replica_dirty = True  # The replica carries the stage and who's alive
+        if topic == "stage" and self.warm:  # GameState reports its first stage while warm_up is creating it
+            if self.game.stage == WAITING:
+                # The host may have started another game with us in it, last game's role and news are gone
+                self.personal_player.assign_role(UNASSIGNED)
+                self.team = b""
+                self.dawn = None
+                self.held_action = None
+                self.renderer.invalidate("role")
+            elif self.game.stage == NIGHT:
+                self.dawn = None  # Last night's news is stale once the next night falls
+                self.night_start = badge.time.monotonic()
+            else:
+                self.held_action = None  # Missed our window, the night is over
+        self.renderer.invalidate(topic)
+
+    def screen_name(self, name: str = None) -> str:
+        """The screen to show, the current one unless named, registered with the renderer the first time"""
+        if name is None:
+            if self.debug_screen:
+                name = "debug"
+            elif self.inputs.held(badge.input.Buttons.SW11):
+                name = "dets"  # Holding SW11 peeks at the details screen
+            else:
+                name = self.screens[self.current_screen]
+        if name == "host" and not self.is_host:
+            name = "welcome"  # Nothing to show until we host
+        if name not in self.renderer.screens:
+            import screens
+            screens.build(self, name)
+        return name
+
+    def render_screen(self, name: str = None) -> None:
+        # Only touches the display if the screen or something it shows changed
+        name = self.screen_name(name)
+        start = stats.ticks_us()
+        if self.renderer.render(name):
+            self.stats.rendered(name, stats.ticks_diff(stats.ticks_us(), start))
 
     # Button handlers according to Shipwrecked PCB App API
-    def on_button_press(self, button: badge.Button) -> None:
+    def on_button_event(self, button, kind: int) -> None:
+        """Route debounced input events, holding Right scrolls, holding Select pages"""
+        Buttons = badge.input.Buttons
+        if button in self.chorded:
+            if kind == buttons.RELEASE:
+                self.chorded.discard(button)
+            return
+        if kind == buttons.PRESS and button == Buttons.SW12 and self.inputs.held(Buttons.SW11):
+            self.chorded.add(button)  # SW12 while peeking at the details opens or closes the debug screen
+            self.debug_screen = not self.debug_screen
+            return
+        if kind == buttons.PRESS:
+            if button != Buttons.SW4:  # Select acts on release so holding it can page instead
+                self.on_button_press(button)
+        elif kind == buttons.REPEAT:
+            self.scroll_list(1)
+        elif kind == buttons.LONG:
+            self.long_pressed.add(button)
+            self.on_button_long_press(button)
+        elif kind == buttons.RELEASE and button == Buttons.SW4:
+            if button in self.long_pressed:
+                self.long_pressed.discard(button)
+            else:
+                self.on_button_press(button)
+        elif kind == buttons.RELEASE:
+            self.long_pressed.discard(button)
+
+    def on_button_press(self, button: badge.input.Buttons) -> None:
         """Handle button presses for navigation and game actions"""
-        if button == badge.Button.SW3:  # Home button
+        if self.debug_screen:
+            self.on_debug_press(button)
+        elif button == badge.input.Buttons.SW3:  # Home button
             self.on_home_press()
-        elif button == badge.Button.SW12:  # Right button
+        elif button == badge.input.Buttons.SW12:  # Right button
             self.on_right_press()
-        elif button == badge.Button.SW4:  # Select button
+        elif button == badge.input.Buttons.SW4:  # Select button
             self.on_select_press()
 
+    def on_button_long_press(self, button: badge.input.Buttons) -> None:
+        """Holding SW4 flips a page of the current list"""
+        name = self.screens[self.current_screen]
+        lst = self.lists.get(name)
+        if button == badge.input.Buttons.SW4 and lst is not None and not self.debug_screen:
+            lst.page(self.list_length(name))
+            self.renderer.invalidate("list")
+        else:
+            self.log.debug("Long press on %s", button)
+
+    def on_debug_press(self, button: badge.input.Buttons) -> None:
+        """On the debug screen Home closes it, Select collects stats from every badge and Right copies the host's replay"""
+        if button == badge.input.Buttons.SW3:
+            self.debug_screen = False
+        elif button == badge.input.Buttons.SW4:
+            self.collect_stats()
+        elif button == badge.input.Buttons.SW12 and not self.is_host and self.host_address is not None:
+            self.fetch_replay(self.host_address)
+
+    def collect_stats(self) -> None:
+        self.collected = {}
+        self.send(protocol.stats_req())
+        self.renderer.invalidate("stats")
+        self.log.info("Collecting stats")
+
+    def scroll_list(self, step: int) -> bool:
+        """Move the current screen's list cursor, False if there's no cursor or it's at the end"""
+        name = self.screens[self.current_screen]
+        lst = self.lists.get(name)
+        if lst is None or not lst.selectable or not lst.scroll(step, self.list_length(name)):
+            return False
+        self.renderer.invalidate("list")
+        return True
+
+    def list_length(self, name: str) -> int:
+        """Rows in a screen's list, the browser lists games and the rest list players"""
+        return len(self.lobbies) if name == "games" else len(self.game.roster)
+
     def on_home_press(self) -> None:
         """SW3 - Home button: Return to main menu or start new game"""
         if self.current_screen != 0:
+            if self.is_host:
+                self.finish_replay()  # Abandoned, but the rounds so far are still worth keeping
             self.current_screen = 0
-            self.stage = "unstarted"
-            self.active_players = []
-            self.logger.info("Returned to home screen")
+            self.is_host = False
+            self.slot = None
+            self.team = b""
+            self.game.reset()
+            self.phases.reset()
+            self.countdown = (UNSTARTED, None, protocol.NO_SLOT)
+            self.host_address = None
+            self.game_id = protocol.NO_GAME
+            self.set_relay_mode(False)
+            self.term = 0
+            self.host_slot = 0
+            self.successor = protocol.NO_SLOT
+            self.watch.stop()
+            self.replica.clear()
+            self.journal.clear()  # Walking away isn't a crash, don't resume this game
+            self.log.info("Returned to home screen")
         else:
             # If already on home, start hosting a new game
             self.start_hosting()
 
     def on_right_press(self) -> None:
-        """SW12 - Right button: Navigate to next screen or next action"""
+        """SW12 - Right button: Next screen, on the pick screen move down the list first"""
+        if self.scroll_list(1):
+            return
+        lst = self.lists.get(self.screens[self.current_screen])
+        if lst is not None and lst.selectable:
+            lst.reset()
+            self.renderer.invalidate("list")
         if self.current_screen < len(self.screens) - 1:
             self.current_screen += 1
-            self.logger.info(f"Navigated to screen {self.current_screen}")
+            self.log.debug("Navigated to screen %s", self.current_screen)
         else:
             # Wrap around to first screen
             self.current_screen = 0
-            self.logger.info("Wrapped to first screen")
+            self.log.debug("Wrapped to first screen")
 
     def on_select_press(self) -> None:
         """SW4 - Select button: Confirm action or select option"""
         if self.current_screen == 0:  # Host screen
-            if self.stage == "unstarted":
+            if not self.is_host:
+                return
+            if self.game.stage == WAITING:
                 self.start_game()
+            elif self.game.stage == OVER:
+                self.play_again()
+            elif self.game.stage == PAUSED:
+                self.resume_game()
             else:
                 self.pause_game()
-        elif self.current_screen == 1:  # Details screen
+        elif self.current_screen == 1:  # Games nearby
+            if "games" in self.lists:
+                self.join_lobby(self.lists["games"].cursor)
+        elif self.current_screen == 2:  # Details screen
             self.refresh_game_details()
-        elif self.current_screen == 2:  # Lobby screen
+        elif self.current_screen == 3:  # Lobby screen
             self.ready_up()
+        elif self.current_screen == 4:  # Pick screen
+            if "pick" in self.lists:
+                self.pick(self.lists["pick"].cursor)
 
     def start_hosting(self) -> None:
         """Start hosting a new game"""
-        self.stage = "waiting"
-        self.active_players = [self.personal_player]  # Add self to active players
-        self.logger.info("Started hosting new game")
+        self.is_host = True
+        self.journal.clear()
+        self.game.reset()
+        self.phases.reset()
+        self.watch.stop()
+        self.replica_to = None
+        self.game_id = self.new_game_id()
+        self.last_beacon = None  # Advertise the lobby on the next frame
+        self.term = 0
+        self.set_relay_mode(self.relay_games)
+        self.start_replay(badge.time.monotonic())
+        self.enter_phase(WAITING, badge.time.monotonic())
+        self.slot = self.add_player(self.personal_player.name)  # Add self to active players
+        self.host_slot = self.slot
+        self.successor = protocol.NO_SLOT
+        self.journal.append(journal.J_SELF, self.save_self())
+        self.log.info("Started hosting new game")
+
+    def new_game_id(self) -> int:
+        """A game id no host we can hear is using"""
+        taken = self.lobbies.taken()
+        while True:
+            game = random.getrandbits(8)
+            if game != protocol.NO_GAME and game not in taken:
+                return game
 
     def start_game(self) -> None:
         """Start the game when host presses select"""
-        if len(self.active_players) >= 3:  # Minimum players to start
-            self.stage = "night"
-            self.assign_roles()
-            self.logger.info("Game started!")
+        if len(self.game.roster) >= 3:  # Minimum players to start
+            self.night_engine().clear()
+            if self.enter_phase(NIGHT, badge.time.monotonic()):
+                self.assign_roles()
+                self.log.info("Game started!")
         else:
-            self.logger.info("Need at least 3 players to start")
+            self.log.info("Need at least 3 players to start")
+
+    def play_again(self) -> None:
+        """Back to the lobby once a game is over, everyone stays in and comes back to life, roles are dealt again"""
+        now = badge.time.monotonic()
+        if not self.enter_phase(WAITING, now):
+            return
+        roster = self.game.roster
+        for slot in range(len(roster)):
+            self.game.set_alive(slot, True)
+            self.game.set_vote(slot, protocol.NO_SLOT)
+        roster.clear_roles()
+        self.voting.reset_round()
+        self.vote_queue = []
+        self.night_engine().clear()
+        self.replica_to = None  # Without last game's roles
+        self.start_replay(now)
+        for slot in range(len(roster)):
+            self.record(replay.E_JOIN, slot, roster.ids[slot], roster.names[slot])
+        try:
+            self.compact_journal(now)  # A reboot from here resumes the lobby, not the finished game
+        except OSError as e:
+            self.log.error("Journal write failed: %s", e)
+        self.log.info("Back to the lobby with %s players", len(roster))
 
     def pause_game(self) -> None:
-        """Pause the current game"""
-        if self.stage != "unstarted":
-            self.stage = "paused"
-            self.logger.info("Game paused")
+        """Pause the current game, the phase keeps the time it had left"""
+        now = badge.time.monotonic()
+        if self.phases.pause(now):
+            self.announce_phase(now)
+            self.replica_to = None  # The successor needs the time left to resume from
+            self.log.info("Game paused")
+
+    def resume_game(self) -> None:
+        now = badge.time.monotonic()
+        if self.phases.resume(now):
+            self.announce_phase(now)
+            self.replica_to = None
+            self.log.info("Game resumed")
+
+    def enter_phase(self, stage: int, now: float, detail: int = protocol.NO_SLOT) -> bool:
+        """Host moves the game on, only along legal transitions"""
+        if not self.phases.start(stage, now):
+            self.log.error("Can't go from %s to %s", STAGE_NAMES[self.game.stage], STAGE_NAMES[stage])
+            return False
+        self.announce_phase(now, detail)
+        return True
+
+    def start_replay(self, now: float) -> None:
+        try:
+            self.replay.start(self.game_id, self.term, now)
+        except OSError as e:
+            self.log.error("Replay not recorded: %s", e)
+
+    def record(self, kind: int, *fields) -> None:
+        """Add an event to the replay, nothing happens unless we're hosting"""
+        self.replay.event(kind, badge.time.monotonic(), *fields)
+
+    def record_link(self) -> None:
+        transport = self.transport
+        self.record(replay.E_LINK, transport.frames_sent, transport.retransmits, transport.gave_up, transport.duplicates,
+                    sum(self.stats.packets_in))
+
+    def announce_phase(self, now: float, detail: int = None) -> None:
+        """One PHASE broadcast carries the stage's deadline, nobody else has to keep time"""
+        if detail is None:
+            detail = self.countdown[2]
+        left = self.phases.left(now)
+        stage = self.game.stage
+        self.set_countdown(stage, left, detail, now)
+        self.send(protocol.phase(stage, left, detail))
+        self.last_snapshot = now  # The next PHASE is a whole interval away, sleeping clients wake for it
+        self.journal.append(journal.J_PHASE, self.save_phase())
+        self.record(replay.E_STAGE, stage, detail)
+        if stage == NIGHT or stage == RESOLUTION or stage == OVER:
+            self.record_link()  # Packet counts at both ends of every round
+        if stage == OVER:
+            self.finish_replay()
+
+    def finish_replay(self) -> None:
+        try:
+            self.replay.finish()
+        except OSError as e:
+            self.log.error("Replay write failed: %s", e)
+
+    def advance_phase(self, now: float) -> None:
+        """The phase's deadline passed, wrap it up and start the next one"""
+        stage = self.game.stage
+        if stage == NIGHT:
+            self.end_night()
+            self.end_or(DAY, now)
+        elif stage == DAY:
+            self.enter_phase(VOTING, now)
+        elif stage == VOTING:
+            if self.vote_queue:
+                self.apply_votes()
+            self.enter_phase(RESOLUTION, now, self.end_voting())
+        elif stage == RESOLUTION:
+            self.clear_votes()
+            self.night_engine().clear()
+            self.end_or(NIGHT, now)
+
+    def end_or(self, stage: int, now: float) -> None:
+        """Go to stage unless a team has already won"""
+        won = phases.winner(self.game.roster)
+        if won is None:
+            self.enter_phase(stage, now)
+        else:
+            self.enter_phase(OVER, now, won)
+            self.log.info("Game over, %s team wins", ROLE_NAMES[won])
 
     def refresh_game_details(self) -> None:
         """Refresh game details when on details screen"""
-        self.logger.info("Refreshed game details")
+        self.log.debug("Refreshed game details")
 
     def ready_up(self) -> None:
-        """Mark player as ready in lobby"""
-        if self.stage == "waiting":
-            self.logger.info("Player marked as ready")
-
-    def assign_roles(self) -> None:
-        """Assign roles to players at game start"""
-        import random
-        roles = ["Kraken", "Kraken", "Villager", "Villager", "cop"]
-        random.shuffle(roles)
-        
-        for i, player in enumerate(self.active_players):
-            if i < len(roles):
-                player.assign_role(roles[i])
+        """Mark player as ready in lobby, joins the game picked in the browser or else the first one open"""
+        if self.is_host or self.slot is not None:
+            return
+        index = self.lobbies.find(self.game_id)
+        if index < 0:
+            index = self.lobbies.first_open()
+        if index < 0:
+            self.log.info("No games nearby to join")
+            return
+        self.join_lobby(index)
+        self.log.info("Player marked as ready")
+
+    def join_lobby(self, index: int) -> None:
+        """Ask a host from the browser to let us in, their game's traffic is all we listen to from now on"""
+        if self.is_host or self.slot is not None or index >= len(self.lobbies):
+            return
+        lobby = self.lobbies[index]
+        if lobby.stage != WAITING:
+            self.log.info("%s's game has already started", lobby.name)
+            return
+        self.set_relay_mode(lobby.relayed)
+        if lobby.game != self.game_id:
+            self.game_id = lobby.game
+            self.game.reset()
+            self.countdown = (UNSTARTED, None, protocol.NO_SLOT)
+            self.renderer.invalidate("lobbies")
+        self.send(protocol.join_req(self.personal_player.name), lobby.address)
+        self.log.info("Asked to join %s's game %s", lobby.name, lobby.game)
+
+    def assign_roles(self, seed: int = None) -> None:
+        """Deal roles from role_config, the same seed always deals the same roles"""
+        import roles  # Once a game, no need to load it before then
+        roster = self.game.roster
+        players = len(roster)
+        counts = roles.role_counts(players, self.role_config or roles.DEFAULT_CONFIG)
+        roles.deal(roster.roles, players, counts, roles.Rng(seed))
+        self.record(replay.E_ROLES, bytes(roster.roles[:players]))
+        krakens = bytes(slot for slot in range(players) if roster.roles[slot] == KRAKEN)
+
+        for i in range(players):
+            role = roster.roles[i]
+            team = krakens if role == KRAKEN else b""
+            if i == self.slot:
+                self.personal_player.assign_role(role)
+                self.team = team
             else:
-                player.assign_role("Villager")
+                # Each badge only learns its own role, and Krakens their pod
+                self.send(protocol.role(i, role, team), roster.ids[i])
+        self.renderer.invalidate("role")
+        self.replica_to = None  # Resend the replica now it has roles in it
+        self.journal.append(journal.J_ROLES, bytes(roster.roles[:players]))
+        self.journal.append(journal.J_SELF, self.save_self())
         
-        self.logger.info("Roles assigned to players")
+        self.log.info("Roles assigned to players: %s", counts)
 
     #main welcome screen
     def on_packet(self, packet: badge.radio.Packet, in_foreground: bool) -> None:
-        if packet.app_number != 0:  # Fixed: Use actual app number from manifest
+        """Drop other games' traffic and queue the rest for the rx task, nothing is decoded here"""
+        if packet.app_number != 0 or not self.warm:  # Fixed: Use actual app number from manifest
             return
-        try:
-            data_str = packet.data.decode("utf-8")
-            self.logger.info(f"Received packet: {data_str} from {packet.source}")
-            if data_str.startswith("JOIN_REQ:"):
-                name = data_str[len("JOIN_REQ:"):].strip()
-                self.handle_join_request(name, packet.source)
+        data = packet.data
+        if protocol.link_game(data) != self.game_id and not protocol.is_beacon(data) and not (
+                self.game_id == protocol.NO_GAME and protocol.is_relay(data)):
+            self.foreign += 1  # Another lobby's traffic, only its beacons are worth reading, relayed ones while browsing
+            return
+        if len(self.rx_queue) >= RX_QUEUE_MAX:
+            self.stats.rx_overflow += 1
+            return
+        self.rx_queue.append((packet.source, data))
+        self.scheduler.wake(self.rx)
 
-            elif data_str.startswith("JOIN_ACK:"):
-                self.handle_join_ack(data_str[len("JOIN_ACK:"):].strip())
+    def handle_received(self) -> None:
+        """Everything on_packet queued since the last time, in the order it arrived"""
+        queue, self.rx_queue = self.rx_queue, []
+        for source, data in queue:
+            self.receive(source, data)
+
+    def receive(self, source: int, data) -> None:
+        try:
+            data = memoryview(data)
+            game = protocol.link_game(data)
+            relayed = protocol.is_relay(data)
+            data = data[protocol.LINK_SIZE:]
+            if relayed:
+                taken = self.relays.take(source, data, self.relay_mode and game == self.game_id, badge.time.monotonic())
+                if taken is None:
+                    return  # Heard it already
+                source, destination, data = taken
+                if destination != protocol.BROADCAST and destination != self.address:
+                    return  # Only passing through
+            if game != self.game_id:
+                if protocol.opcode(data) == protocol.BEACON:
+                    self.handle_beacon(data, source, game, relayed)
+                return  # We left that game while its packet was queued
+            if relayed and not self.relay_mode and source == self.host_address:
+                self.set_relay_mode(True)  # The host switched to relaying, follow it
+            if source == self.host_address:
+                self.watch.heard(badge.time.monotonic())
+            if protocol.opcode(data) == protocol.FRAME:
+                for message in self.transport.receive(source, data, badge.time.monotonic()):
+                    self.dispatch(message, source)
+            else:
+                self.dispatch(data, source)
 
         except Exception as e:
-            self.logger.error(f"Error decoding packet: {e}")
+            self.stats.decode_errors += 1
+            self.log.error("Error decoding packet: %s", e)
 
-    def handle_join_request(self, name: str, source) -> None:
+    def dispatch(self, data, source) -> None:
+        op = protocol.opcode(data)
+        self.stats.packets_in[op & 0xFF] += 1  # Unknown versions count as 0xFF
+        handler = self.handlers.get(op)
+        if handler is None:
+            self.log.debug("Ignored message from %s", source)
+            return
+        handler(data, source)
+
+    def handle_join_request(self, data, source) -> None:
         """Handle join request from another player"""
-        new_player = Player(name)
-        new_player.id = source
-        self.add_player(new_player)
-        # Send join acknowledgment
-        ack_data = f"JOIN_ACK:{name}".encode("utf-8")
-        badge.radio.send(ack_data, destination=source)
-
-    def handle_join_ack(self, data: str) -> None:
+        if not self.is_host:
+            return
+        name = protocol.read_join_req(data)
+        roster = self.game.roster
+        slot = roster.slot_for(source)
+        if slot < 0:
+            # Badges are told apart by address, a name someone else has gets a number
+            slot = self.add_player(roster.free_name(name), source)
+            if slot < 0:
+                return
+        name = roster.names[slot]
+        # Send join acknowledgment and a snapshot so the joiner starts in sync
+        self.send(protocol.join_ack(slot, name), source)
+        for packet in self.game.snapshot():
+            self.send(packet, source)
+
+    def handle_beacon(self, data, source, game: int = None, relayed: bool = False) -> None:
+        """A host nearby advertised its game"""
+        if game is None:
+            game = self.game_id
+            if self.is_host and self.game.stage == WAITING and len(self.game.roster) == 1:
+                # Two hosts picked the same id, nobody has joined us yet so we move
+                self.game_id = self.new_game_id()
+                self.log.info("Game id %s is taken, now hosting game %s", game, self.game_id)
+        if self.lobbies.heard(game, data, source, badge.time.monotonic(), relayed):
+            self.renderer.invalidate("lobbies")
+
+    def handle_stats_request(self, data, source) -> None:
+        """A collector wants our numbers"""
+        self.send(protocol.stats(self.stats.export(self.foreign)), source)
+
+    def handle_stats(self, data, source) -> None:
+        values = protocol.read_stats(data)
+        self.collected[source] = values
+        self.renderer.invalidate("stats")
+        self.log.info("Stats from %s: %s", source, values)
+
+    def handle_replay_request(self, data, source) -> None:
+        """A collector wants our replay, it gets a burst of chunks per request"""
+        if self.game.stage not in (UNSTARTED, WAITING, OVER):
+            self.log.info("Replay request from %s refused, the game is still on", source)
+            return  # The replay holds everyone's role
+        offset = protocol.read_replay_req(data)
+        try:
+            total = self.replay.length()
+            part = self.replay.read(offset, replay.CHUNK * replay.BURST) if offset < total else b""
+        except OSError as e:
+            self.log.error("Replay unreadable: %s", e)
+            return
+        for start in range(0, max(1, len(part)), replay.CHUNK):
+            self.send(protocol.replay(offset + start, total, part[start:start + replay.CHUNK]), source)
+
+    def fetch_replay(self, address: int) -> None:
+        """Copy another badge's replay to our flash over the radio"""
+        self.fetch = replay.Fetch(address, badge.time.monotonic(), self.replay.directory)
+        self.send(protocol.replay_req(0), address)
+        self.renderer.invalidate("stats")
+        self.log.info("Fetching replay from %s", address)
+
+    def handle_replay(self, data, source) -> None:
+        fetch = self.fetch
+        if fetch is None or source != fetch.source:
+            return
+        offset, total, chunk = protocol.read_replay(data)
+        ask = fetch.take(offset, total, chunk, badge.time.monotonic())
+        if ask is not None:
+            self.send(protocol.replay_req(ask), source)
+        self.renderer.invalidate("stats")
+        if fetch.done:
+            self.fetch = None
+            self.fetched = fetch
+            self.log.info("Replay from %s saved to %s, %s bytes", source, fetch.path, fetch.received)
+
+    def handle_join_ack(self, data, source) -> None:
         """Handle join acknowledgment"""
-        self.logger.info(f"Join acknowledged: {data}")
+        slot, name = protocol.read_join_ack(data)
+        mine = self.personal_player.name
+        if name == mine or name.startswith(mine + " "):  # The host may have numbered a name that was taken
+            self.slot = slot
+            self.host_address = source
+            self.watch.heard(badge.time.monotonic())
+            self.journal.append(journal.J_SELF, self.save_self())
+            self.log.info("Join acknowledged: %s in slot %s", name, slot)
 
-    def render_welcome(self) -> None:
-        badge.display.nice_text("Welcome to\nMafia!", 0, 0, font=24, color=0)
-        badge.display.nice_text("Press Home to\nstart hosting", 0, 64, font=24, color=0)
-        badge.display.nice_text("Press Right to\nnavigate", 0, 88, font=24, color=0)
-
-    #host screen
-    def render_host(self) -> None:
-        badge.display.nice_text("Hosting Game!", 0, 0, font=32, color=0)
-        badge.display.nice_text(f"Players: {len(self.active_players)}", 0, 32, font=24, color=0)
-        badge.display.nice_text("Press SW4 to start", 0, 64, font=18, color=0)
-        badge.display.nice_text("Press SW11 for details", 0, 88, font=18, color=0)
-        
-        y_offset = 120
-        for player in self.active_players:
-            badge.display.nice_text(f"• {player.name}", 0, y_offset, font=16, color=0)
-            y_offset += 20
-
-    #get players to join
-    def render_join(self) -> None:
-        badge.display.nice_text("Welcome to\nMafia!", 0, 0, font=32, color=0)
-        badge.display.nice_text("Press SW4 to\nstart hosting", 0, 64, font=24, color=0)
-    
-    #render game details
-    def render_dets(self) -> None:
-        badge.display.nice_text("Game Details", 0, 0, font=32, color=0)
-        
-        if self.personal_player.role == "unassigned":
-            badge.display.nice_text("Role: Not assigned", 0, 32, font=24, color=0)
-        else:
-            badge.display.nice_text(f"Role: {self.personal_player.role}", 0, 32, font=24, color=0)
-        
-        badge.display.nice_text(f"Stage: {self.stage}", 0, 56, font=24, color=0)
-        badge.display.nice_text(f"Players: {len(self.active_players)}", 0, 80, font=24, color=0)
-        badge.display.nice_text("Press Right for lobby", 0, 104, font=24, color=0)
-
-    #get game lobby
-    def render_lobby(self) -> None:
-        if self.stage == "unstarted":
-            badge.display.nice_text("Waiting for\nhost to start\nthe game...", 0, 0, font=32, color=0)
-        elif self.stage == "waiting":
-            badge.display.nice_text("Waiting for\nplayers to\njoin...", 0, 0, font=32, color=0)
-        elif self.stage == "night":
-            badge.display.nice_text("Night phase", 0, 0, font=32, color=0)
-            badge.display.nice_text("Please wait...", 0, 32, font=24, color=0)
-        elif self.stage == "day":
-            badge.display.nice_text("Day phase", 0, 0, font=32, color=0)
-            badge.display.nice_text("Discuss and vote!", 0, 32, font=24, color=0)
-        elif self.stage == "voting":
-            badge.display.nice_text("Voting phase", 0, 0, font=32, color=0)
-            badge.display.nice_text("Choose who to eliminate", 0, 32, font=24, color=0)
+    def handle_role(self, data, source) -> None:
+        """Host told us our secret role"""
+        slot, role, team = protocol.read_role(data)
+        if slot == self.slot:
+            self.personal_player.assign_role(role)
+            self.team = team
+            self.renderer.invalidate("role")
+            self.journal.append(journal.J_SELF, self.save_self())
+
+    def sent_by(self, source, slot: int) -> bool:
+        """Whether a message on behalf of slot came from that player's badge, the host's own included"""
+        return self.game.roster.slot_for(source) == slot or (slot == self.slot and source == self.address)
+
+    def handle_vote(self, data, source) -> None:
+        """A player voted, only the host keeps the tally"""
+        if self.is_host and self.game.stage == VOTING:
+            voter, target = protocol.read_vote(data)
+            if self.sent_by(source, voter):
+                self.vote_queue.append((voter, target))
+
+    def apply_votes(self) -> None:
+        """Apply every vote that arrived since the last frame in one go"""
+        roster = self.game.roster
+        count = len(roster)
+        ballots = []
+        for voter, target in self.vote_queue:
+            if voter >= count or (target >= count and target != protocol.NO_SLOT):
+                continue
+            if not roster.is_alive(voter) or (target != protocol.NO_SLOT and not roster.is_alive(target)):
+                continue  # The dead don't vote and can't be voted out twice
+            self.game.set_vote(voter, target)
+            self.record(replay.E_VOTE, voter, target)
+            ballots.append((roster.names[voter], None if target == protocol.NO_SLOT else roster.names[target]))
+        self.vote_queue = []
+        self.voting.add_votes(ballots)
+
+    def pick(self, target: int) -> None:
+        """Vote for the highlighted player, or target them at night"""
+        if self.slot is None or target >= len(self.game.roster):
+            return
+        if self.game.stage == NIGHT:
+            self.night_action(target)
+        elif self.game.stage == VOTING:
+            self.cast_vote(target)
+
+    def cast_vote(self, target: int) -> None:
+        if self.is_host:
+            self.vote_queue.append((self.slot, target))
+        elif self.host_address is not None:
+            self.send(protocol.vote(self.slot, target), self.host_address)
+
+    def night_action(self, target: int) -> None:
+        """Pick tonight's target, what happens to them depends on our role"""
+        if self.is_host:
+            if self.night_engine().submit(self.game.roster, self.slot, target):
+                self.record(replay.E_ACTION, self.slot, target)
+        elif self.slot is not None and self.host_address is not None:
+            if self.sleeps_at_night() and badge.time.monotonic() < self.night_start + power.action_window(self.slot)[0]:
+                self.held_action = target  # Goes out when our receiver is on for the ack anyway
+            else:
+                self.send(protocol.action(self.slot, target), self.host_address)
+
+    def handle_action(self, data, source) -> None:
+        """Someone acted at night, nothing happens until end_night"""
+        if self.is_host and self.game.stage == NIGHT:
+            actor, target = protocol.read_action(data)
+            if not self.sent_by(source, actor):
+                return  # Nobody acts for another player
+            if self.night_engine().submit(self.game.roster, actor, target):
+                self.record(replay.E_ACTION, actor, target)
+
+    def end_night(self) -> None:
+        """Resolve every night action at once, tell each badge involved in one packet, then it's day"""
+        roster = self.game.roster
+        actions = self.night_engine()
+        dawn = actions.resolve(roster)
+        if dawn.outcome & night.KILLED:
+            self.game.set_alive(dawn.victim, False)
+        self.record(replay.E_DAWN, dawn.victim, dawn.outcome)
+        targets = actions.targets
+        for slot in range(len(roster)):
+            role = roster.roles[slot]
+            if slot != dawn.victim and targets[slot] == protocol.NO_SLOT and role != KRAKEN:
+                continue  # Nothing happened to or by this player
+            watched, visited = dawn.reports.get(slot, (protocol.NO_SLOT, protocol.NO_SLOT))
+            if slot == self.slot:
+                self.dawn = (dawn.victim, dawn.outcome, watched, visited)
+                self.renderer.invalidate("dawn")
+            else:
+                self.send(protocol.dawn(dawn.victim, dawn.outcome, watched, visited), roster.ids[slot])
+        self.log.info("Night over, %s actions, victim %s outcome %s", actions.count, dawn.victim, dawn.outcome)
+        actions.clear()
+
+    def end_voting(self) -> int:
+        """Eliminate the player with the most votes, returns their slot (NO_SLOT on a tie)"""
+        candidate = self.voting.get_elimination_candidate()
+        if not isinstance(candidate, str):
+            return protocol.NO_SLOT
+        slot = self.game.slot_of(candidate)
+        self.game.set_alive(slot, False)
+        return slot
+
+    def clear_votes(self) -> None:
+        for voter in range(len(self.game.roster)):
+            self.game.set_vote(voter, protocol.NO_SLOT)
+        self.voting.reset_round()
+        self.vote_queue = []
+
+    def from_host(self, source) -> bool:
+        """Whether a packet comes from the host we follow, before joining any host will do"""
+        return not self.is_host and (self.slot is None or source == self.host_address)
+
+    def handle_phase(self, data, source) -> None:
+        """Host started a phase, keep its deadline on our own clock"""
+        if self.from_host(source):
+            stage, left, detail = protocol.read_phase(data)
+            now = badge.time.monotonic()
+            self.last_sync = now
+            self.set_countdown(stage, left, detail, now)
+
+    def set_countdown(self, stage: int, left, detail: int, now: float) -> None:
+        self.countdown = (stage, None if left is None else now + left, detail)
+        self.renderer.invalidate("clock")
+
+    def seconds_left(self, now: float):
+        """Time left in the current phase, None if it isn't timed or we haven't heard yet"""
+        stage, deadline, _ = self.countdown
+        if deadline is None or stage != self.game.stage or stage == PAUSED:
+            return None
+        return max(0.0, deadline - now)
+
+    def handle_dawn(self, data, source) -> None:
+        """What the night meant for us"""
+        if self.from_host(source):
+            self.dawn = tuple(protocol.read_dawn(data))
+            self.renderer.invalidate("dawn")
+
+    def handle_sync(self, data, source) -> None:
+        """Catch up from a full snapshot of the host's state"""
+        if self.from_host(source) and self.game.apply_snapshot(data):
+            self.log.debug("Synced to seq %s", self.game.seq)
+
+    def handle_delta(self, data, source) -> None:
+        """Apply the host's latest changes, a missed packet waits for the next snapshot"""
+        if self.from_host(source) and not self.game.apply_delta(data):
+            self.log.debug("Missed deltas at seq %s, waiting for snapshot", self.game.seq)
+
+    def broadcast_state(self, now: float) -> None:
+        """Host sends queued deltas, plus a full snapshot every few seconds"""
+        for packet in self.game.take_deltas():
+            self.send(packet)
+        periodic = now - self.last_snapshot > SNAPSHOT_INTERVAL
+        if periodic:
+            self.last_snapshot = now
+            for packet in self.game.snapshot():
+                self.send(packet)
+            if self.game.stage != UNSTARTED:
+                # Badges that missed the phase change still get the deadline
+                self.send(protocol.phase(self.game.stage, self.phases.left(now), self.countdown[2]))
+                self.journal.append(journal.J_PHASE, self.save_phase())  # So a reboot loses at most this much time
+            self.send_heartbeat()  # Late joiners learn who's hosting
+        elif now - self.last_broadcast >= self.heartbeat_interval:
+            self.send_heartbeat()
+        if self.last_beacon is None or now - self.last_beacon >= lobbies.beacon_interval(self.game.stage):
+            self.send_beacon(now)
+        self.replicate(now, periodic)
+
+    def send_beacon(self, now: float) -> None:
+        """Advertise the game to the browsers, sent raw since a frame would hide it from other games"""
+        self.last_beacon = now
+        self.stats.packets_out[protocol.BEACON] += 1
+        self.radio_send(protocol.beacon(len(self.game.roster), self.game.stage, self.personal_player.name), protocol.BROADCAST)
+
+    def send_heartbeat(self) -> None:
+        self.heartbeats += 1
+        self.send(protocol.heartbeat(self.term, self.slot, self.successor))
+
+    def replicate(self, now: float, periodic: bool) -> None:
+        """Keep our successor holding the addresses and roles it would need to take over"""
+        roster = self.game.roster
+        slot = election.successor(roster, self.slot)
+        if slot < 0:
+            return
+        address = roster.ids[slot]
+        if slot != self.successor:
+            self.successor = slot
+            self.send_heartbeat()  # Everyone has to agree who's next before it matters
+        if address == self.replica_to and not (self.replica_dirty and periodic):
+            return  # Joins only go out with the periodic snapshot
+        paused = self.phases.paused_stage
+        packets = protocol.replica(self.game.seq, self.game.stage, roster, protocol.NO_SLOT if paused is None else paused, self.phases.left(now))
+        for packet in packets:
+            self.send(packet, address)
+        self.replica_to = address
+        self.replica_dirty = False
+
+    def handle_heartbeat(self, data, source) -> None:
+        """The host is alive, a host with a newer term means a failover happened without us"""
+        term, host_slot, successor = protocol.read_heartbeat(data)
+        now = badge.time.monotonic()
+        if self.is_host:
+            # Two badges can take over at once if one's mirror was stale, the earlier joiner keeps hosting
+            if election.newer_term(term, self.term) or (term == self.term and host_slot < self.slot):
+                self.step_down(source, term, host_slot, now)
+            return
+        if self.slot is None:
+            return
+        if term == self.term and source == self.host_address:
+            self.successor = successor
+        if term == self.term:
+            if source == self.host_address or host_slot > self.host_slot:
+                return  # Nothing new (on_packet already fed the watch), or the losing half of a double takeover
+        elif not election.newer_term(term, self.term):
+            return  # A host that was replaced and hasn't noticed yet
+        self.term = term
+        self.host_slot = host_slot
+        self.host_address = source
+        self.successor = successor
+        self.game.in_sync = False  # The new host's seq may be behind ours, adopt its next snapshot
+        self.watch.heard(now)
+        self.journal.append(journal.J_SELF, self.save_self())
+        self.log.info("Following host in slot %s, term %s", host_slot, term)
+
+    def handle_replica(self, data, source) -> None:
+        """Our host's secrets, we're next in line"""
+        if self.slot is not None and self.from_host(source):
+            self.replica.load(data)
+            self.successor = self.slot  # Even if the heartbeat saying so got lost
+
+    def host_lost(self, now: float) -> None:
+        """The host went quiet, its successor takes over and everyone else waits to hear from them"""
+        if self.slot is not None and self.successor == self.slot:
+            if self.replica.complete(len(self.game.roster)) or self.game.stage == WAITING:
+                self.take_over(now)
+            elif not self.watch.reported:
+                self.watch.reported = True
+                self.log.error("Host went quiet before it sent us the roles, can't take over")
+        elif not self.watch.reported:
+            self.watch.reported = True
+            self.log.info("Host went quiet, waiting for slot %s to take over", self.successor)
+
+    def take_over(self, now: float) -> None:
+        """Carry on hosting from our mirror of the game plus the replica the old host kept sending us"""
+        roster = self.game.roster
+        old = self.host_slot
+        covered = self.replica.apply(self.game)  # Also catches a mirror that missed deltas up to the replica
+        self.is_host = True
+        self.term = (self.term + 1) & 0xFF
+        self.host_slot = self.slot
+        self.host_address = None
+        self.watch.stop()
+
+        # Pick the clock up where the last PHASE left it
+        stage, deadline, _ = self.countdown
+        if stage == PAUSED or self.game.stage == PAUSED:
+            left = self.replica.left
+        elif stage == self.game.stage:
+            left = None if deadline is None else max(0.0, deadline - now)
         else:
-            badge.display.nice_text(f"Game status:\n{self.stage}", 0, 0, font=32, color=0)
-        
-        badge.display.nice_text("Press Home to return", 0, 64, font=24, color=0)
+            left = self.phases.durations.get(self.game.stage)  # Never heard this phase's deadline
+        paused = self.replica.paused_stage
+        self.phases.restore(left, None if paused == protocol.NO_SLOT else paused, now)
+
+        self.game.take_deltas()
+        self.game.in_sync = True
+        if old < len(roster) and old != self.slot:
+            self.game.set_alive(old, False)  # They left with the host badge
+            roster.set_id(old, 0)  # and can't be our successor
+        self.successor = protocol.NO_SLOT
+        self.rebuild_tally()
+        self.night_engine().clear()
+        self.vote_queue = []
+        self.replica.clear()
+        self.replica_to = None
+        self.last_snapshot = now - SNAPSHOT_INTERVAL  # Snapshot and PHASE on the next frame
+        self.send_heartbeat()
+        self.replay_from_mirror(now)
+        try:
+            self.compact_journal(now)  # Our journal only has J_SELF records, start it from the mirror
+        except OSError as e:
+            self.log.error("Journal write failed: %s", e)
+        self.log.info("Took over hosting in term %s, replica covered %s/%s slots", self.term, covered, len(roster))
+
+    def replay_from_mirror(self, now: float) -> None:
+        """A successor's replay starts from the game as it stood at the takeover"""
+        roster = self.game.roster
+        self.start_replay(now)
+        for slot in range(len(roster)):
+            self.record(replay.E_JOIN, slot, roster.ids[slot], roster.names[slot])
+        self.record(replay.E_ROLES, bytes(roster.roles[:len(roster)]))
+        for slot in range(len(roster)):
+            if not roster.is_alive(slot):
+                self.record(replay.E_OUT, slot)
+        self.record(replay.E_HOST, self.term, self.slot)
+        self.record(replay.E_STAGE, self.game.stage, protocol.NO_SLOT)
+
+    def step_down(self, source: int, term: int, host_slot: int, now: float) -> None:
+        """Another badge took over while we were gone, follow it"""
+        self.is_host = False
+        self.finish_replay()
+        self.term = term
+        self.host_slot = host_slot
+        self.host_address = source
+        self.successor = protocol.NO_SLOT
+        self.phases.reset()
+        self.night = None  # Only hosts need one
+        self.vote_queue = []
+        self.game.take_deltas()
+        self.game.in_sync = False  # Our seq means nothing to the new host, adopt its next snapshot
+        self.watch.heard(now)
+        self.journal.append(journal.J_SELF, self.save_self())
+        self.log.info("Host in slot %s took over in term %s, stepping down", host_slot, term)
+
+    def render_welcome(self) -> None:
+        self.renderer.text("Welcome to\nMafia!", 0, 0, font=24)
+        self.renderer.text("Press Home to\nstart hosting", 0, 64, font=24)
+        self.renderer.text("Press Right to\nnavigate", 0, 88, font=24)
+
+    #scheduler tasks, see scheduler.py for what they yield
+    def rx_task(self):
+        """Handles queued packets, sleeps until on_packet wakes it"""
+        while True:
+            self.handle_received()
+            self.wake_tx()  # We may owe acks
+            yield scheduler.IDLE
+
+    def input_task(self):
+        """Never blocks, a press is handled on the frame its debounce settles"""
+        while True:
+            now = badge.time.monotonic()
+            events = self.inputs.poll(now)
+            if events:
+                if self.idle(now):
+                    self.scheduler.wake(self.render)  # Don't keep the press waiting for the idle refresh
+                self.last_input = now
+                for button, kind in events:
+                    self.on_button_event(button, kind)
+                self.inputs.clear()
+            yield 0
+
+    def timers_task(self):
+        """Once-a-second housekeeping, phase deadlines, host broadcasts and the failover watch"""
+        while True:
+            now = badge.time.monotonic()
+            if now - self.last_time > 1.0:  # Every second
+                self.last_time = now
+                self.stats.tick(now)
+                if self.debug_screen:
+                    self.renderer.invalidate("stats")
+                if self.countdown[1] is not None:
+                    self.renderer.invalidate("clock")  # Countdown only needs redrawing once a second
+                if self.lobbies.expire(now):
+                    self.renderer.invalidate("lobbies")
+
+            if self.is_host:
+                if self.vote_queue:
+                    self.apply_votes()
+                if self.phases.due(now):
+                    self.advance_phase(now)
+                self.broadcast_state(now)
+            elif self.watch.expired(now):
+                self.host_lost(now)
+            elif self.held_action is not None and now >= self.night_start + power.action_window(self.slot)[0]:
+                self.send(protocol.action(self.slot, self.held_action), self.host_address)
+                self.held_action = None
+            if self.fetch is not None and self.fetch.stalled(now):
+                self.send(protocol.replay_req(self.fetch.received), self.fetch.source)
+            self.maintain_journal(now)
+            yield power.IDLE_TIMER_INTERVAL if self.idle(now) else 0
+
+    def tx_task(self):
+        """Coalesced frames, retries and acks from the transport, then everything queued for the radio
+
+        In power save it sleeps until something is sent once the transport has nothing pending
+        """
+        while True:
+            now = badge.time.monotonic()
+            self.transport.flush(now)
+            for packet in self.relays.due(now):
+                self.tx_queue.append((protocol.link(self.game_id, packet), protocol.BROADCAST))
+            queue, self.tx_queue = self.tx_queue, []
+            for data, destination in queue:
+                badge.radio.send(data, destination=destination)
+                self.meter.sent(self.game.stage, len(data))
+            busy = self.transport.busy() or self.relays.pending
+            yield scheduler.IDLE if self.power_save and not busy else 0
+
+    def render_task(self):
+        """Lays the screen out, gives way to anything more urgent, then draws it unless that made it stale
+
+        Panel refreshes are at least RENDER_INTERVAL apart, IDLE_RENDER_INTERVAL while idle
+        """
+        renderer = self.renderer
+        while True:
+            name = self.screen_name()
+            start = stats.ticks_us()
+            layout = renderer.layout(name)
+            if layout is None:
+                yield power.IDLE_RENDER_INTERVAL if self.idle(badge.time.monotonic()) else 0
+                continue
+            spent = stats.ticks_diff(stats.ticks_us(), start)
+            yield  # A burst of votes doesn't wait behind the refresh
+            if name != self.screen_name() or renderer.stale(name, layout):
+                continue  # Lay it out again with the news
+            start = stats.ticks_us()
+            if renderer.draw(name, layout):
+                self.stats.rendered(name, spent + stats.ticks_diff(stats.ticks_us(), start))
+                self.meter.refreshed(self.game.stage)
+                now = badge.time.monotonic()
+                yield power.IDLE_RENDER_INTERVAL if self.idle(now) else RENDER_INTERVAL
+            else:
+                yield 0
 
     def loop(self) -> None:
-        """Main game loop - called every frame"""
-        current_time = badge.time.monotonic()
-        
-        # Update game state based on time if needed
-        if current_time - self.last_time > 1.0:  # Every second
-            self.last_time = current_time
-            # Add any periodic game logic here
-        
-        # Render the current screen. Should only happen if update.
-        if badge.input.get_button(badge.input.Buttons.SW4):
-            self.on_select_press()
-        if badge.input.get_button(badge.input.Buttons.SW11):
-            self.render_dets()
-        else:
-            self.render_screen()
+        """Main game loop - called every frame, runs one round of the scheduler's tasks"""
+        if not self.warm:
+            if self.renderer.current != "welcome":
+                self.render_screen("welcome")  # Up before the rest of the app has loaded
+                return
+            self.warm_up()
+        now = badge.time.monotonic()
+        self.stats.start_frame()
+        steps = self.scheduler.run(now)
+        self.stats.end_frame()
+        self.duty_cycle(now, steps)
+
+    def idle(self, now: float) -> bool:
+        """Power save and nobody has touched a button for a while, the loop and the panel slow down"""
+        return self.power_save and not self.debug_screen and now - self.last_input > power.IDLE_AFTER
+
+    def sleeps_at_night(self) -> bool:
+        """Clients in power save, except the host's successor, which has to notice if the host goes, and relays"""
+        return (self.power_save and not self.relay_mode and not self.is_host and self.slot is not None
+                and self.slot != self.successor)
+
+    def should_listen(self, now: float) -> bool:
+        if self.game.stage != NIGHT or not self.sleeps_at_night():
+            return True
+        if self.tx_queue or self.transport.busy() or self.fetch is not None:
+            return True  # Acks to hear
+        return power.night_listening(now, self.night_start, self.seconds_left(now), self.slot, self.last_sync, SNAPSHOT_INTERVAL)
 
-        
\ No newline at end of file
+    def duty_cycle(self, now: float, steps: int) -> None:
+        """Account for the last frame and switch the receiver for the next one"""
+        self.meter.frame(now, self.game.stage, steps > 1, self.listening)  # The input task steps every frame
+        if not self.listening:
+            self.watch.slept(now - self.last_frame)  # The host can't be heard with the receiver off
+        self.last_frame = now
+        listening = self.should_listen(now)
+        if listening != self.listening:
+            self.listening = listening
+            if radio_listen is not None:
+                radio_listen(listening)
@@ -0,0 +1,72 @@
+import protocol
+from player import KRAKEN, COP, ORGANIZER
+from roster import MAX_PLAYERS
+
+#dawn outcome flags
+KILLED = 0x01  # the Krakens' target was pulled into the ocean
+SAVED = 0x02  # the Krakens' target was protected
+
+NIGHT_ROLES = (KRAKEN, COP, ORGANIZER)  # roles that act at night, Krakens kill, cops protect, Organizers surveil
+
+
+class Dawn():
+    """What happened overnight"""
+    def __init__(self):
+        self.victim = protocol.NO_SLOT  # who the Krakens went for
+        self.outcome = 0
+        self.reports = {}  # organizer slot -> (watched slot, who the watched player visited)
+
+
+class NightActions:
+    """One target per actor slot, collected all night and resolved together at dawn"""
+    def __init__(self, capacity: int = MAX_PLAYERS):
+        self.targets = bytearray(b"\xff" * capacity)
+        self.count = 0  # actions submitted tonight
+
+    def clear(self) -> None:
+        targets = self.targets
+        for slot in range(len(targets)):
+            targets[slot] = protocol.NO_SLOT
+        self.count = 0
+
+    def submit(self, roster, actor: int, target: int) -> bool:
+        """Record an action, a later one from the same actor replaces it"""
+        if actor >= len(roster) or target >= len(roster) or actor == target:
+            return False
+        if not roster.is_alive(actor) or not roster.is_alive(target) or roster.roles[actor] not in NIGHT_ROLES:
+            return False
+        if roster.roles[actor] == KRAKEN and roster.roles[target] == KRAKEN:
+            return False  # Krakens know their team from ROLE, they can't go after each other
+        if self.targets[actor] == protocol.NO_SLOT:
+            self.count += 1
+        self.targets[actor] = target
+        return True
+
+    def resolve(self, roster) -> Dawn:
+        """Settle every action in one deterministic pass, does not touch the roster"""
+        dawn = Dawn()
+        roles = roster.roles
+        targets = self.targets
+        kills = {}
+        protected = set()
+        for actor in range(len(roster)):
+            target = targets[actor]
+            if target == protocol.NO_SLOT or not roster.is_alive(actor):
+                continue
+            role = roles[actor]
+            if role == KRAKEN:
+                kills[target] = kills.get(target, 0) + 1
+            elif role == COP:
+                protected.add(target)
+            elif role == ORGANIZER:
+                dawn.reports[actor] = (target, targets[target])
+
+        # Most Kraken votes wins, a tie goes to the lowest slot so every run agrees
+        best = 0
+        for target, votes in kills.items():
+            if votes > best or (votes == best and target < dawn.victim):
+                best = votes
+                dawn.victim = target
+        if best:
+            dawn.outcome = SAVED if dawn.victim in protected else KILLED
+        return dawn
@@ -0,0 +1,94 @@
+from player import UNSTARTED, WAITING, NIGHT, DAY, VOTING, PAUSED, RESOLUTION, OVER, KRAKEN, VILLAGER
+
+#seconds each timed phase lasts, waiting and over last until the host moves on
+DURATIONS = {
+    NIGHT: 45.0,
+    DAY: 120.0,
+    VOTING: 45.0,
+    RESOLUTION: 10.0,
+}
+
+#stage -> stages it may go to, pausing and resuming are handled separately
+TRANSITIONS = {
+    UNSTARTED: (WAITING,),
+    WAITING: (NIGHT,),
+    NIGHT: (DAY, OVER),
+    DAY: (VOTING,),
+    VOTING: (RESOLUTION,),
+    RESOLUTION: (NIGHT, OVER),
+    OVER: (WAITING,),
+}
+
+
+def winner(roster):
+    """KRAKEN or VILLAGER once a team has won, None while the game is on"""
+    krakens = roster.count_role(KRAKEN)
+    if krakens == 0:
+        return VILLAGER
+    if krakens >= roster.alive_count - krakens:
+        return KRAKEN
+    return None
+
+
+class PhaseClock:
+    """The host's phase machine, deadlines are badge.time.monotonic() values"""
+    def __init__(self, game, durations=DURATIONS):
+        self.game = game  # the stage itself lives in GameState so it reaches clients as a delta
+        self.durations = dict(durations)
+        self.reset()
+
+    def reset(self) -> None:
+        self.deadline = None  # None when the stage has no time limit or we're paused
+        self.remaining = 0.0  # time left when paused
+        self.paused_stage = None
+
+    def can_enter(self, stage: int) -> bool:
+        return stage in TRANSITIONS.get(self.game.stage, ())
+
+    def start(self, stage: int, now: float) -> bool:
+        """Move to a stage, returns False if the current stage can't go there"""
+        if not self.can_enter(stage):
+            return False
+        duration = self.durations.get(stage)
+        self.deadline = None if duration is None else now + duration
+        self.game.set_stage(stage)
+        return True
+
+    def left(self, now: float):
+        """Seconds until the deadline, None if there isn't one"""
+        if self.game.stage == PAUSED:
+            return self.remaining
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - now)
+
+    def due(self, now: float) -> bool:
+        return self.deadline is not None and now >= self.deadline
+
+    def pause(self, now: float) -> bool:
+        """Freeze the clock, only a running timed phase can be paused"""
+        if self.deadline is None:
+            return False
+        self.remaining = max(0.0, self.deadline - now)
+        self.paused_stage = self.game.stage
+        self.deadline = None
+        self.game.set_stage(PAUSED)
+        return True
+
+    def resume(self, now: float) -> bool:
+        """Back to the paused stage with the time it had left"""
+        if self.game.stage != PAUSED or self.paused_stage is None:
+            return False
+        self.deadline = now + self.remaining
+        self.game.set_stage(self.paused_stage)
+        self.paused_stage = None
+        return True
+
+    def restore(self, left, paused_stage, now: float) -> None:
+        """Pick the clock back up after a reboot, the time we were off doesn't count"""
+        self.reset()
+        if self.game.stage == PAUSED:
+            self.remaining = left or 0.0
+            self.paused_stage = paused_stage
+        elif left is not None:
+            self.deadline = now + left
@@ -1,72 +1,85 @@
+from tally import VoteTally
+
+#roles, one byte each on the wire and in the roster
+UNASSIGNED = 0
+VILLAGER = 1
+KRAKEN = 2
+COP = 3
+ORGANIZER = 4  # Hack Club Organizer, villager team, surveils at night
+ROLE_NAMES = ("unassigned", "Villager", "Kraken", "cop", "Hack Club Organizer")
+
+#stages
+UNSTARTED = 0
+WAITING = 1
+NIGHT = 2
+DAY = 3
+VOTING = 4
+PAUSED = 5
+RESOLUTION = 6  # votes are in, the result is on screen
+OVER = 7
+STAGE_NAMES = ("unstarted", "waiting", "night", "day", "voting", "paused", "resolution", "over")
+
 class Player():
+    __slots__ = ("name", "role", "alive", "id")
+
     def __init__(self, name: str):
         self.name = name
-        self.role = "unassigned"
+        self.role = UNASSIGNED
         self.alive = True
         self.id = 0
-        self.vote_target = None  # Who this player voted for
-        self.votes_received = 0  # How many votes this player received
-        self.has_voted = False   # Whether this player has voted this round
         
     def __repr__(self):
-        return f"{self.name} ({self.role}) - {'Alive' if self.alive else 'Dead'}"
+        return f"{self.name} ({ROLE_NAMES[self.role]}) - {'Alive' if self.alive else 'Dead'}"
         
-    def assign_role(self, role: str):
+    def assign_role(self, role: int):
         self.role = role
         
     #kraken functions
     def kill(self, player):
-        if self.role == "Kraken":
+        if self.role == KRAKEN:
             player.alive = False
     
-    # Voting functions
-    def vote(self, target_player):
-        """Vote for a player to eliminate"""
-        if self.alive and not self.has_voted:
-            self.vote_target = target_player
-            self.has_voted = True
+    # Voting functions, the round's VotingResults is the only place votes live
+    def vote(self, target_player, results):
+        """Vote for a player to eliminate, voting again changes the vote"""
+        if self.alive:
+            results.add_vote(self.name, target_player.name)
             return True
         return False
     
-    def clear_vote(self):
-        """Clear the player's vote for the next round"""
-        self.vote_target = None
-        self.has_voted = False
-        self.votes_received = 0
+    def clear_vote(self, results):
+        """Take back this player's vote"""
+        results.retract_vote(self.name)
     
-    def receive_vote(self):
-        """Increment vote count when someone votes for this player"""
-        self.votes_received += 1
-    
-    def get_vote_info(self):
-        """Get current voting information for this player"""
-        return {
-            "name": self.name,
-            "alive": self.alive,
-            "role": self.role,
-            "votes_received": self.votes_received,
-            "has_voted": self.has_voted,
-            "vote_target": self.vote_target.name if self.vote_target else None
-        }
+    def get_vote_info(self, results):
+        """(votes received, vote target or None) for this player"""
+        return results.vote_counts.get(self.name, 0), results.votes.get(self.name)
 
 class VotingResults:
     """Class to track and display voting results"""
     def __init__(self):
-        self.votes = {}  # player_name -> vote_target_name
-        self.vote_counts = {}  # player_name -> number_of_votes_received
-        self.total_votes_cast = 0
+        self.tally = VoteTally()
+        self.votes = self.tally.votes  # player_name -> vote_target_name
+        self.vote_counts = self.tally.counts  # player_name -> number_of_votes_received
         self.round_number = 0
+        self.tie = []  # get_elimination_candidate's last tie
+        self.tie_at = -1  # tally.changes when it was built
+
+    @property
+    def total_votes_cast(self):
+        return len(self.votes)
         
     def add_vote(self, voter_name: str, target_name: str):
-        """Record a vote from voter to target"""
-        self.votes[voter_name] = target_name
-        self.total_votes_cast += 1
-        
-        # Update vote count for target
-        if target_name in self.vote_counts:
-            self.vote_counts[target_name] += 1
-        else:
-            self.vote_counts[target_name] = 1
+        """Record a vote from voter to target, replacing any earlier vote"""
+        return self.tally.vote(voter_name, target_name)
+
+    def retract_vote(self, voter_name: str):
+        """Remove a voter's vote"""
+        return self.tally.retract(voter_name)
+
+    def add_votes(self, ballots):
+        """Apply a burst of (voter_name, target_name) votes, None retracts"""
+        return self.tally.apply(ballots)
     
     def get_vote_summary(self):
         """Get a summary of all votes cast"""
@@ -78,16 +91,14 @@ class VotingResults:
     
     def get_elimination_candidate(self):
         """Get the player with the most votes (to be eliminated)"""
-        if not self.vote_counts:
-            return None
-            
-        max_votes = max(self.vote_counts.values())
-        candidates = [name for name, votes in self.vote_counts.items() if votes == max_votes]
-        
-        if len(candidates) == 1:
-            return candidates[0]  # Clear winner
-        else:
-            return candidates  # Tie - return list of tied players
+        leader = self.tally.leader()
+        if leader is not None or not self.tally.tied():
+            return leader  # Clear winner, or None before anyone voted
+        if self.tie_at != self.tally.changes:
+            # Tie - return list of tied players, in no particular order, only rebuilt after the votes change
+            self.tie = list(self.tally.leaders())
+            self.tie_at = self.tally.changes
+        return self.tie
     
     def display_results(self):
         """Format voting results for display"""
@@ -98,16 +109,14 @@ class VotingResults:
         result_lines.append(f"Total votes: {self.total_votes_cast}")
         result_lines.append("")
         
-        # Sort by vote count (highest first)
-        sorted_votes = sorted(self.vote_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        for player_name, vote_count in sorted_votes:
+        # Highest first, the tally already keeps players bucketed by count
+        for player_name, vote_count in self.tally.ranked():
             result_lines.append(f"{player_name}: {vote_count} votes")
         
         # Show elimination candidate
         candidate = self.get_elimination_candidate()
         if isinstance(candidate, list):
-            result_lines.append(f"\nTIE: {', '.join(candidate)}")
+            result_lines.append(f"\nTIE: {', '.join(sorted(candidate))}")
         elif candidate:
             result_lines.append(f"\nEliminated: {candidate}")
             
@@ -115,8 +124,6 @@ class VotingResults:
     
     def reset_round(self):
         """Reset for a new voting round"""
-        self.votes.clear()
-        self.vote_counts.clear()
-        self.total_votes_cast = 0
+        self.tally.clear()
         self.round_number += 1
     
\ No newline at end of file
@@ -0,0 +1,87 @@
+from player import STAGE_NAMES
+
+#estimated current draw, rough datasheet numbers for the badge's parts until someone puts a meter on one
+BASE_MA = 8.0  # MCU waiting for the next loop, panel holding its image
+CPU_MA = 45.0  # on top of BASE_MA while a frame does work
+RX_MA = 16.0  # receiver listening
+TX_MA = 45.0  # transmitting
+AIR_BYTES_PER_S = 6000  # radio bitrate, for how long a packet keeps the transmitter on
+REFRESH_MAS = 4.0  # mA-seconds of one panel refresh
+BUSY_FRAME_S = 0.004  # CPU time of a frame that ran more than the input task
+POLL_FRAME_S = 0.0005  # CPU time of a frame that only polled the buttons
+
+#adaptive scheduling, used when App.power_save is set
+IDLE_AFTER = 15.0  # seconds without a button press before the app idles
+IDLE_RENDER_INTERVAL = 1.0  # seconds between panel refreshes while idle, the countdown only changes once a second
+IDLE_TIMER_INTERVAL = 0.25  # seconds between housekeeping rounds while idle
+
+#night listen windows, in seconds, for clients that aren't hosting or next in line to
+NIGHT_OPEN = 3.0  # listen this long after night falls, for roles and the phase change
+NIGHT_CLOSE = 3.0  # and from this long before dawn is due
+ACTION_SLOTS = 16  # night actions are sent in one of this many windows, by slot
+ACTION_SLOT_S = 2.0  # width of an action window, long enough for a few retries
+SYNC_GUARD = 0.5  # wake this long before the host's next periodic PHASE is due
+
+
+def action_window(slot: int):
+    """(start, end) of a slot's action window, in seconds after night falls"""
+    start = NIGHT_OPEN + (slot % ACTION_SLOTS) * ACTION_SLOT_S
+    return start, start + ACTION_SLOT_S
+
+
+def night_listening(now: float, night_start: float, left, slot: int, last_sync: float, sync_interval: float) -> bool:
+    """Whether a client should have its receiver on at night
+
+    It listens when night falls, in its own action window, for the host's
+    periodic PHASE so it notices if the night ends early, and before dawn.
+    left is the time the last PHASE said the night had, None if it didn't say
+    """
+    since = now - night_start
+    if since < NIGHT_OPEN:
+        return True
+    if left is None or left < NIGHT_CLOSE:
+        return True
+    start, end = action_window(slot)
+    if start <= since < end:
+        return True
+    return now - last_sync >= sync_interval - SYNC_GUARD  # Stays on until the PHASE turns up
+
+
+class Meter():
+    """Estimated charge used per stage, from what each frame did"""
+    def __init__(self):
+        self.seconds = {}  # stage -> seconds spent in it
+        self.charge = {}  # stage -> mA-seconds
+        self.listening = {}  # stage -> seconds with the receiver on
+        self.last = None
+
+    def add(self, stage: int, mas: float) -> None:
+        self.charge[stage] = self.charge.get(stage, 0.0) + mas
+
+    def frame(self, now: float, stage: int, busy: bool, listening: bool) -> None:
+        """Account for the time since the last frame"""
+        last, self.last = self.last, now
+        if last is None:
+            return
+        dt = now - last
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + dt
+        mas = BASE_MA * dt + CPU_MA * (BUSY_FRAME_S if busy else POLL_FRAME_S)
+        if listening:
+            mas += RX_MA * dt
+            self.listening[stage] = self.listening.get(stage, 0.0) + dt
+        self.add(stage, mas)
+
+    def sent(self, stage: int, size: int) -> None:
+        self.add(stage, TX_MA * size / AIR_BYTES_PER_S)
+
+    def refreshed(self, stage: int) -> None:
+        self.add(stage, REFRESH_MAS)
+
+    def mean_ma(self, stage: int) -> float:
+        seconds = self.seconds.get(stage, 0.0)
+        return self.charge.get(stage, 0.0) / seconds if seconds else 0.0
+
+    def report(self):
+        """stage name -> (seconds, mean mA, share of the time listening)"""
+        return dict((STAGE_NAMES[stage], (seconds, self.mean_ma(stage), self.listening.get(stage, 0.0) / seconds))
+                    for stage, seconds in self.seconds.items() if seconds)
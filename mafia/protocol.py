@@ -0,0 +1,311 @@
+import struct
+
+#radio packet: [game id][message or transport frame], the game id lets badges drop other lobbies' traffic unread
+#wire format: [version][opcode][fields...], all fields struct-packed
+#players are referred to by their one-byte slot in the host's player list
+#roles and stages go over the air as their one-byte ids from player.py
+VERSION = 1
+HEADER = "BB"
+HEADER_SIZE = 2
+BROADCAST = 0xFFFF
+MAX_PACKET = 120  # stay well under the radio frame size, the game id byte and a relay header go on top
+MAX_MESSAGE = MAX_PACKET - 11  # alone in a transport frame with its header, an ack and a length byte, see transport.py
+LINK_SIZE = 1
+NO_GAME = 0  # game id before we've hosted or picked a lobby, no host uses it
+NO_SLOT = 0xFF  # vote target meaning "retract my vote"
+NO_DEADLINE = 0xFFFF
+
+JOIN_REQ = 0x01   # name
+JOIN_ACK = 0x02   # slot, name
+ROLE = 0x03       # slot, role, team size, then the slots of teammates (Krakens know each other)
+PHASE = 0x04      # stage, time left in tenths of a second, detail (winning team when over, eliminated slot at resolution)
+VOTE = 0x05       # voter slot, target slot
+KILL = 0x06       # retired, kills only happen through night ACTIONs resolved at dawn
+SYNC = 0x07       # seq, stage, total, first slot, count, then (alive, vote, name) per player
+DELTA = 0x08      # first seq, count, then count ops, each op is one seq step
+ACTION = 0x09     # actor slot, target slot, what it does depends on the actor's role
+DAWN = 0x0A       # victim slot, outcome flags, watched slot, who they visited (Organizers only)
+HEARTBEAT = 0x0B  # term, host slot, successor slot, the host is still there and who takes over if it isn't
+REPLICA = 0x0C    # seq, stage, total, first slot, paused stage, tenths left when paused, count, then (address u16, role, alive) per slot, host to its successor only
+BEACON = 0x0D     # players, stage, host name, a host advertising its lobby, never framed
+STATS_REQ = 0x0E  # nothing, a collector badge asking everyone in its game for their stats
+STATS = 0x0F      # count, then count u32 values in the order of stats.EXPORT_FIELDS
+FRAME = 0x10      # transport frame wrapping one or more messages, see transport.py
+REPLAY_REQ = 0x11  # offset u32, a collector asking the host for its replay file from there
+REPLAY = 0x12      # offset u32, file size u32, then up to replay.CHUNK bytes of the file
+RELAY = 0x13       # origin u16, destination u16, id u16, hops left, then a packet for badges out of its origin's range, see relay.py
+
+#delta ops, roles are never broadcast so they stay secret
+D_JOIN = 0x00     # name
+D_STAGE = 0x01    # stage
+D_ALIVE = 0x02    # slot, alive
+D_VOTE = 0x03     # voter slot, target slot
+
+
+def opcode(buf) -> int:
+    """Opcode of a packet, or -1 if it is too short or from another version"""
+    if len(buf) < HEADER_SIZE or buf[0] != VERSION:
+        return -1
+    return buf[1]
+
+
+def newer_seq(a: int, b: int) -> bool:
+    """Whether game seq a comes after b, seqs go out as u16 and wrap"""
+    return a != b and ((a - b) & 0xFFFF) < 0x8000
+
+
+def link(game: int, data: bytes) -> bytes:
+    """Put the game id in front of a message or frame for the radio"""
+    return bytes((game,)) + data
+
+
+def link_game(buf) -> int:
+    """Game id of a radio packet, NO_GAME if it is empty"""
+    return buf[0] if len(buf) else NO_GAME
+
+
+def is_beacon(buf) -> bool:
+    """Whether a radio packet (game id included) is a lobby beacon, which every game listens to"""
+    return len(buf) > LINK_SIZE + 1 and buf[LINK_SIZE] == VERSION and buf[LINK_SIZE + 1] == BEACON
+
+
+def is_relay(buf) -> bool:
+    """Whether a radio packet (game id included) is wrapped for relaying"""
+    return len(buf) > LINK_SIZE + 1 and buf[LINK_SIZE] == VERSION and buf[LINK_SIZE + 1] == RELAY
+
+
+def header(op: int) -> bytes:
+    return struct.pack(HEADER, VERSION, op)
+
+
+def pack_name(name: str) -> bytes:
+    raw = name.encode("utf-8")[:255]
+    return struct.pack("B", len(raw)) + raw
+
+
+def unpack_name(buf, offset: int):
+    """Read a length-prefixed name, returns (name, next offset)"""
+    size = buf[offset]
+    end = offset + 1 + size
+    return str(buf[offset + 1:end], "utf-8"), end
+
+
+#builders
+def join_req(name: str) -> bytes:
+    return header(JOIN_REQ) + pack_name(name)
+
+
+def join_ack(slot: int, name: str) -> bytes:
+    return struct.pack("BBB", VERSION, JOIN_ACK, slot) + pack_name(name)
+
+
+def role(slot: int, role_id: int, team=b"") -> bytes:
+    """Everything a badge learns about its role, in one packet"""
+    return struct.pack("BBBBB", VERSION, ROLE, slot, role_id, len(team)) + bytes(team)
+
+
+def phase(stage: int, left=None, detail: int = NO_SLOT) -> bytes:
+    """Phase change, left is seconds to the deadline, relative because badge clocks don't agree"""
+    tenths = NO_DEADLINE if left is None else min(int(left * 10), NO_DEADLINE - 1)
+    return struct.pack("<BBBHB", VERSION, PHASE, stage, tenths, detail)
+
+
+def vote(voter: int, target: int) -> bytes:
+    return struct.pack("BBBB", VERSION, VOTE, voter, target)
+
+
+def action(actor: int, target: int) -> bytes:
+    return struct.pack("BBBB", VERSION, ACTION, actor, target)
+
+
+def dawn(victim: int, outcome: int, watched: int = NO_SLOT, visited: int = NO_SLOT) -> bytes:
+    return struct.pack("BBBBBB", VERSION, DAWN, victim, outcome, watched, visited)
+
+
+def heartbeat(term: int, host_slot: int, successor: int = NO_SLOT) -> bytes:
+    return struct.pack("BBBBB", VERSION, HEARTBEAT, term, host_slot, successor)
+
+
+def beacon(players: int, stage: int, name: str) -> bytes:
+    return struct.pack("BBBB", VERSION, BEACON, players, stage) + pack_name(name)
+
+
+def stats_req() -> bytes:
+    return header(STATS_REQ)
+
+
+def stats(values) -> bytes:
+    return struct.pack("BBB", VERSION, STATS, len(values)) + struct.pack(f"<{len(values)}I", *values)
+
+
+def replay_req(offset: int) -> bytes:
+    return header(REPLAY_REQ) + struct.pack("<I", offset)
+
+
+def replay(offset: int, total: int, chunk) -> bytes:
+    return header(REPLAY) + struct.pack("<II", offset, total) + bytes(chunk)
+
+
+def replica(seq: int, stage: int, roster, paused_stage: int = NO_SLOT, left=None):
+    """Addresses, roles and who's alive for the successor, split like sync, left only matters while paused"""
+    packets = []
+    total = len(roster)
+    tenths = NO_DEADLINE if left is None else min(int(left * 10), NO_DEADLINE - 1)
+    per_packet = (MAX_MESSAGE - HEADER_SIZE - 9) // 4
+    first = 0
+    while True:
+        count = min(per_packet, total - first)
+        parts = [struct.pack("<HBB", roster.ids[slot], roster.roles[slot], roster.is_alive(slot)) for slot in range(first, first + count)]
+        packets.append(struct.pack("<BBHBBBBHB", VERSION, REPLICA, seq, stage, total, first, paused_stage, tenths, count) + b"".join(parts))
+        first += count
+        if first >= total:
+            return packets
+
+
+def sync(seq: int, stage: int, roster):
+    """Full snapshot, split into as many packets as the roster needs"""
+    packets = []
+    first = 0
+    total = len(roster)
+    while True:
+        parts = []
+        size = HEADER_SIZE + 6
+        slot = first
+        while slot < total:
+            entry = struct.pack("BB", roster.is_alive(slot), roster.votes[slot]) + pack_name(roster.names[slot])
+            if parts and size + len(entry) > MAX_MESSAGE:
+                break
+            parts.append(entry)
+            size += len(entry)
+            slot += 1
+        head = struct.pack("<BBHBBBB", VERSION, SYNC, seq, stage, total, first, len(parts))
+        packets.append(head + b"".join(parts))
+        first = slot
+        if first >= total:
+            return packets
+
+
+def delta(first_seq: int, ops) -> bytes:
+    return struct.pack("<BBHB", VERSION, DELTA, first_seq, len(ops)) + b"".join(ops)
+
+
+def op_join(name: str) -> bytes:
+    return struct.pack("B", D_JOIN) + pack_name(name)
+
+
+def op_stage(stage: int) -> bytes:
+    return struct.pack("BB", D_STAGE, stage)
+
+
+def op_alive(slot: int, alive: bool) -> bytes:
+    return struct.pack("BBB", D_ALIVE, slot, alive)
+
+
+def op_vote(voter: int, target: int) -> bytes:
+    return struct.pack("BBB", D_VOTE, voter, target)
+
+
+#readers, all take the memoryview straight off packet.data
+def read_join_req(buf) -> str:
+    return unpack_name(buf, HEADER_SIZE)[0]
+
+
+def read_join_ack(buf):
+    """Returns (slot, name)"""
+    return buf[HEADER_SIZE], unpack_name(buf, HEADER_SIZE + 1)[0]
+
+
+def read_role(buf):
+    """Returns (slot, role id, teammate slots)"""
+    slot, role_id, count = struct.unpack_from("BBB", buf, HEADER_SIZE)
+    start = HEADER_SIZE + 3
+    return slot, role_id, bytes(buf[start:start + count])
+
+
+def read_phase(buf):
+    """Returns (stage, seconds left or None, detail)"""
+    stage, tenths, detail = struct.unpack_from("<BHB", buf, HEADER_SIZE)
+    return stage, None if tenths == NO_DEADLINE else tenths / 10, detail
+
+
+def read_vote(buf):
+    """Returns (voter slot, target slot)"""
+    return struct.unpack_from("BB", buf, HEADER_SIZE)
+
+
+def read_action(buf):
+    """Returns (actor slot, target slot)"""
+    return struct.unpack_from("BB", buf, HEADER_SIZE)
+
+
+def read_dawn(buf):
+    """Returns (victim, outcome, watched, visited)"""
+    return struct.unpack_from("BBBB", buf, HEADER_SIZE)
+
+
+def read_sync(buf):
+    """Returns (seq, stage, total players, first slot, [(name, alive, vote), ...])"""
+    seq, stage_id, total, first, count = struct.unpack_from("<HBBBB", buf, HEADER_SIZE)
+    offset = HEADER_SIZE + 6
+    players = []
+    for _ in range(count):
+        alive, vote_target = struct.unpack_from("BB", buf, offset)
+        name, offset = unpack_name(buf, offset + 2)
+        players.append((name, bool(alive), vote_target))
+    return seq, stage_id, total, first, players
+
+
+def read_heartbeat(buf):
+    """Returns (term, host slot, successor slot)"""
+    return struct.unpack_from("BBB", buf, HEADER_SIZE)
+
+
+def read_beacon(buf):
+    """Returns (players, stage, host name)"""
+    players, stage_id = struct.unpack_from("BB", buf, HEADER_SIZE)
+    name, _ = unpack_name(buf, HEADER_SIZE + 2)
+    return players, stage_id, name
+
+
+def read_stats(buf):
+    count = buf[HEADER_SIZE]
+    return struct.unpack_from(f"<{count}I", buf, HEADER_SIZE + 1)
+
+
+def read_replay_req(buf) -> int:
+    return struct.unpack_from("<I", buf, HEADER_SIZE)[0]
+
+
+def read_replay(buf):
+    """Returns (offset, file size, chunk)"""
+    offset, total = struct.unpack_from("<II", buf, HEADER_SIZE)
+    return offset, total, buf[HEADER_SIZE + 8:]
+
+
+def read_replica(buf):
+    """Returns (seq, stage, total, first slot, paused stage, seconds left or None, [(address, role, alive), ...])"""
+    seq, stage, total, first, paused, tenths, count = struct.unpack_from("<HBBBBHB", buf, HEADER_SIZE)
+    offset = HEADER_SIZE + 9
+    entries = []
+    for _ in range(count):
+        entries.append(struct.unpack_from("<HBB", buf, offset))
+        offset += 4
+    return seq, stage, total, first, paused, None if tenths == NO_DEADLINE else tenths / 10, entries
+
+
+def op_end(buf, offset: int) -> int:
+    """Offset just past the delta op at offset, -1 if the op is unknown"""
+    kind = buf[offset]
+    if kind == D_JOIN:
+        return offset + 2 + buf[offset + 1]
+    if kind == D_STAGE:
+        return offset + 2
+    if kind == D_ALIVE or kind == D_VOTE:
+        return offset + 3
+    return -1
+
+
+def read_delta(buf):
+    """Returns (first seq, op count, offset of the first op)"""
+    first_seq, count = struct.unpack_from("<HB", buf, HEADER_SIZE)
+    return first_seq, count, HEADER_SIZE + 3
@@ -0,0 +1,122 @@
+import random
+import struct
+
+import protocol
+
+#relayed packet: [version][RELAY][origin u16][destination u16][id u16][ttl] then the message or frame it carries
+#every badge in a relaying game floods its packets this way, the ones in between pass them on
+RELAY_HEADER = "<BBHHHB"
+RELAY_HEADER_SIZE = 9
+
+TTL = 4  # hops a packet may take, the venue has to fit in this many
+SEEN_MAX = 64  # (origin, id) pairs remembered, comfortably more than a few seconds of a game's traffic
+JITTER = 0.1  # seconds a relay waits before passing a packet on, listening for others doing it first
+SUPPRESS_COPIES = 2  # copies heard during the wait that make ours redundant
+NEIGHBOUR_WINDOW = 10.0  # seconds a badge we heard a packet from counts as a neighbour
+SPARSE = 4  # up to this many neighbours we always pass packets on, past it only SPARSE in neighbours do
+RETRY_BASE = 0.75  # transport retry timeout for a relaying game, a few hops there and back take longer
+
+
+class Pending():
+    """A packet waiting out its jitter before we pass it on"""
+    __slots__ = ("key", "packet", "due", "copies")
+
+    def __init__(self, key: int, packet: bytes, due: float):
+        self.key = key
+        self.packet = packet
+        self.due = due
+        self.copies = 0  # others we heard pass it on meanwhile
+
+
+class Relay():
+    """Seen-cache and rebroadcast suppression for one badge's share of a flood"""
+    def __init__(self, address: int):
+        self.address = address
+        self.next_id = random.getrandbits(16)  # a rebooted badge doesn't hit its old ids in the caches around it
+        self.seen = set()
+        self.order = []  # seen keys, oldest first
+        self.pending = []
+        self.neighbours = {}  # address -> when we last heard it directly
+        self.originated = 0
+        self.forwarded = 0
+        self.suppressed = 0  # copies we didn't pass on, enough had been heard or the dice said no
+        self.duplicates = 0
+
+    def wrap(self, data: bytes, destination: int) -> bytes:
+        """Our own packet for destination, as a relayed one any badge around may pass on"""
+        self.originated += 1
+        packet_id = self.next_id
+        self.next_id = (packet_id + 1) & 0xFFFF
+        self.remember((self.address << 16) | packet_id)
+        return struct.pack(RELAY_HEADER, protocol.VERSION, protocol.RELAY, self.address, destination, packet_id, TTL) + data
+
+    def remember(self, key: int) -> None:
+        self.seen.add(key)
+        self.order.append(key)
+        if len(self.order) > SEEN_MAX:
+            self.seen.discard(self.order.pop(0))
+
+    def take(self, sender: int, buf, forward: bool, now: float):
+        """A relayed packet heard from sender, returns (origin, destination, payload) if it's new
+
+        With forward set, copies not addressed only to us are passed on later
+        unless the neighbourhood covers them first
+        """
+        self.neighbours[sender] = now
+        _, _, origin, destination, packet_id, ttl = struct.unpack_from(RELAY_HEADER, buf, 0)
+        key = (origin << 16) | packet_id
+        if key in self.seen:
+            self.duplicates += 1
+            for pending in self.pending:
+                if pending.key == key:
+                    pending.copies += 1
+                    break
+            return None
+        self.remember(key)
+        if forward and ttl > 1 and destination != self.address:
+            packet = bytearray(buf)
+            packet[RELAY_HEADER_SIZE - 1] = ttl - 1
+            self.pending.append(Pending(key, bytes(packet), now + JITTER * random.getrandbits(8) / 256))
+        return origin, destination, buf[RELAY_HEADER_SIZE:]
+
+    def chance(self, now: float) -> float:
+        """Probability of passing a packet on, lower the more badges around us could do it"""
+        count = 0
+        for address, heard in list(self.neighbours.items()):
+            if now - heard > NEIGHBOUR_WINDOW:
+                del self.neighbours[address]
+            else:
+                count += 1
+        return 1.0 if count <= SPARSE else SPARSE / count
+
+    def due(self, now: float):
+        """Packets whose wait is over and still worth sending"""
+        if not self.pending:
+            return ()
+        out = []
+        waiting = []
+        chance = None
+        for pending in self.pending:
+            if pending.due > now:
+                waiting.append(pending)
+                continue
+            if chance is None:
+                chance = self.chance(now)
+            if pending.copies >= SUPPRESS_COPIES or random.getrandbits(8) >= chance * 256:
+                self.suppressed += 1
+            else:
+                self.forwarded += 1
+                out.append(pending.packet)
+        self.pending = waiting
+        return out
+
+    def clear(self) -> None:
+        self.pending = []
+
+    def stats(self):
+        return {
+            "originated": self.originated,
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "duplicates": self.duplicates,
+        }
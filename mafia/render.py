@@ -0,0 +1,207 @@
+import badge
+
+#the e-paper panel is 200x200, 1 = white, 0 = black
+DISPLAY_WIDTH = 200
+DISPLAY_HEIGHT = 200
+
+
+class Widget():
+    """One nice_text call, remembered so the next frame can be diffed against it"""
+    def __init__(self, text: str, x: int, y: int, font: int, color: int, w: int = None):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.font = font
+        self.color = color
+        # nice_text does not report its size, so unless told clear the whole band to the right
+        self.w = DISPLAY_WIDTH - x if w is None else w
+        self.h = font * (text.count("\n") + 1)
+        self.key = (text, x, y, font, color)
+        self.cacheable = True  # False when it lands on another widget's ink
+
+    def overlaps(self, rect) -> bool:
+        x, y, w, h = rect
+        return self.x < x + w and x < self.x + self.w and self.y < y + h and y < self.y + self.h
+
+    def rect(self):
+        return (self.x, self.y, self.w, self.h)
+
+    def draw(self, cache=None) -> None:
+        if self.y >= DISPLAY_HEIGHT:
+            return  # Off the bottom of the panel
+        if cache is not None and self.cacheable:
+            cache.draw(self.text, self.x, self.y, self.font, self.color, self.w, self.h)
+        else:
+            badge.display.nice_text(self.text, self.x, self.y, font=self.font, color=self.color)
+
+
+class ListView():
+    """A window onto a long list, only the rows on screen are laid out each frame"""
+    def __init__(self, rows: int, y: int, font: int = 16, spacing: int = 20, selectable: bool = True):
+        self.rows = rows  # how many fit on the panel
+        self.y = y
+        self.font = font
+        self.spacing = spacing
+        self.selectable = selectable  # False for lists that only page, no cursor is drawn
+        self.top = 0  # first visible index
+        self.cursor = 0
+
+    def reset(self) -> None:
+        self.top = 0
+        self.cursor = 0
+
+    def scroll(self, step: int, count: int) -> bool:
+        """Move the cursor, returns False if it is already at that end of the list"""
+        target = self.cursor + step
+        if target < 0 or target >= count:
+            return False
+        self.cursor = target
+        # Jump a whole page when the cursor leaves the window, fewer repaints than sliding by a row
+        if self.cursor >= self.top + self.rows:
+            self.top = self.cursor
+        elif self.cursor < self.top:
+            self.top = max(0, self.cursor - self.rows + 1)
+        return True
+
+    def page(self, count: int) -> None:
+        """Next page, from the last one back to the top"""
+        self.top = 0 if self.top + self.rows >= count else self.top + self.rows
+        self.cursor = self.top
+
+    def label(self, count: int) -> str:
+        """Which rows are showing, e.g. 5-8/80"""
+        return f"{self.top + 1}-{min(self.top + self.rows, count)}/{count}"
+
+    def draw(self, renderer, count: int, row_text, x: int = 0) -> None:
+        """Lay out the visible rows, row_text(index) gives each one's text"""
+        if self.cursor >= count:
+            # The list shrank under us
+            self.cursor = max(0, count - 1)
+            self.top = self.cursor - self.cursor % self.rows
+        indent = self.font if self.selectable else 0
+        y = self.y
+        for i in range(self.top, min(self.top + self.rows, count)):
+            renderer.text(row_text(i), x + indent, y, font=self.font)
+            y += self.spacing
+        if count and self.selectable:
+            # The cursor is its own narrow widget so moving it leaves the rows alone
+            renderer.text(">", x, self.y + (self.cursor - self.top) * self.spacing, font=self.font, w=self.font)
+
+
+class RenderScheduler:
+    """Repaints a screen only when something it depends on has changed"""
+    def __init__(self, cache=None):
+        self.cache = cache  # TextCache, blits strings it has seen before
+        self.screens = {}  # screen name -> (render callback, topics it depends on)
+        self.versions = {}  # topic -> version counter, bumped by invalidate()
+        self.drawn_versions = None  # versions of the current screen's topics at last draw
+        self.current = None  # screen shown on the panel right now
+        self.widgets = []  # widgets on the panel right now
+        self.pending = None  # widgets collected during a render pass
+        self.frames_drawn = 0
+        self.frames_partial = 0
+        self.frames_skipped = 0
+
+    def add_screen(self, name: str, callback, topics=()) -> None:
+        """Register a render callback and the state topics it reads"""
+        self.screens[name] = (callback, tuple(topics))
+
+    def invalidate(self, topic: str) -> None:
+        """Mark a piece of state as changed so screens reading it repaint"""
+        self.versions[topic] = self.versions.get(topic, 0) + 1
+
+    def force(self) -> None:
+        """Throw away what is on the panel and repaint from scratch next frame"""
+        self.current = None
+
+    def text(self, text: str, x: int, y: int, font: int = 24, color: int = 0, w: int = None) -> None:
+        """Queue a nice_text call for the screen being rendered, w narrows the band it clears"""
+        self.pending.append(Widget(text, x, y, font, color, w))
+
+    def render(self, name: str) -> bool:
+        """Render a screen if it is dirty, returns whether the panel was touched"""
+        layout = self.layout(name)
+        return layout is not None and self.draw(name, layout)
+
+    def topic_versions(self, name: str):
+        return tuple(self.versions.get(topic, 0) for topic in self.screens[name][1])
+
+    def layout(self, name: str):
+        """Run a dirty screen's callback, returns (widgets, versions) for draw(), None if it is clean"""
+        callback = self.screens[name][0]
+        versions = self.topic_versions(name)
+        if name == self.current and versions == self.drawn_versions:
+            self.frames_skipped += 1
+            return None
+
+        self.pending = []
+        callback()
+        widgets = self.pending
+        self.pending = None
+        if self.cache is not None:
+            self.mark_overlaps(widgets)
+        return widgets, versions
+
+    def stale(self, name: str, layout) -> bool:
+        """Whether what a layout shows changed since it was made, so drawing it would be wasted"""
+        return layout[1] != self.topic_versions(name)
+
+    def draw(self, name: str, layout) -> bool:
+        """Put a layout on the panel, returns whether anything on it changed"""
+        widgets, versions = layout
+        if name != self.current:
+            self.draw_full(widgets)
+        elif not self.draw_changes(widgets):
+            self.drawn_versions = versions
+            self.frames_skipped += 1
+            return False
+
+        self.current = name
+        self.drawn_versions = versions
+        self.widgets = widgets
+        badge.display.show()
+        self.frames_drawn += 1
+        return True
+
+    def mark_overlaps(self, widgets) -> None:
+        """A cached bitmap of a widget drawn over earlier ink would carry that ink along"""
+        for i, widget in enumerate(widgets):
+            rect = widget.rect()
+            widget.cacheable = True
+            for earlier in widgets[:i]:
+                if earlier.overlaps(rect):
+                    widget.cacheable = False
+                    break
+
+    def draw_full(self, widgets) -> None:
+        badge.display.fill(1)
+        for widget in widgets:
+            widget.draw(self.cache)
+
+    def draw_changes(self, widgets) -> bool:
+        """Clear and redraw only the rectangles whose widgets changed"""
+        old_keys = set(widget.key for widget in self.widgets)
+        new_keys = set(widget.key for widget in widgets)
+        dirty = set(w.rect() for w in self.widgets if w.key not in new_keys)
+        dirty.update(w.rect() for w in widgets if w.key not in old_keys)
+        if not dirty:
+            return False
+
+        for x, y, w, h in dirty:
+            badge.display.fill_rect(x, y, w, h, 1)
+        # anything overlapping a cleared band lost pixels and has to be drawn again
+        for widget in widgets:
+            for rect in dirty:
+                if widget.overlaps(rect):
+                    widget.draw(self.cache)
+                    break
+        self.frames_partial += 1
+        return True
+
+    def stats(self):
+        """Frame counters for the debug log"""
+        return {
+            "drawn": self.frames_drawn,
+            "partial": self.frames_partial,
+            "skipped": self.frames_skipped,
+        }
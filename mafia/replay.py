@@ -0,0 +1,290 @@
+import struct
+
+import journal
+from player import NIGHT, PAUSED
+
+#file: [MAGIC][VERSION] then events, then the round index once the game is over
+#event: [kind][ms since the previous event, varint][fields], every field a varint or [length varint][bytes]
+#index: [count varint] then (round, offset, ms since the game started) varints, then [index offset u32][INDEX_MAGIC]
+MAGIC = b"MRP"
+VERSION = 1
+HEADER_SIZE = 4
+INDEX_MAGIC = b"RIDX"
+TRAILER_SIZE = 8
+
+E_GAME = 0    # game id, term of the host that recorded it
+E_JOIN = 1    # slot, radio address, name
+E_ROLES = 2   # one role byte per slot
+E_STAGE = 3   # stage, detail as in PHASE (winning team when over, eliminated slot at resolution)
+E_VOTE = 4    # voter slot, target slot (NO_SLOT retracts)
+E_ACTION = 5  # actor slot, target slot
+E_DAWN = 6    # victim slot, outcome flags
+E_LINK = 7    # host's transport so far: frames sent, retransmits, gave up, duplicates, messages received, after night, resolution and over
+E_HOST = 8    # term, host slot, a successor took over and kept recording
+E_OUT = 9     # slot, already dead when a successor started recording
+
+#kind -> its fields, v = varint, b = length-prefixed bytes, s = length-prefixed utf-8
+FIELDS = {
+    E_GAME: "vv",
+    E_JOIN: "vvs",
+    E_ROLES: "b",
+    E_STAGE: "vv",
+    E_VOTE: "vv",
+    E_ACTION: "vv",
+    E_DAWN: "vv",
+    E_LINK: "vvvvv",
+    E_HOST: "vv",
+    E_OUT: "v",
+}
+
+FLUSH_BYTES = 512  # nothing reads a replay until a collector asks or the game is over, so writes can wait for this much
+CHUNK = 96  # replay bytes per REPLAY message, fits a frame with its header and ack
+BURST = 8  # REPLAY messages sent per REPLAY_REQ, half the transport window
+FETCH_TIMEOUT = 3.0  # seconds without a chunk before a collector asks again
+
+
+def put_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def starts_round(previous: int, stage: int) -> bool:
+    """Every night starts a round, except picking one back up after a pause"""
+    return stage == NIGHT and previous != PAUSED
+
+
+def get_varint(buf, offset: int):
+    """(value, offset after it)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Recorder:
+    """The host's record of one game, appended to flash as it happens"""
+    def __init__(self, name: str = "replay.bin"):
+        self.directory = journal.JOURNAL_DIR
+        self.path = f"{self.directory}/{name}"
+        self.active = False
+        self.pending = bytearray()
+        self.size = 0  # bytes on flash and pending, the next event's offset
+        self.start_ms = 0
+        self.last_ms = 0
+        self.round = 0
+        self.stage = None  # last stage recorded
+        self.index = []  # (round, offset, ms) of every night
+
+    def start(self, game: int, term: int, now: float) -> None:
+        """A new replay file, the last game's is overwritten"""
+        self.active = True
+        self.pending = bytearray(MAGIC)
+        self.pending.append(VERSION)
+        self.size = HEADER_SIZE
+        self.start_ms = self.last_ms = int(now * 1000)
+        self.round = 0
+        self.stage = None
+        self.index = []
+        with open(self.path, "wb"):
+            pass
+        self.event(E_GAME, now, game, term)
+
+    def event(self, kind: int, now: float, *fields) -> None:
+        if not self.active:
+            return
+        ms = int(now * 1000)
+        out = self.pending
+        before = len(out)
+        if kind == E_STAGE:
+            if starts_round(self.stage, fields[0]):
+                self.round += 1
+                self.index.append((self.round, self.size, ms - self.start_ms))
+            self.stage = fields[0]
+        out.append(kind)
+        put_varint(out, max(0, ms - self.last_ms))
+        self.last_ms = ms
+        for code, value in zip(FIELDS[kind], fields):
+            if code == "v":
+                put_varint(out, value)
+            else:
+                if code == "s":
+                    value = value.encode()
+                put_varint(out, len(value))
+                out.extend(value)
+        self.size += len(out) - before
+
+    def flush(self, force: bool = False) -> None:
+        """Append what's waiting, flash is only touched once FLUSH_BYTES have piled up"""
+        if not self.pending or not (force or len(self.pending) >= FLUSH_BYTES):
+            return
+        with open(self.path, "ab") as f:
+            f.write(self.pending)
+        self.pending = bytearray()
+
+    def finish(self) -> None:
+        """Write the round index and stop, the file is complete from here on"""
+        if not self.active:
+            return
+        trailer = bytearray()
+        put_varint(trailer, len(self.index))
+        for entry in self.index:
+            for value in entry:
+                put_varint(trailer, value)
+        trailer.extend(struct.pack("<I", self.size))
+        trailer.extend(INDEX_MAGIC)
+        self.pending.extend(trailer)
+        self.size += len(trailer)
+        self.flush(True)
+        self.active = False
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Part of the file for a collector, whatever is still pending goes to flash first"""
+        self.flush(True)
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                return f.read(size)
+        except OSError:
+            return b""
+
+    def length(self) -> int:
+        """Size of the replay on flash, it may be a finished game from before a reboot"""
+        self.flush(True)
+        try:
+            with open(self.path, "rb") as f:
+                return f.seek(0, 2)
+        except OSError:
+            return 0
+
+
+def check(buf) -> None:
+    if bytes(buf[:3]) != MAGIC or buf[3] != VERSION:
+        raise ValueError("not a replay")
+
+
+def read_index(buf):
+    """[(round, offset, ms)] and where the events end, scanning the events if the game never finished"""
+    check(buf)
+    if len(buf) >= HEADER_SIZE + TRAILER_SIZE and bytes(buf[-4:]) == INDEX_MAGIC:
+        end = struct.unpack_from("<I", buf, len(buf) - TRAILER_SIZE)[0]
+        try:
+            count, offset = get_varint(buf, end)
+            index = []
+            for _ in range(count):
+                entry = []
+                for _ in range(3):
+                    value, offset = get_varint(buf, offset)
+                    entry.append(value)
+                index.append(tuple(entry))
+            return index, end
+        except IndexError:
+            pass  # Not really a trailer, scan for the rounds instead
+    index = []
+    stage = None
+    for offset, kind, ms, fields in read_events(buf):
+        if kind == E_STAGE:
+            if starts_round(stage, fields[0]):
+                index.append((len(index) + 1, offset, ms))
+            stage = fields[0]
+    return index, len(buf)
+
+
+def read_events(buf, offset: int = HEADER_SIZE, end: int = None, ms: int = 0):
+    """(offset, kind, ms since the start, fields) for every event, a torn last one is dropped
+
+    To start mid-file pass an index entry's offset and ms
+    """
+    if end is None:
+        end = len(buf)
+        if end >= HEADER_SIZE + TRAILER_SIZE and bytes(buf[-4:]) == INDEX_MAGIC:
+            end = struct.unpack_from("<I", buf, end - TRAILER_SIZE)[0]
+    first = offset != HEADER_SIZE
+    while offset < end:
+        start = offset
+        try:
+            kind = buf[offset]
+            delta, offset = get_varint(buf, offset + 1)
+            fields = []
+            for code in FIELDS[kind]:
+                value, offset = get_varint(buf, offset)
+                if code != "v":
+                    if offset + value > end:
+                        return
+                    value = bytes(buf[offset:offset + value])
+                    offset += len(value)
+                    if code == "s":
+                        value = value.decode()
+                fields.append(value)
+        except (IndexError, KeyError, UnicodeError):
+            return
+        if offset > end:
+            return
+        if not first:
+            ms += delta
+        first = False
+        yield start, kind, ms, fields
+
+
+def read_round(buf, number: int):
+    """Events from the night that starts round number up to the next one, found through the index"""
+    index, end = read_index(buf)
+    for position, (round_number, offset, ms) in enumerate(index):
+        if round_number == number:
+            stop = index[position + 1][1] if position + 1 < len(index) else end
+            return read_events(buf, offset, stop, ms)
+    return iter(())
+
+
+class Fetch:
+    """A collector's copy of another badge's replay, written to flash as REPLAY messages arrive"""
+    def __init__(self, source: int, now: float, directory: str = None):
+        self.source = source
+        self.path = f"{directory or journal.JOURNAL_DIR}/replay-{source}.bin"
+        self.received = 0
+        self.total = None  # file size, once the first chunk says
+        self.asked = 0  # offset of the last REPLAY_REQ
+        self.early = {}  # offset -> chunk that overtook a retransmitted one
+        self.last_heard = now
+        with open(self.path, "wb"):
+            pass
+
+    @property
+    def done(self) -> bool:
+        return self.total is not None and self.received >= self.total
+
+    def take(self, offset: int, total: int, chunk, now: float):
+        """Store one REPLAY, returns the offset to ask for next or None if the burst isn't over yet"""
+        self.last_heard = now
+        self.total = total
+        if offset > self.received:
+            self.early[offset] = bytes(chunk)
+            return None
+        if offset < self.received:
+            return None  # Already have it
+        with open(self.path, "ab") as f:
+            f.write(chunk)
+            self.received += len(chunk)
+            while self.received in self.early:
+                chunk = self.early.pop(self.received)
+                f.write(chunk)
+                self.received += len(chunk)
+        if self.done or self.received < self.asked + CHUNK * BURST:
+            return None
+        self.asked = self.received
+        return self.received
+
+    def stalled(self, now: float) -> bool:
+        """Chunks stopped coming before the end, the caller asks again from what we have"""
+        if self.done or now - self.last_heard < FETCH_TIMEOUT:
+            return False
+        self.last_heard = now
+        self.asked = self.received
+        self.early = {}
+        return True
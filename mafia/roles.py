@@ -0,0 +1,56 @@
+import random
+
+from player import VILLAGER, KRAKEN, COP, ORGANIZER
+
+#(role, share of the lobby, minimum, maximum), whoever is left over is a Villager
+DEFAULT_CONFIG = (
+    (KRAKEN, 0.15, 1, 16),  # what sim/balance.py --sweep --strategy informed finds closest to even
+    (ORGANIZER, 0.1, 1, 4),
+    (COP, 0.08, 0, 3),
+)
+
+
+class Rng():
+    """xorshift32, the same seed deals the same roles on the badge and on a desktop"""
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.state = (seed & 0xFFFFFFFF) or 0x9E3779B9
+
+    def below(self, n: int) -> int:
+        x = self.state
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.state = x
+        return x % n
+
+
+def role_counts(players: int, config=DEFAULT_CONFIG):
+    """How many of each role a lobby gets, [(role, count)] with Villagers last"""
+    counts = []
+    seats = players
+    for role, share, minimum, maximum in config:
+        count = min(max(int(players * share + 0.5), minimum), maximum, seats)
+        if role == KRAKEN:
+            # Krakens have to start outnumbered or the game is over before it begins
+            count = min(count, (players - 1) // 2)
+        counts.append((role, count))
+        seats -= count
+    counts.append((VILLAGER, seats))
+    return counts
+
+
+def deal(roles: bytearray, players: int, counts, rng: Rng) -> None:
+    """Deal every seat in one pass, each role is picked with weight = copies left in the deck"""
+    left = [count for _, count in counts]
+    remaining = players
+    for slot in range(players):
+        pick = rng.below(remaining)
+        i = 0
+        while pick >= left[i]:
+            pick -= left[i]
+            i += 1
+        left[i] -= 1
+        roles[slot] = counts[i][0]
+        remaining -= 1
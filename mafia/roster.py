@@ -0,0 +1,96 @@
+import array
+
+import protocol
+from player import UNASSIGNED
+
+MAX_PLAYERS = protocol.NO_SLOT  # slots are one byte and 0xFF means nobody
+
+
+class Roster:
+    """Every player as parallel arrays indexed by slot, sized once so nothing is allocated per player"""
+    def __init__(self, capacity: int = MAX_PLAYERS):
+        self.capacity = capacity
+        self.count = 0
+        self.names = [None] * capacity
+        self.ids = array.array("H", bytes(2 * capacity))  # radio address, 0 if unknown
+        self.roles = bytearray(capacity)
+        self.votes = bytearray(b"\xff" * capacity)  # target slot, NO_SLOT for no vote
+        self.alive_bits = bytearray((capacity + 7) // 8)  # bit per slot, a bytearray so it never becomes a bigint
+        self.alive_count = 0
+        self.by_name = {}  # name -> slot
+        self.by_id = {}  # radio address -> slot
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        for slot in range(self.count):
+            self.names[slot] = None
+            self.ids[slot] = 0
+            self.roles[slot] = UNASSIGNED
+            self.votes[slot] = protocol.NO_SLOT
+        for i in range(len(self.alive_bits)):
+            self.alive_bits[i] = 0
+        self.count = 0
+        self.alive_count = 0
+        self.by_name.clear()
+        self.by_id.clear()
+
+    def add(self, name: str, address: int = 0) -> int:
+        """Add a living player, returns their slot or -1 if the roster is full"""
+        if self.count >= self.capacity:
+            return -1
+        slot = self.count
+        self.count += 1
+        self.names[slot] = name
+        self.by_name[name] = slot
+        self.set_id(slot, address)
+        self.set_alive(slot, True)
+        return slot
+
+    def set_id(self, slot: int, address: int) -> None:
+        self.ids[slot] = address
+        if address:
+            self.by_id[address] = slot
+
+    def slot_of(self, name: str) -> int:
+        return self.by_name.get(name, -1)
+
+    def slot_for(self, address: int) -> int:
+        return self.by_id.get(address, -1)
+
+    def free_name(self, name: str) -> str:
+        """name, or name with a number after it if another player already has it"""
+        if name not in self.by_name:
+            return name
+        number = 2
+        while f"{name} {number}" in self.by_name:
+            number += 1
+        return f"{name} {number}"
+
+    def is_alive(self, slot: int) -> bool:
+        return bool(self.alive_bits[slot >> 3] & (1 << (slot & 7)))
+
+    def set_alive(self, slot: int, alive: bool) -> bool:
+        """Returns whether anything changed"""
+        if self.is_alive(slot) == alive:
+            return False
+        bit = 1 << (slot & 7)
+        if alive:
+            self.alive_bits[slot >> 3] |= bit
+            self.alive_count += 1
+        else:
+            self.alive_bits[slot >> 3] &= ~bit & 0xFF
+            self.alive_count -= 1
+        return True
+
+    def count_role(self, role: int, alive_only: bool = True) -> int:
+        total = 0
+        for slot in range(self.count):
+            if self.roles[slot] == role and (not alive_only or self.is_alive(slot)):
+                total += 1
+        return total
+
+    def clear_roles(self) -> None:
+        for slot in range(self.count):
+            self.roles[slot] = UNASSIGNED
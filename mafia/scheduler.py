@@ -0,0 +1,91 @@
+import stats
+
+#task priorities, lower runs first
+RX = 0  # packets that came in since the last frame
+INPUT = 1  # button events
+TIMERS = 2  # phase deadlines, host broadcasts, failover watch, journal
+TX = 3  # coalesced frames and queued packets out to the radio
+RENDER = 4  # the panel, last so nothing above waits on a refresh
+
+IDLE = -1  # yield this to sleep until wake()
+FRAME_BUDGET_MS = 40  # once a frame has run this long, preemptible tasks wait for the next one
+
+
+class Task():
+    """A generator stepped by the Scheduler
+
+    It yields None to give way to anything more urgent and carry on this frame,
+    a number of seconds to sleep (0 is the next frame), or IDLE to sleep until woken
+    """
+    def __init__(self, name: str, gen, priority: int, preemptible: bool = False):
+        self.name = name
+        self.gen = gen
+        self.priority = priority
+        self.preemptible = preemptible  # skipped for the rest of a frame that ran over FRAME_BUDGET_MS
+        self.wake_at = 0.0  # None while IDLE
+        self.frame = -1  # last frame it slept in, it doesn't run again until the next one
+        self.woken = False  # wake() came while it was running, so it mustn't go IDLE
+        self.steps = 0
+
+
+class Scheduler():
+    """Cooperative round of tasks once per App.loop, highest priority first"""
+    def __init__(self):
+        self.tasks = []  # kept sorted by priority
+        self.frame = 0
+        self.overruns = 0  # frames that ran out of budget before every task had a turn
+
+    def add(self, name: str, gen, priority: int, preemptible: bool = False) -> Task:
+        task = Task(name, gen, priority, preemptible)
+        self.tasks.append(task)
+        self.tasks.sort(key=lambda t: t.priority)
+        return task
+
+    def wake(self, task: Task) -> None:
+        """Make a task runnable now, even if it already had its turn this frame"""
+        task.wake_at = 0.0
+        task.frame = -1
+        task.woken = True
+
+    def ready(self, task: Task, now: float) -> bool:
+        return task.wake_at is not None and task.wake_at <= now and task.frame != self.frame
+
+    def run(self, now: float) -> int:
+        """One frame: keep stepping the most urgent ready task until none is left, returns the steps taken"""
+        frame = self.frame = self.frame + 1
+        start = stats.ticks_us()
+        over = False
+        steps = 0
+        while True:
+            task = None
+            for candidate in self.tasks:
+                # ready() inlined, this runs a few times every frame
+                wake_at = candidate.wake_at
+                if wake_at is not None and wake_at <= now and candidate.frame != frame and not (over and candidate.preemptible):
+                    task = candidate
+                    break
+            if task is None:
+                return steps
+            self.step(task, now)
+            steps += 1
+            if not over and stats.ticks_diff(stats.ticks_us(), start) >= FRAME_BUDGET_MS * 1000:
+                over = True
+                self.overruns += 1
+
+    def step(self, task: Task, now: float) -> None:
+        task.steps += 1
+        task.woken = False
+        delay = next(task.gen)
+        if delay is None:
+            return  # Gave way, it picks up again once nothing more urgent is ready
+        if delay == IDLE:
+            if task.woken:
+                return  # Work came in while it was finishing, run it again
+            task.wake_at = None
+        else:
+            task.wake_at = now + delay
+        task.frame = self.frame
+
+    def stats(self):
+        """Steps per task for the debug log"""
+        return dict((task.name, task.steps) for task in self.tasks)
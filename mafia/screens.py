@@ -0,0 +1,197 @@
+import badge
+import night
+import protocol
+from player import ROLE_NAMES, STAGE_NAMES, UNASSIGNED, KRAKEN, UNSTARTED, WAITING, NIGHT, DAY, VOTING, PAUSED, RESOLUTION, OVER
+from render import ListView
+
+#every screen but the welcome one, loaded the first time one of them is shown
+#render functions take the App, the renderer calls them through build()
+
+
+#host screen
+HOST_ACTIONS = {WAITING: "Press SW4 to start", PAUSED: "Press SW4 to resume", OVER: "Press SW4 to play again"}
+
+
+def render_host(app) -> None:
+    app.renderer.text("Hosting Game!", 0, 0, font=32)
+    app.renderer.text(f"Players: {len(app.game.roster)}", 0, 32, font=24)
+    app.renderer.text(HOST_ACTIONS.get(app.game.stage, "Press SW4 to pause"), 0, 64, font=18)
+    app.renderer.text("Press SW11 for details", 0, 88, font=18)
+
+    app.lists["host"].draw(app.renderer, len(app.game.roster), lambda slot: player_row(app, slot))
+
+
+def player_row(app, slot: int) -> str:
+    """One list row: alive or dead, name, and a star once they've voted"""
+    roster = app.game.roster
+    state = "•" if roster.is_alive(slot) else "x"
+    voted = " *" if roster.votes[slot] != protocol.NO_SLOT else ""
+    return f"{state} {roster.names[slot]}{voted}"
+
+
+#games nearby
+def render_games(app) -> None:
+    count = len(app.lobbies)
+    lst = app.lists["games"]
+    app.renderer.text("Games nearby", 0, 0, font=24)
+    if not count:
+        app.renderer.text("Listening for\nhosts...", 0, 48, font=24)
+        return
+    if count > lst.rows:
+        app.renderer.text(lst.label(count), 0, 24, font=16)
+    lst.draw(app.renderer, count, lambda index: lobby_row(app, index))
+    app.renderer.text("SW4 join", 0, 182, font=16)
+
+
+def lobby_row(app, index: int) -> str:
+    lobby = app.lobbies[index]
+    joined = " *" if lobby.game == app.game_id else ""
+    return f"{lobby.row()}{joined}"
+
+
+#get players to join
+def render_join(app) -> None:
+    app.renderer.text("Welcome to\nMafia!", 0, 0, font=32)
+    app.renderer.text("Press SW4 to\nstart hosting", 0, 64, font=24)
+
+
+#render game details
+def render_dets(app) -> None:
+    app.renderer.text("Game Details", 0, 0, font=32)
+
+    if app.personal_player.role == UNASSIGNED:
+        app.renderer.text("Role: Not assigned", 0, 32, font=24)
+    else:
+        name = ROLE_NAMES[app.personal_player.role]
+        app.renderer.text(f"Role: {name}", 0, 32, font=24 if len(name) < 10 else 16)
+
+    app.renderer.text(f"Stage: {STAGE_NAMES[app.game.stage]}", 0, 56, font=24)
+    app.renderer.text(f"Players: {len(app.game.roster)}", 0, 80, font=24)
+    if app.team:
+        names = app.game.roster.names
+        app.renderer.text("Krakens: " + ", ".join(names[slot] or "?" for slot in app.team if slot != app.slot), 0, 104, font=16)
+    else:
+        app.renderer.text("Press Right for lobby", 0, 104, font=24)
+    app.lists["dets"].draw(app.renderer, len(app.game.roster), lambda slot: player_row(app, slot))
+
+
+#pick a player to vote for or act on at night
+def render_pick(app) -> None:
+    stage = app.game.stage
+    count = len(app.game.roster)
+    lst = app.lists["pick"]
+    if stage == NIGHT and app.personal_player.role in night.NIGHT_ROLES:
+        app.renderer.text("Pick a target", 0, 0, font=24)
+    elif stage == VOTING:
+        app.renderer.text("Vote to eliminate", 0, 0, font=24)
+    else:
+        app.renderer.text("Players", 0, 0, font=24)
+    if count > lst.rows:
+        app.renderer.text(lst.label(count), 0, 24, font=16)
+    lst.draw(app.renderer, count, lambda slot: player_row(app, slot))
+    app.renderer.text("SW4 pick, hold to page", 0, 182, font=16)
+
+
+#get game lobby
+def render_lobby(app) -> None:
+    stage = app.game.stage
+    if stage == UNSTARTED:
+        app.renderer.text("Waiting for\nhost to start\nthe game...", 0, 0, font=32)
+    elif stage == WAITING:
+        app.renderer.text("Waiting for\nplayers to\njoin...", 0, 0, font=32)
+    elif stage == NIGHT:
+        app.renderer.text("Night phase", 0, 0, font=32)
+        app.renderer.text("Please wait...", 0, 32, font=24)
+    elif stage == DAY:
+        app.renderer.text("Day phase", 0, 0, font=32)
+        app.renderer.text("Discuss and vote!", 0, 32, font=24)
+        if app.dawn:
+            render_dawn(app, 96)
+    elif stage == VOTING:
+        app.renderer.text("Voting phase", 0, 0, font=32)
+        app.renderer.text("Choose who to eliminate", 0, 32, font=24)
+    elif stage == RESOLUTION:
+        app.renderer.text("Votes are in", 0, 0, font=32)
+        if app.countdown[0] == RESOLUTION:  # Otherwise the result hasn't reached us yet
+            eliminated = app.countdown[2]
+            if eliminated < len(app.game.roster):
+                app.renderer.text(f"{app.game.roster.names[eliminated]} is out", 0, 32, font=24)
+            else:
+                app.renderer.text("Tie, nobody leaves", 0, 32, font=24)
+    elif stage == OVER:
+        app.renderer.text("Game over", 0, 0, font=32)
+        if app.countdown[0] == OVER:
+            app.renderer.text("Krakens win!" if app.countdown[2] == KRAKEN else "Villagers win!", 0, 32, font=24)
+    else:
+        app.renderer.text(f"Game status:\n{STAGE_NAMES[stage]}", 0, 0, font=32)
+
+    app.renderer.text("Press Home to return", 0, 64, font=24)
+    left = app.seconds_left(badge.time.monotonic())
+    if left is not None:
+        left = int(left)
+        app.renderer.text(f"{left // 60}:{left % 60:02d} left", 0, 176, font=18)
+
+
+def render_dawn(app, y: int) -> None:
+    victim, outcome, watched, visited = app.dawn
+    names = app.game.roster.names
+    if victim == app.slot and outcome & night.KILLED:
+        app.renderer.text("The Kraken took you", 0, y, font=18)
+    elif outcome & night.KILLED:
+        app.renderer.text(f"{names[victim]} was taken", 0, y, font=18)
+    elif outcome & night.SAVED:
+        app.renderer.text(f"{names[victim]} was saved", 0, y, font=18)
+    if watched != protocol.NO_SLOT:
+        if visited == protocol.NO_SLOT:
+            app.renderer.text(f"{names[watched]} stayed home", 0, y + 24, font=18)
+        else:
+            app.renderer.text(f"{names[watched]} visited {names[visited]}", 0, y + 24, font=18)
+
+
+#live numbers from stats.py, SW11+SW12 gets here
+def render_debug(app) -> None:
+    numbers = app.stats
+    frames = numbers.frame_ms
+    app.renderer.text("Debug", 0, 0, font=24)
+    app.renderer.text(f"frame {frames.percentile(50)}/{frames.percentile(95)}/{frames.max}ms", 0, 28, font=16)
+    app.renderer.text(f"slow {numbers.slow_frames}/{numbers.frames} ~{app.meter.mean_ma(app.game.stage):.0f}mA", 0, 48, font=16)
+    worst = None
+    for screen, histogram in numbers.render_ms.items():
+        if worst is None or histogram.max > numbers.render_ms[worst].max:
+            worst = screen
+    if worst is not None:
+        app.renderer.text(f"render {numbers.render_ms[worst].max}ms {worst}", 0, 68, font=16)
+    app.renderer.text(f"in {sum(numbers.packets_in)} out {sum(numbers.packets_out)} air {numbers.radio_out}", 0, 88, font=16)
+    busiest = " ".join(f"{op:02x}:{count}" for op, count in numbers.busiest(numbers.packets_in))
+    app.renderer.text(f"top {busiest}", 0, 108, font=16)
+    app.renderer.text(f"errors {numbers.decode_errors} full {numbers.rx_overflow} foreign {app.foreign}", 0, 128, font=16)
+    heap = "?" if numbers.heap_free is None else f"{numbers.heap_free // 1024}k"
+    fetch = app.fetch or app.fetched
+    if fetch is None:
+        copied = "-"
+    elif fetch.total:
+        copied = f"{fetch.received * 100 // fetch.total}%"
+    else:
+        copied = "none" if fetch.total == 0 else "..."
+    app.renderer.text(f"heap {heap} replay {copied}", 0, 148, font=16)
+    app.renderer.text(f"SW4 stats ({len(app.collected)}) SW12 replay", 0, 176, font=16)
+
+
+#name -> (render, state topics it reads, (rows, y, selectable) of its list or None)
+SCREENS = {
+    "host": (render_host, ("players", "votes", "stage", "list"), (4, 120, False)),
+    "games": (render_games, ("lobbies", "list"), (6, 40, True)),
+    "dets": (render_dets, ("players", "votes", "stage", "role", "list"), (3, 128, False)),
+    "lobby": (render_lobby, ("stage", "dawn", "clock"), None),
+    "pick": (render_pick, ("players", "votes", "stage", "role", "list"), (7, 40, True)),
+    "debug": (render_debug, ("stats",), None),
+}
+
+
+def build(app, name: str) -> None:
+    """Register a screen with the app's renderer and give it its list, on the first frame it's shown"""
+    render, topics, layout = SCREENS[name]
+    app.renderer.add_screen(name, lambda: render(app), topics)
+    if layout is not None:
+        rows, y, selectable = layout
+        app.lists[name] = ListView(rows, y, selectable=selectable)
@@ -0,0 +1,169 @@
+import struct
+
+import journal
+import protocol
+from player import UNSTARTED
+from roster import Roster
+
+
+class GameState:
+    """The game as the host sees it, every change bumps seq and queues a delta"""
+    def __init__(self, on_change=None):
+        self.on_change = on_change  # called with a render topic when something changes
+        self.roster = Roster()  # allocated once, reset() only clears it
+        self.journal = None  # the host logs every change here so it can resume after a reboot
+        self.reset()
+
+    def reset(self) -> None:
+        self.seq = 0
+        self.roster.clear()
+        self.stage = UNSTARTED
+        self.pending = []  # packed delta ops not broadcast yet
+        self.pending_seq = 1  # seq of pending[0]
+        self.staging = None  # snapshot being reassembled from SYNC chunks
+        self.in_sync = False  # Any seq is news until the first snapshot, seqs wrap so 0 isn't the oldest
+        self.changed("players")
+        self.changed("stage")
+        self.changed("votes")
+
+    def changed(self, topic: str) -> None:
+        if self.on_change:
+            self.on_change(topic)
+
+    def record(self, op: bytes) -> None:
+        self.seq = (self.seq + 1) & 0xFFFF
+        if not self.pending:
+            self.pending_seq = self.seq
+        self.pending.append(op)
+        if self.journal is not None:
+            self.journal.append(journal.J_OP, op)
+
+    def slot_of(self, name: str) -> int:
+        return self.roster.slot_of(name)
+
+    #host side, each change is applied locally and queued for broadcast
+    def add_player(self, name: str, address: int = 0) -> int:
+        """Add a player, returns their slot or -1 if the lobby is full"""
+        slot = self.roster.add(name, address)
+        if slot >= 0:
+            self.record(protocol.op_join(name))
+            if address and self.journal is not None:
+                self.journal.append(journal.J_ID, struct.pack("<BH", slot, address))
+            self.changed("players")
+        return slot
+
+    def set_stage(self, stage: int) -> None:
+        if stage != self.stage:
+            self.stage = stage
+            self.record(protocol.op_stage(stage))
+            self.changed("stage")
+
+    def set_alive(self, slot: int, alive: bool) -> None:
+        if self.roster.set_alive(slot, alive):
+            self.record(protocol.op_alive(slot, alive))
+            self.changed("players")
+
+    def set_vote(self, voter: int, target: int) -> None:
+        """Record a vote, NO_SLOT as target retracts it"""
+        if self.roster.votes[voter] == target:
+            return
+        self.roster.votes[voter] = target
+        self.record(protocol.op_vote(voter, target))
+        self.changed("votes")
+
+    def take_deltas(self):
+        """Packets for every change since the last call, several ops per packet"""
+        packets = []
+        first_seq = self.pending_seq
+        ops = []
+        size = protocol.HEADER_SIZE + 3
+        for op in self.pending:
+            if ops and size + len(op) > protocol.MAX_MESSAGE:
+                packets.append(protocol.delta(first_seq, ops))
+                first_seq = (first_seq + len(ops)) & 0xFFFF
+                ops = []
+                size = protocol.HEADER_SIZE + 3
+            ops.append(op)
+            size += len(op)
+        if ops:
+            packets.append(protocol.delta(first_seq, ops))
+        self.pending = []
+        return packets
+
+    def snapshot(self):
+        """Full state packets for late joiners and clients that fell behind"""
+        return protocol.sync(self.seq, self.stage, self.roster)
+
+    #client side
+    def apply_delta(self, buf) -> bool:
+        """Apply the ops we have not seen yet, returns False if some were missed"""
+        first_seq, count, offset = protocol.read_delta(buf)
+        if not self.in_sync or protocol.newer_seq(first_seq, (self.seq + 1) & 0xFFFF):
+            self.in_sync = False
+            return False
+        for i in range(count):
+            if (first_seq + i - self.seq) & 0xFFFF == 1:
+                offset = self.apply_op(buf, offset)
+                self.seq = (self.seq + 1) & 0xFFFF
+            else:
+                offset = protocol.op_end(buf, offset)  # Already have it
+            if offset < 0:
+                # Unknown op, we can't tell how long it is
+                self.in_sync = False
+                return False
+        return True
+
+    def replay(self, op) -> None:
+        """Re-apply an op from the journal, it was broadcast when it first happened"""
+        if self.apply_op(op, 0) >= 0:
+            self.seq = (self.seq + 1) & 0xFFFF
+
+    def apply_op(self, buf, offset: int) -> int:
+        """Apply one delta op, returns the offset after it or -1 if the op is unknown"""
+        kind = buf[offset]
+        if kind == protocol.D_JOIN:
+            name, offset = protocol.unpack_name(buf, offset + 1)
+            self.roster.add(name)
+            self.changed("players")
+            return offset
+        if kind == protocol.D_STAGE:
+            self.stage = buf[offset + 1]
+            self.changed("stage")
+        elif kind == protocol.D_ALIVE:
+            self.roster.set_alive(buf[offset + 1], bool(buf[offset + 2]))
+            self.changed("players")
+        elif kind == protocol.D_VOTE:
+            self.roster.votes[buf[offset + 1]] = buf[offset + 2]
+            self.changed("votes")
+        else:
+            return -1
+        return protocol.op_end(buf, offset)
+
+    def apply_snapshot(self, buf) -> bool:
+        """Apply one SYNC chunk, returns True once a whole snapshot has been adopted"""
+        seq, stage, total, first, entries = protocol.read_sync(buf)
+        if first == 0:
+            self.staging = (seq, [])
+        if self.staging is None or self.staging[0] != seq or len(self.staging[1]) != first:
+            return False
+        self.staging[1].extend(entries)
+        if len(self.staging[1]) < total:
+            return False
+
+        entries = self.staging[1]
+        self.staging = None
+        if self.in_sync and not protocol.newer_seq(seq, self.seq):
+            return False  # Deltas already got us here, or a newer snapshot overtook this one in the rx queue
+        roster = self.roster
+        roster.clear()
+        for name, alive, vote_target in entries:
+            slot = roster.add(name)
+            roster.set_alive(slot, alive)
+            roster.votes[slot] = vote_target
+        self.stage = stage
+        self.seq = seq
+        self.in_sync = True
+        self.changed("players")
+        self.changed("stage")
+        self.changed("votes")
+        return True
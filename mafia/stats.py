@@ -0,0 +1,150 @@
+import array
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    # Desktop Python, the sim and the bench
+    from time import perf_counter
+
+    def ticks_us() -> int:
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a: int, b: int) -> int:
+        return a - b
+
+try:
+    from gc import mem_free
+except ImportError:
+    mem_free = None  # Only MicroPython can say how much heap is left
+
+#log levels, lower is chattier
+DEBUG = 10
+INFO = 20
+ERROR = 40
+
+FRAME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)  # ms, upper bounds, anything slower lands in one more bucket
+SLOW_FRAME_MS = 100  # a frame this long shows as a stutter
+DECAY_INTERVAL = 10.0  # seconds between halving the histograms, so they show the last minute or so
+UNKNOWN = 0xFFFFFFFF  # exported in place of a number we can't measure here
+
+#counters and summaries sent in a STATS report, in order
+EXPORT_FIELDS = ("frames", "slow_frames", "frame_p50", "frame_p95", "frame_max", "render_max",
+                 "packets_in", "packets_out", "decode_errors", "foreign", "heap_free", "rx_overflow")
+
+
+class Log():
+    """Level-gated logging, a message is only formatted if it will be written"""
+    def __init__(self, logger, level: int = INFO):
+        self.logger = logger
+        self.level = level
+
+    def debug(self, message: str, *args) -> None:
+        if self.level <= DEBUG:
+            self.logger.debug(message % args if args else message)
+
+    def info(self, message: str, *args) -> None:
+        if self.level <= INFO:
+            self.logger.info(message % args if args else message)
+
+    def error(self, message: str, *args) -> None:
+        if self.level <= ERROR:
+            self.logger.error(message % args if args else message)
+
+
+class Histogram():
+    """Counts per bucket of FRAME_BUCKETS, halved every DECAY_INTERVAL so old frames fade out"""
+    def __init__(self, bounds=FRAME_BUCKETS):
+        self.bounds = bounds
+        self.counts = array.array("I", bytes(4 * (len(bounds) + 1)))
+        self.max = 0  # worst recent value, halved along with the counts
+
+    def add(self, value: int) -> None:
+        bucket = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            bucket += 1
+        self.counts[bucket] += 1
+        if value > self.max:
+            self.max = value
+
+    def decay(self) -> None:
+        for i in range(len(self.counts)):
+            self.counts[i] >>= 1
+        self.max >>= 1
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, p: int) -> int:
+        """Upper bound of the bucket holding the p-th percentile, 0 if nothing was added"""
+        total = self.total()
+        if not total:
+            return 0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen * 100 >= total * p:
+                return self.bounds[bucket] if bucket < len(self.bounds) else self.max
+        return self.max
+
+
+class Stats():
+    """Counters and histograms for the hot paths, cheap enough to leave on at an event"""
+    def __init__(self):
+        self.frames = 0
+        self.slow_frames = 0
+        self.frame_ms = Histogram()
+        self.render_ms = {}  # screen name -> Histogram of frames that touched the panel
+        self.packets_in = array.array("I", bytes(4 * 256))  # messages received per opcode
+        self.packets_out = array.array("I", bytes(4 * 256))  # messages sent per opcode
+        self.radio_out = 0  # packets on the air after coalescing
+        self.decode_errors = 0
+        self.rx_overflow = 0  # packets dropped because the rx queue was full
+        self.heap_free = None
+        self.last_decay = None
+        self.frame_start = 0
+
+    def start_frame(self) -> None:
+        self.frame_start = ticks_us()
+
+    def end_frame(self) -> int:
+        """Close the frame started by start_frame(), returns its length in ms"""
+        ms = ticks_diff(ticks_us(), self.frame_start) // 1000
+        self.frames += 1
+        self.frame_ms.add(ms)
+        if ms >= SLOW_FRAME_MS:
+            self.slow_frames += 1
+        return ms
+
+    def rendered(self, screen: str, us: int) -> None:
+        histogram = self.render_ms.get(screen)
+        if histogram is None:
+            histogram = self.render_ms[screen] = Histogram()
+        histogram.add(us // 1000)
+
+    def tick(self, now: float) -> None:
+        """Once a second: sample the heap and let the histograms forget old frames"""
+        if mem_free is not None:
+            self.heap_free = mem_free()
+        if self.last_decay is None:
+            self.last_decay = now
+        elif now - self.last_decay >= DECAY_INTERVAL:
+            self.last_decay = now
+            self.frame_ms.decay()
+            for histogram in self.render_ms.values():
+                histogram.decay()
+
+    def render_max(self) -> int:
+        return max([h.max for h in self.render_ms.values()] or [0])
+
+    def export(self, foreign: int = 0):
+        """Values for EXPORT_FIELDS"""
+        return (self.frames, self.slow_frames, self.frame_ms.percentile(50), self.frame_ms.percentile(95),
+                self.frame_ms.max, self.render_max(), sum(self.packets_in), sum(self.packets_out),
+                self.decode_errors, foreign, UNKNOWN if self.heap_free is None else self.heap_free, self.rx_overflow)
+
+    def busiest(self, counts, n: int = 3):
+        """The n opcodes with the most messages, [(opcode, count)]"""
+        top = sorted(((count, op) for op, count in enumerate(counts) if count), reverse=True)[:n]
+        return [(op, count) for count, op in top]
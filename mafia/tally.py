@@ -0,0 +1,89 @@
+class VoteTally:
+    """Vote counts that keep the current leader up to date on every change"""
+    def __init__(self):
+        self.votes = {}  # voter -> target
+        self.counts = {}  # target -> number of votes
+        self.buckets = {}  # number of votes -> set of targets with that many
+        self.top = 0  # highest number of votes any target has
+        self.changes = 0  # bumped on every move, so anything derived from the counts knows when it's stale
+
+    def move(self, target, step: int) -> None:
+        """Shift one target up or down a single vote, O(1)"""
+        old = self.counts.get(target, 0)
+        new = old + step
+        self.changes += 1
+        if old:
+            bucket = self.buckets[old]
+            bucket.discard(target)
+            if not bucket:
+                del self.buckets[old]
+        if new:
+            self.counts[target] = new
+            if new in self.buckets:
+                self.buckets[new].add(target)
+            else:
+                self.buckets[new] = {target}
+        else:
+            del self.counts[target]
+
+        if new > self.top:
+            self.top = new
+        elif old == self.top and old not in self.buckets:
+            # The only leader dropped one vote, it still leads with one less
+            self.top = new
+
+    def vote(self, voter, target) -> bool:
+        """Cast or change a vote, returns False if nothing changed"""
+        old = self.votes.get(voter)
+        if old == target:
+            return False
+        if old is not None:
+            self.move(old, -1)
+        self.votes[voter] = target
+        self.move(target, 1)
+        return True
+
+    def retract(self, voter) -> bool:
+        """Take back a vote, returns False if the voter had not voted"""
+        old = self.votes.pop(voter, None)
+        if old is None:
+            return False
+        self.move(old, -1)
+        return True
+
+    def apply(self, ballots) -> int:
+        """Apply a burst of (voter, target) pairs, None as target retracts"""
+        changed = 0
+        for voter, target in ballots:
+            if target is None:
+                changed += self.retract(voter)
+            else:
+                changed += self.vote(voter, target)
+        return changed
+
+    def leaders(self):
+        """Targets tied for the most votes, empty if nobody has been voted for"""
+        return self.buckets.get(self.top, ())
+
+    def tied(self) -> int:
+        """How many targets share the most votes, O(1)"""
+        return len(self.buckets.get(self.top, ()))
+
+    def leader(self):
+        """The one target with the most votes, None on a tie or before anyone voted, O(1)"""
+        if self.tied() != 1:
+            return None
+        return next(iter(self.buckets[self.top]))
+
+    def ranked(self):
+        """(target, votes) pairs from most to fewest votes without sorting"""
+        for count in range(self.top, 0, -1):
+            for target in self.buckets.get(count, ()):
+                yield target, count
+
+    def clear(self) -> None:
+        self.votes.clear()
+        self.counts.clear()
+        self.buckets.clear()
+        self.top = 0
+        self.changes += 1
@@ -0,0 +1,157 @@
+import os
+
+import badge
+from render import DISPLAY_WIDTH, DISPLAY_HEIGHT
+
+try:
+    import framebuf
+except ImportError:
+    framebuf = None  # No framebuffers on this build, every draw goes through nice_text
+
+try:
+    BASE_DIR = __file__.rsplit("/", 1)[0]
+except NameError:
+    BASE_DIR = "."
+TEXT_DIR = BASE_DIR + "/text"  # pre-baked PBMs from sim/bake_text.py
+
+CACHE_BYTES = 12 * 1024  # bitmap RAM the cache may hold
+BACKGROUND = 1
+
+
+def text_id(text: str, font: int) -> str:
+    """Stable name for a string at a font size, FNV-1a so it matches the bake step"""
+    h = 0x811C9DC5
+    for byte in text.encode("utf-8") + bytes((font,)):
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return f"t{h:08x}"
+
+
+class Bitmap():
+    """A 1-bit rasterized string, white is transparent when blitted"""
+    def __init__(self, buf: bytearray, w: int, h: int):
+        self.buf = buf
+        self.w = w
+        self.h = h
+        self.fb = framebuf.FrameBuffer(buf, w, h, framebuf.MONO_HLSB)
+
+
+def load_pbm(path: str):
+    """Read a P4 PBM into a Bitmap, None if it is not there"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Header is "P4", whitespace, width, whitespace, height, one whitespace byte
+    fields = []
+    pos = 0
+    while len(fields) < 3:
+        while data[pos] in b" \t\r\n":
+            pos += 1
+        start = pos
+        while data[pos] not in b" \t\r\n":
+            pos += 1
+        fields.append(data[start:pos])
+    if fields[0] != b"P4":
+        return None
+    w, h = int(fields[1]), int(fields[2])
+    # PBM uses 1 for black, the display uses 0
+    buf = bytearray(b ^ 0xFF for b in data[pos + 1:pos + 1 + ((w + 7) // 8) * h])
+    return Bitmap(buf, w, h)
+
+
+class TextCache:
+    """LRU of rasterized strings keyed by (text, font, x), blitted at any y instead of re-laid out"""
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = {}  # key -> Bitmap, dicts keep insertion order so the first is the oldest
+        self.size = 0
+        self.seen = set()  # keys drawn once, a string is only rasterized the second time
+        self.hits = 0
+        self.misses = 0
+        self.enabled = framebuf is not None and hasattr(badge.display, "blit")
+        self.baked = None  # names in TEXT_DIR, listed on the first miss so a miss never opens a file that isn't there
+
+    def draw(self, text: str, x: int, y: int, font: int, color: int, w: int, h: int) -> None:
+        """Draw a string, (w, h) is the band it may occupy"""
+        if not self.enabled or color != 0:
+            badge.display.nice_text(text, x, y, font=font, color=color)
+            return
+        key = (text, font, x)  # A list row scrolled to another y reuses its bitmap
+        bitmap = self.entries.pop(key, None)
+        if bitmap is not None:
+            self.hits += 1
+            badge.display.blit(bitmap.fb, x, y, BACKGROUND)
+        else:
+            self.misses += 1
+            bitmap = self.load_baked(text, font)
+            if bitmap is not None:
+                badge.display.blit(bitmap.fb, x, y, BACKGROUND)
+            elif key not in self.seen:
+                # One-off strings (counts, names mid-edit) aren't worth rasterizing
+                if len(self.seen) > 64:
+                    self.seen = set()
+                self.seen.add(key)
+                badge.display.nice_text(text, x, y, font=font, color=0)
+                return
+            else:
+                self.seen.discard(key)
+                bitmap = self.rasterize(text, x, y, font, w, h)
+                if bitmap is None:
+                    return
+            self.size += len(bitmap.buf)
+            while self.size > self.max_bytes and self.entries:
+                oldest = next(iter(self.entries))
+                self.size -= len(self.entries.pop(oldest).buf)
+        self.entries[key] = bitmap
+
+    def load_baked(self, text: str, font: int):
+        """The pre-baked bitmap for a string, None if the bake step didn't make one"""
+        if self.baked is None:
+            try:
+                self.baked = set(os.listdir(TEXT_DIR))
+            except OSError:
+                self.baked = set()  # Nothing baked on this badge
+        name = f"{text_id(text, font)}.pbm"
+        if name not in self.baked:
+            return None
+        bitmap = load_pbm(f"{TEXT_DIR}/{name}")
+        if bitmap is None:
+            self.baked.discard(name)  # Unreadable, don't try it again
+        return bitmap
+
+    def rasterize(self, text: str, x: int, y: int, font: int, w: int, h: int):
+        """Let nice_text draw once, then copy the ink back out of the display"""
+        display = badge.display
+        display.nice_text(text, x, y, font=font, color=0)
+        # Glyphs are never wider than the font size, no need to scan the whole band
+        longest = max(len(line) for line in text.split("\n"))
+        w = min(w, longest * font, DISPLAY_WIDTH - x)
+        if w <= 0 or y + h > DISPLAY_HEIGHT:
+            return None  # Clipped, the bitmap would be cut short wherever else it's drawn
+        pixel = display.pixel
+        # Most glyphs are narrower than that, trim the blank right margin so more bitmaps fit
+        while w > 0:
+            for yy in range(h):
+                if pixel(x + w - 1, y + yy) == 0:
+                    break
+            else:
+                w -= 1
+                continue
+            break
+        if w <= 0:
+            return None
+        bitmap = Bitmap(bytearray(b"\xff" * (((w + 7) // 8) * h)), w, h)
+        set_pixel = bitmap.fb.pixel
+        for yy in range(h):
+            for xx in range(w):
+                if pixel(x + xx, y + yy) == 0:
+                    set_pixel(xx, yy, 0)
+        return bitmap
+
+    def clear(self) -> None:
+        self.entries = {}
+        self.size = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.size}
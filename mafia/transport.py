@@ -0,0 +1,237 @@
+import random
+import struct
+
+import protocol
+
+#frame: [version][FRAME][flags][epoch][seq u16] ([ack u16][ack bits u16] if ACK) then ([len][message])*
+#epoch is picked at boot so a restarted badge's seqs aren't mistaken for duplicates
+RELIABLE = 0x01  # receiver has to acknowledge this frame
+ACK = 0x02  # frame carries an acknowledgement for the receiver's frames
+FRAME_HEADER = "<BBBBH"
+FRAME_HEADER_SIZE = 6
+ACK_SIZE = 4
+FRAME_BODY = protocol.MAX_PACKET - FRAME_HEADER_SIZE - ACK_SIZE  # messages with their length bytes that fit a frame
+#protocol.MAX_MESSAGE is FRAME_BODY less a length byte, so every message fits a frame on its own
+
+WINDOW = 16  # frames a peer may have unacknowledged, also the dedup/SACK window
+COALESCE_WINDOW = 0.03  # wait this long for more messages to the same peer
+ACK_DELAY = 0.05  # send a bare ack if nothing is going back within this time
+RETRY_BASE = 0.25  # first retransmission timeout, doubles every try
+RETRY_MAX = 4.0
+MAX_TRIES = 6
+
+
+def newer(a: int, b: int) -> bool:
+    """Whether sequence number a comes after b, allowing for wrap"""
+    return a != b and ((a - b) & 0xFFFF) < 0x8000
+
+
+class Window():
+    """Highest seq seen from one sender plus a bitmap of the WINDOW before it"""
+    def __init__(self):
+        self.top = None
+        self.bits = 0  # bit i set means top - 1 - i was received
+
+    def mark(self, seq: int) -> bool:
+        """Record a frame, returns False if it is a duplicate or too old"""
+        if self.top is None:
+            self.top = seq
+            return True
+        if newer(seq, self.top):
+            shift = (seq - self.top) & 0xFFFF
+            self.bits = ((self.bits << shift) | (1 << (shift - 1))) & 0xFFFF if shift <= WINDOW else 0
+            self.top = seq
+            return True
+        back = (self.top - seq) & 0xFFFF
+        if back == 0 or back > WINDOW:
+            return False
+        bit = 1 << (back - 1)
+        if self.bits & bit:
+            return False
+        self.bits |= bit
+        return True
+
+
+class Pending():
+    """A reliable frame waiting for its ack"""
+    def __init__(self, seq: int, body: bytes, now: float, timeout: float = RETRY_BASE):
+        self.seq = seq
+        self.body = body
+        self.tries = 1
+        self.timeout = timeout
+        self.retry_at = now + jitter(timeout)
+
+
+class Peer():
+    def __init__(self):
+        self.next_seq = 0
+        self.unacked = {}  # seq -> Pending
+        self.outbox = []  # messages waiting to be coalesced into frames, more than one frame's worth if the window is full
+        self.outbox_size = 0
+        self.queued_at = 0.0
+        self.epoch = None  # the peer's boot epoch our windows belong to
+        self.received = Window()  # reliable frames from this peer
+        self.broadcasts = Window()  # broadcast frames from this peer
+        self.ack_due = None  # when we owe this peer an ack
+
+
+def jitter(timeout: float) -> float:
+    """Spread retries out by up to a quarter so peers don't collide again"""
+    return timeout * (0.75 + random.getrandbits(8) / 512)
+
+
+class Transport:
+    """Acks, retries, dedup and coalescing on top of badge.radio.send"""
+    def __init__(self, radio_send, on_give_up=None):
+        self.radio_send = radio_send  # called as radio_send(data, destination)
+        self.on_give_up = on_give_up  # called with the destination of a frame that was never acked
+        self.peers = {}
+        self.epoch = random.getrandbits(8)
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.retransmits = 0
+        self.duplicates = 0
+        self.gave_up = 0
+        self.retry_base = RETRY_BASE  # first retransmission timeout, longer when packets take several hops
+
+    def peer(self, address: int) -> Peer:
+        peer = self.peers.get(address)
+        if peer is None:
+            peer = self.peers[address] = Peer()
+        return peer
+
+    def send(self, message: bytes, destination: int, now: float) -> None:
+        """Queue a message, unicasts are reliable, broadcasts are best effort"""
+        peer = self.peer(destination)
+        if peer.outbox_size + len(message) + 1 > FRAME_BODY:
+            self.flush_peer(destination, peer, now)  # Anything the window doesn't let out waits for the next frame
+        if not peer.outbox:
+            peer.queued_at = now
+        peer.outbox.append(message)
+        peer.outbox_size += len(message) + 1
+
+    def busy(self) -> bool:
+        """Whether anything is waiting to go out, for an ack, or for an ack from us"""
+        for peer in self.peers.values():
+            if peer.outbox or peer.unacked or peer.ack_due is not None:
+                return True
+        return False
+
+    def flush(self, now: float, force: bool = False) -> None:
+        """Send coalesced frames, due retransmissions and owed acks"""
+        for address, peer in self.peers.items():
+            if peer.outbox and (force or now - peer.queued_at >= COALESCE_WINDOW):
+                self.flush_peer(address, peer, now)
+            if peer.unacked:
+                self.retry(address, peer, now)
+            if peer.ack_due is not None and now >= peer.ack_due:
+                self.transmit(address, peer, 0, peer.next_seq, b"")
+
+    def flush_peer(self, address: int, peer: Peer, now: float) -> None:
+        """Send what's in the outbox as frames of at most MAX_PACKET, a full window holds the rest back"""
+        reliable = address != protocol.BROADCAST
+        while peer.outbox:
+            if reliable and len(peer.unacked) >= WINDOW:
+                return  # Peer is behind, hold new frames until acks come back
+            if not reliable and len(peer.outbox) == 1:
+                # A lone broadcast needs neither acks nor framing, save the header
+                self.radio_send(peer.outbox[0], address)
+                self.frames_sent += 1
+                self.messages_sent += 1
+                peer.outbox = []
+                peer.outbox_size = 0
+                return
+            parts = []
+            size = 0
+            for message in peer.outbox:
+                if parts and size + len(message) + 1 > FRAME_BODY:
+                    break
+                parts.append(struct.pack("B", len(message)))
+                parts.append(message)
+                size += len(message) + 1
+            body = b"".join(parts)
+            count = len(parts) // 2
+            self.messages_sent += count
+            peer.outbox = peer.outbox[count:]
+            peer.outbox_size -= size
+
+            seq = peer.next_seq
+            peer.next_seq = (seq + 1) & 0xFFFF
+            if reliable:
+                peer.unacked[seq] = Pending(seq, body, now, self.retry_base)
+            self.transmit(address, peer, RELIABLE if reliable else 0, seq, body)
+
+    def transmit(self, address: int, peer: Peer, flags: int, seq: int, body: bytes) -> None:
+        ack = b""
+        if peer.received.top is not None and address != protocol.BROADCAST:
+            flags |= ACK
+            ack = struct.pack("<HH", peer.received.top, peer.received.bits)
+            peer.ack_due = None
+        self.radio_send(struct.pack(FRAME_HEADER, protocol.VERSION, protocol.FRAME, flags, self.epoch, seq) + ack + body, address)
+        self.frames_sent += 1
+
+    def retry(self, address: int, peer: Peer, now: float) -> None:
+        for seq, pending in list(peer.unacked.items()):
+            if now < pending.retry_at:
+                continue
+            if pending.tries >= MAX_TRIES:
+                del peer.unacked[seq]
+                self.gave_up += 1
+                if self.on_give_up:
+                    self.on_give_up(address)
+                continue
+            pending.tries += 1
+            pending.timeout = min(pending.timeout * 2, RETRY_MAX)
+            pending.retry_at = now + jitter(pending.timeout)
+            self.retransmits += 1
+            self.transmit(address, peer, RELIABLE, seq, pending.body)
+
+    def receive(self, source: int, buf, now: float):
+        """Unwrap a FRAME, returns its messages as memoryview slices (empty for duplicates)"""
+        _, _, flags, epoch, seq = struct.unpack_from(FRAME_HEADER, buf, 0)
+        offset = FRAME_HEADER_SIZE
+        peer = self.peer(source)
+        if epoch != peer.epoch:
+            # First frame from this peer since it (or we) booted
+            peer.epoch = epoch
+            peer.received = Window()
+            peer.broadcasts = Window()
+        if flags & ACK:
+            top, bits = struct.unpack_from("<HH", buf, offset)
+            offset += ACK_SIZE
+            self.acknowledged(peer, top, bits)
+
+        if flags & RELIABLE:
+            fresh = peer.received.mark(seq)
+            if peer.ack_due is None:
+                peer.ack_due = now + ACK_DELAY
+        elif offset < len(buf):
+            fresh = peer.broadcasts.mark(seq)
+        else:
+            return ()  # Bare ack
+
+        if not fresh:
+            self.duplicates += 1
+            return ()
+        messages = []
+        while offset < len(buf):
+            size = buf[offset]
+            messages.append(buf[offset + 1:offset + 1 + size])
+            offset += 1 + size
+        return messages
+
+    def acknowledged(self, peer: Peer, top: int, bits: int) -> None:
+        """Drop every pending frame the selective ack covers"""
+        for seq in list(peer.unacked):
+            back = (top - seq) & 0xFFFF
+            if back == 0 or (back <= WINDOW and bits & (1 << (back - 1))):
+                del peer.unacked[seq]
+
+    def stats(self):
+        return {
+            "frames": self.frames_sent,
+            "messages": self.messages_sent,
+            "retransmits": self.retransmits,
+            "duplicates": self.duplicates,
+            "gave_up": self.gave_up,
+        }
@@ -0,0 +1,337 @@
+"""Stand-in for the badge firmware API so the mafia app can run on a desktop
+
+Only the parts of the API the app uses are here. Every simulated badge is a
+Device; the module-level proxies (display, radio, input, contacts, time)
+forward to whichever device is current, so many App instances can share one
+interpreter. Put this directory first on sys.path and `import badge` picks
+it up instead of the firmware module.
+"""
+import atexit as _atexit
+import random as _random
+import shutil as _shutil
+import tempfile as _tempfile
+
+WIDTH = 200
+HEIGHT = 200
+BROADCAST = 0xFFFF
+
+
+class _Buttons:
+    SW3 = 3
+    SW4 = 4
+    SW5 = 5
+    SW6 = 6
+    SW7 = 7
+    SW8 = 8
+    SW9 = 9
+    SW10 = 10
+    SW11 = 11
+    SW12 = 12
+    SW13 = 13
+    SW14 = 14
+    SW15 = 15
+    SW16 = 16
+    SW17 = 17
+    SW18 = 18
+
+
+Button = _Buttons
+
+
+class Clock:
+    """Virtual monotonic clock shared by every device on a bus"""
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class Display:
+    """1-bit framebuffer that counts what the app asked it to do"""
+    def __init__(self, width: int = WIDTH, height: int = HEIGHT):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray(width * height)
+        self.text_calls = 0
+        self.fill_calls = 0
+        self.rect_calls = 0
+        self.blit_calls = 0
+        self.shows = 0
+        self.texts = []  # (text, x, y, font) drawn since the last full fill
+
+    def fill(self, color: int) -> None:
+        self.fill_calls += 1
+        self.buffer[:] = bytes((color,)) * len(self.buffer)
+        self.texts = []
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, color: int) -> None:
+        self.rect_calls += 1
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + w), min(self.height, y + h)
+        if x1 <= x0:
+            return
+        row = bytes((color,)) * (x1 - x0)
+        for yy in range(y0, y1):
+            start = yy * self.width + x0
+            self.buffer[start:start + len(row)] = row
+
+    def pixel(self, x: int, y: int, color: int = None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        if color is None:
+            return self.buffer[y * self.width + x]
+        self.buffer[y * self.width + x] = color
+
+    def nice_text(self, text: str, x: int, y: int, font: int = 24, color: int = 0, **kwargs) -> None:
+        """No real glyphs, each character inks a font-sized box so pixels change"""
+        self.text_calls += 1
+        self.texts.append((text, x, y, font))
+        yy = y
+        for line in text.split("\n"):
+            self.fill_rect(x, yy + font // 4, len(line) * font // 2, font // 2, color)
+            yy += font
+
+    def blit(self, fb, x: int, y: int, key: int = -1, palette=None) -> None:
+        """Takes the framebuf stand-in from this directory"""
+        self.blit_calls += 1
+        # Bitmaps here are black ink on a white key, so copy the black spans
+        for yy, x0, x1 in fb.runs(0):
+            self.fill_rect(x + x0, y + yy, x1 - x0, 1, 0)
+
+    def show(self) -> None:
+        self.shows += 1
+
+
+class Packet:
+    def __init__(self, source: int, dest: int, app_number: int, data: bytes):
+        self.source = source
+        self.dest = dest
+        self.app_number = app_number
+        self.data = data
+
+
+class Bus:
+    """In-memory radio channel, packets sent in one step arrive on the next
+
+    With radio_range set only badges within that distance of the sender hear
+    it, by their position
+    """
+    def __init__(self, loss: float = 0.0, seed=None, radio_range: float = None):
+        self.devices = {}  # address -> Device
+        self.loss = loss
+        self.radio_range = radio_range
+        self.rng = _random.Random(seed)
+        self.queue = []
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.asleep = 0  # packets a receiver missed because it was switched off
+        self.bytes_sent = 0
+
+    def attach(self, device) -> None:
+        self.devices[device.address] = device
+        device.bus = self
+
+    def detach(self, device) -> None:
+        """Take a badge out of range, it hears nothing and nothing it sends arrives"""
+        self.devices.pop(device.address, None)
+        self.queue = [p for p in self.queue if p.source != device.address]
+
+    def send(self, source: int, data: bytes, destination: int, app_number: int) -> None:
+        self.sent += 1
+        self.bytes_sent += len(data)
+        self.queue.append(Packet(source, destination, app_number, bytes(data)))
+
+    def in_range(self, a, b) -> bool:
+        dx = a.position[0] - b.position[0]
+        dy = a.position[1] - b.position[1]
+        return dx * dx + dy * dy <= self.radio_range * self.radio_range
+
+    def deliver(self) -> int:
+        """Hand queued packets to their receivers, returns how many arrived"""
+        queue = self.queue
+        self.queue = []
+        arrived = 0
+        for packet in queue:
+            if packet.dest == BROADCAST:
+                targets = [d for d in self.devices.values() if d.address != packet.source]
+            else:
+                target = self.devices.get(packet.dest)
+                targets = [target] if target else []
+            if self.radio_range is not None:
+                sender = self.devices.get(packet.source)
+                targets = [d for d in targets if sender is not None and self.in_range(sender, d)]
+            for device in targets:
+                if not device.listening:
+                    self.asleep += 1
+                    continue
+                if self.loss and self.rng.random() < self.loss:
+                    self.dropped += 1
+                    continue
+                device.receive(packet)
+                arrived += 1
+        self.delivered += arrived
+        return arrived
+
+
+class Contact:
+    def __init__(self, name: str, badge_id: int):
+        self.name = name
+        self.badge_id = badge_id
+
+
+class Device:
+    """One simulated badge: its own display, buttons, contact and radio address"""
+    def __init__(self, address: int, name: str, clock: Clock, app_number: int = 0):
+        self.address = address
+        self.contact = Contact(name, address)
+        self.clock = clock
+        self.app_number = app_number
+        self.display = Display()
+        self.buttons = set()
+        self.taps = {}  # button -> frames left before it is released
+        self.bus = None
+        self.app = None
+        self.packets_in = 0
+        self.packets_out = 0
+        self.listening = True  # receiver on
+        self.position = (0.0, 0.0)  # metres, only matters on a Bus with a radio_range
+        self._flash = None
+
+    @property
+    def flash(self) -> str:
+        """A scratch directory standing in for this badge's filesystem, gone when the process exits"""
+        if self._flash is None:
+            self._flash = _tempfile.mkdtemp(prefix=f"badge{self.address}-")
+            _atexit.register(_shutil.rmtree, self._flash, True)
+        return self._flash
+
+    def run(self, app_class):
+        """Create and open the app on this device"""
+        with self:
+            self.app = app_class()
+            self.app.on_open()
+        return self.app
+
+    def receive(self, packet: Packet) -> None:
+        self.packets_in += 1
+        with self:
+            self.app.on_packet(packet, True)
+
+    def loop(self) -> None:
+        with self:
+            self.app.loop()
+        if self.taps:
+            for button, frames in list(self.taps.items()):
+                if frames <= 1:
+                    del self.taps[button]
+                    self.buttons.discard(button)
+                else:
+                    self.taps[button] = frames - 1
+
+    def press(self, button: int) -> None:
+        self.buttons.add(button)
+
+    def release(self, button: int) -> None:
+        self.buttons.discard(button)
+
+    def tap(self, button: int, frames: int = 1) -> None:
+        """Hold a button down for the next few frames"""
+        self.buttons.add(button)
+        self.taps[button] = frames
+
+    def __enter__(self):
+        global current
+        self.previous = current
+        current = self
+        return self
+
+    def __exit__(self, *exc):
+        global current
+        current = self.previous
+
+
+current = None
+
+
+class _DisplayProxy:
+    def __getattr__(self, name):
+        return getattr(current.display, name)
+
+
+class _Radio:
+    Packet = Packet
+
+    def send(self, data, destination: int = BROADCAST) -> None:
+        current.packets_out += 1
+        current.bus.send(current.address, data, destination, current.app_number)
+
+    def listen(self, on: bool) -> None:
+        """Switch the receiver, not every firmware can so the app checks for this"""
+        current.listening = on
+
+
+class _Input:
+    Buttons = _Buttons
+
+    def get_button(self, button) -> bool:
+        return button in current.buttons
+
+
+class _Contacts:
+    def my_contact(self):
+        return current.contact
+
+
+class _Time:
+    def monotonic(self) -> float:
+        return current.clock.now
+
+
+class _Utils:
+    def set_led(self, on: bool) -> None:
+        pass
+
+
+class _Logger:
+    """Drops everything unless verbose is set, like an unattached badge"""
+    verbose = False
+
+    def _log(self, level, msg, *args):
+        if self.verbose:
+            print(f"[{current.address if current else '-'}] {level}: {msg % args if args else msg}")
+
+    def debug(self, msg, *args):
+        self._log("DEBUG", msg, *args)
+
+    def info(self, msg, *args):
+        self._log("INFO", msg, *args)
+
+    def warning(self, msg, *args):
+        self._log("WARNING", msg, *args)
+
+    def error(self, msg, *args):
+        self._log("ERROR", msg, *args)
+
+
+class BaseApp:
+    def __init__(self):
+        self.logger = _Logger()
+
+    def on_open(self) -> None:
+        pass
+
+    def loop(self) -> None:
+        pass
+
+    def on_packet(self, packet: Packet, in_foreground: bool) -> None:
+        pass
+
+
+display = _DisplayProxy()
+radio = _Radio()
+input = _Input()
+contacts = _Contacts()
+time = _Time()
+utils = _Utils()
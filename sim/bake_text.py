@@ -0,0 +1,102 @@
+"""Pre-bake the app's static UI strings into PBM bitmaps
+
+    python sim/bake_text.py --font path/to/badge-font.ttf
+
+Renders every screen in the stand-in badge for each stage with two different
+rosters; any string that comes out the same both times is static. Each one is
+rasterized with Pillow and written to mafia/text/<id>.pbm, the same P4 format
+as knife.pbm, where TextCache loads it instead of rasterizing on the badge.
+Pillow is only needed here, never on the badge.
+"""
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(HERE), "mafia")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+import badge  # noqa: E402
+from player import STAGE_NAMES  # noqa: E402
+from simulate import boot  # noqa: E402
+from textcache import text_id  # noqa: E402
+
+
+def screen_texts(players: int, prefix: str):
+    """Every (text, font) the app draws across screens and stages"""
+    device = badge.Device(1, f"{prefix}host", badge.Clock())
+    badge.Bus().attach(device)
+    app = boot(device)
+    app.renderer.cache = None
+    texts = set()
+    with device:
+        app.render_screen("welcome")
+        texts.update((w.text, w.font) for w in app.renderer.widgets)
+        app.start_hosting()
+        for i in range(1, players):
+            app.add_player(f"{prefix}{i}")
+        for stage in range(len(STAGE_NAMES)):
+            app.game.stage = stage
+            app.renderer.invalidate("stage")
+            for index in range(len(app.screens)):
+                app.current_screen = index
+                app.renderer.force()
+                app.render_screen()
+                texts.update((w.text, w.font) for w in app.renderer.widgets)
+    return texts
+
+
+def write_pbm(path: str, image) -> None:
+    """1-bit Pillow image (0 = black) to a P4 PBM (1 = black)"""
+    w, h = image.size
+    stride = (w + 7) // 8
+    rows = bytearray(stride * h)
+    pixels = image.load()
+    for y in range(h):
+        for x in range(w):
+            if pixels[x, y] == 0:
+                rows[y * stride + x // 8] |= 0x80 >> (x % 8)
+    with open(path, "wb") as f:
+        f.write(f"P4\n{w} {h}\n".encode())
+        f.write(rows)
+
+
+def bake(text: str, size: int, font_path: str, out_dir: str) -> str:
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.truetype(font_path, size)
+    lines = text.split("\n")
+    width = max(int(font.getlength(line)) for line in lines) + 1
+    image = Image.new("1", (min(width, 200), size * len(lines)), 1)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((0, i * size), line, font=font, fill=0)
+    path = os.path.join(out_dir, f"{text_id(text, size)}.pbm")
+    write_pbm(path, image)
+    return path
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--font", required=True, help="TTF matching the badge's nice_text font")
+    parser.add_argument("--out", default=os.path.join(APP_DIR, "text"))
+    parser.add_argument("--list", action="store_true", help="only print the static strings")
+    args = parser.parse_args(argv)
+
+    static = sorted(screen_texts(3, "a") & screen_texts(6, "b"))
+    if args.list:
+        for text, size in static:
+            print(f"{text_id(text, size)}  {size:>2}  {text!r}")
+        return
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("baking needs Pillow: pip install pillow")
+    os.makedirs(args.out, exist_ok=True)
+    for text, size in static:
+        print(bake(text, size, args.font, args.out))
+
+
+if __name__ == "__main__":
+    main()
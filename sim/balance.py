@@ -0,0 +1,385 @@
+"""Monte Carlo balance estimates for role mixes, scripted bots playing by the app's rules
+
+    python sim/balance.py --players 5-30 --games 200000
+    python sim/balance.py --players 8,12,20 --kraken-share 0.15,0.2,0.25,0.3 --strategy informed
+    python sim/balance.py --players 6-30 --sweep --target 0.5 --out balance.json
+    python sim/balance.py --check
+
+Roles are dealt by roles.role_counts() from DEFAULT_CONFIG, with its Kraken
+share swapped for --kraken-share. Nights resolve the way NightActions.resolve()
+does, and a vote only eliminates a clear leader, as in VotingResults. With
+NumPy a whole batch of games is played at once as (games, players) arrays.
+Without it every game is played on the app's own Roster, NightActions and
+VotingResults, which is slow but needs nothing installed. --check plays both
+and compares them.
+
+Bot strategies:
+  random    what simulate.py's bots do. Krakens each go for a random
+            villager, cops and organizers pick anyone, and everybody votes
+            for anyone alive, themselves included.
+  informed  Krakens agree on one victim a night and vote together. An
+            organizer who saw their player visit the victim accuses them,
+            and the village votes with the accusation.
+
+Prints win rates and game lengths per role mix and lobby size. With --sweep
+it also prints the Kraken share whose win rate comes closest to --target
+for each lobby size; that is the number DEFAULT_CONFIG's share should track.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "mafia"))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Plays one game at a time instead
+
+import roles  # noqa: E402
+from night import NightActions, KILLED  # noqa: E402
+from phases import winner  # noqa: E402
+from player import VotingResults, ROLE_NAMES, VILLAGER, KRAKEN, COP, ORGANIZER  # noqa: E402
+from roster import Roster  # noqa: E402
+
+MAX_ROUNDS = 50  # as in simulate.py, a game still going after this many rounds counts as unfinished
+BATCH = 20000  # games played side by side, memory is a few (BATCH, players) arrays
+STRATEGIES = ("random", "informed")
+SWEEP_SHARES = (0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4)
+GAMES = 100000  # per role mix and lobby size
+SWEEP_GAMES = 2000  # per mix with --sweep, which plays hundreds of mixes, win rates come out within about 1%
+
+
+def config_for(share: float):
+    """DEFAULT_CONFIG with another Kraken share"""
+    return tuple((role, share if role == KRAKEN else part, minimum, maximum)
+                 for role, part, minimum, maximum in roles.DEFAULT_CONFIG)
+
+
+def default_share() -> float:
+    return [part for role, part, _, _ in roles.DEFAULT_CONFIG if role == KRAKEN][0]
+
+
+#numpy engine, row = game, column = slot
+def pick(rng, mask, actors, exclude_self: bool = True):
+    """For every actor a uniform pick among its row's mask, itself left out, -1 everywhere else"""
+    count = mask.sum(axis=1)
+    _, columns = np.nonzero(mask)  # every row's candidates back to back, in slot order
+    first = np.cumsum(count) - count
+    games, slots = np.nonzero(actors)
+    choices = count[games]
+    if exclude_self:
+        mine = mask[games, slots]
+        choices = choices - mine
+    index = (rng.random(len(games), np.float32) * choices).astype(np.intp)
+    if exclude_self:
+        # Step over our own place among the candidates
+        index += mine & (index >= np.cumsum(mask, axis=1, dtype=np.int16)[games, slots] - 1)
+    ok = choices > 0
+    games = games[ok]
+    targets = np.full(mask.shape, -1, np.intp)
+    targets[games, slots[ok]] = columns[first[games] + index[ok]]
+    return targets
+
+
+def pick_one(rng, mask):
+    """One uniform pick per row, -1 for rows with no candidate"""
+    scores = np.where(mask, rng.random(mask.shape, np.float32), -1.0)
+    return np.where(mask.any(axis=1), scores.argmax(axis=1), -1)
+
+
+def tally(targets, voters):
+    """Votes each slot got in every game, counting only the voters' targets"""
+    games, players = targets.shape
+    valid = voters & (targets >= 0)
+    rows = np.broadcast_to(np.arange(games)[:, None], targets.shape)
+    return np.bincount((rows * players + targets)[valid], minlength=games * players).reshape(games, players)
+
+
+def winners(role, alive):
+    """phases.winner() for every game, 0 while it is still on"""
+    krakens = (alive & (role == KRAKEN)).sum(axis=1)
+    others = alive.sum(axis=1) - krakens
+    return np.where(krakens == 0, VILLAGER, np.where(krakens >= others, KRAKEN, 0))
+
+
+def night_batch(rng, role, alive, strategy: str):
+    """One night in every game, kills in place, returns who the organizers accuse (-1 for nobody)"""
+    games = len(role)
+    rows = np.arange(games)
+    krakens = alive & (role == KRAKEN)
+    prey = alive & (role != KRAKEN)
+    if strategy == "informed":
+        targets = np.where(krakens, pick_one(rng, prey)[:, None], -1)
+    else:
+        targets = pick(rng, prey, krakens, exclude_self=False)
+    helpers = alive & ((role == COP) | (role == ORGANIZER))
+    targets = np.where(helpers, pick(rng, alive, helpers), targets)
+
+    # Most Kraken votes, ties to the lowest slot (argmax takes the first), a cop on the victim saves them
+    kills = tally(targets, krakens)
+    attacked = kills.max(axis=1) > 0
+    victim = kills.argmax(axis=1)
+    saved = ((targets == victim[:, None]) & alive & (role == COP)).any(axis=1)
+    organizers = alive & (role == ORGANIZER)
+    killed = attacked & ~saved
+    alive[rows[killed], victim[killed]] = False
+    if strategy != "informed":
+        return np.full(games, -1)
+
+    watched = np.where(organizers, targets, 0)
+    visited = np.take_along_axis(targets, watched, axis=1)
+    saw = organizers & alive & attacked[:, None] & (visited == victim[:, None])
+    return np.where(saw.any(axis=1), watched[rows, saw.argmax(axis=1)], -1)
+
+
+def day_batch(rng, role, alive, accused, strategy: str) -> None:
+    """One vote in every game, eliminates a clear leader in place"""
+    rows = np.arange(len(role))
+    if strategy == "informed":
+        anyone = pick(rng, alive, alive)
+        votes = np.where(accused[:, None] >= 0, accused[:, None], anyone)
+        votes = np.where(votes == np.arange(role.shape[1]), anyone, votes)  # The accused can't vote themselves out
+        pod = pick_one(rng, alive & (role != KRAKEN))
+        votes = np.where(alive & (role == KRAKEN), pod[:, None], votes)
+    else:
+        votes = pick(rng, alive, alive, exclude_self=False)
+    counts = tally(votes, alive)
+    top = counts.max(axis=1)
+    clear = (top > 0) & ((counts == top[:, None]).sum(axis=1) == 1)  # A tie eliminates nobody
+    alive[rows[clear], counts.argmax(axis=1)[clear]] = False
+
+
+def play_numpy(games: int, counts, strategy: str, seed=None):
+    """Play games of one role mix, returns ({winner: games}, rounds histogram)"""
+    rng = np.random.default_rng(seed)
+    deck = np.repeat(np.array([role for role, _ in counts], np.int8), [n for _, n in counts])
+    wins = {KRAKEN: 0, VILLAGER: 0, 0: 0}
+    hist = np.zeros(MAX_ROUNDS + 1, np.int64)
+    for start in range(0, games, BATCH):
+        size = min(BATCH, games - start)
+        # Any deal is as likely as any other, same as roles.deal()
+        role = deck[np.argsort(rng.random((size, len(deck))), axis=1)]
+        alive = np.ones(role.shape, bool)
+        for round_number in range(1, MAX_ROUNDS + 1):
+            accused = night_batch(rng, role, alive, strategy)
+            won = winners(role, alive)
+            role, alive, accused = finish(won, round_number, wins, hist, role, alive, accused)
+            if not len(role):
+                break
+            day_batch(rng, role, alive, accused, strategy)
+            won = winners(role, alive)
+            role, alive = finish(won, round_number, wins, hist, role, alive)
+            if not len(role):
+                break
+        wins[0] += len(role)
+        hist[MAX_ROUNDS] += len(role)
+    return wins, hist.tolist()
+
+
+def finish(won, round_number: int, wins, hist, *arrays):
+    """Count the games that just ended, returns the arrays cut down to the rest"""
+    over = won != 0
+    if over.any():
+        for team in (KRAKEN, VILLAGER):
+            wins[team] += int((won == team).sum())
+        hist[round_number] += int(over.sum())
+        return [a[~over] for a in arrays]
+    return arrays
+
+
+#the app's own classes, one game at a time
+def play_python(games: int, counts, strategy: str, seed=None):
+    """Same as play_numpy() on Roster, NightActions and VotingResults"""
+    rng = random.Random(seed)
+    players = sum(n for _, n in counts)
+    wins = {KRAKEN: 0, VILLAGER: 0, 0: 0}
+    hist = [0] * (MAX_ROUNDS + 1)
+    roster = Roster(players)
+    actions = NightActions(players)
+    for _ in range(games):
+        roster.clear()
+        for slot in range(players):
+            roster.add(f"p{slot}")
+        roles.deal(roster.roles, players, counts, roles.Rng(rng.getrandbits(32)))
+        won, rounds = play_game(rng, roster, actions, strategy)
+        wins[won] += 1
+        hist[rounds] += 1
+    return wins, hist
+
+
+def play_game(rng, roster, actions, strategy: str):
+    for round_number in range(1, MAX_ROUNDS + 1):
+        alive = [slot for slot in range(len(roster)) if roster.is_alive(slot)]
+        prey = [slot for slot in alive if roster.roles[slot] != KRAKEN]
+        shared = rng.choice(prey)
+        for actor in alive:
+            role = roster.roles[actor]
+            if role == KRAKEN:
+                actions.submit(roster, actor, shared if strategy == "informed" else rng.choice(prey))
+            elif role in (COP, ORGANIZER):
+                actions.submit(roster, actor, rng.choice([slot for slot in alive if slot != actor]))
+        dawn = actions.resolve(roster)
+        actions.clear()
+        if dawn.outcome & KILLED:
+            roster.set_alive(dawn.victim, False)
+        won = winner(roster)
+        if won is not None:
+            return won, round_number
+
+        accused = None
+        if strategy == "informed":
+            for organizer in sorted(dawn.reports):
+                watched, visited = dawn.reports[organizer]
+                if roster.is_alive(organizer) and dawn.outcome and visited == dawn.victim:
+                    accused = watched
+                    break
+        alive = [slot for slot in range(len(roster)) if roster.is_alive(slot)]
+        pod = rng.choice([slot for slot in alive if roster.roles[slot] != KRAKEN])
+        results = VotingResults()
+        for voter in alive:
+            if strategy != "informed":
+                target = rng.choice(alive)
+            elif roster.roles[voter] == KRAKEN:
+                target = pod
+            elif accused is not None and accused != voter:
+                target = accused
+            else:
+                target = rng.choice([slot for slot in alive if slot != voter])
+            results.add_vote(roster.names[voter], roster.names[target])
+        candidate = results.get_elimination_candidate()
+        if isinstance(candidate, str):
+            roster.set_alive(roster.by_name[candidate], False)
+        won = winner(roster)
+        if won is not None:
+            return won, round_number
+    return 0, MAX_ROUNDS
+
+
+def percentile(hist, p: int) -> int:
+    total = sum(hist)
+    seen = 0
+    for rounds, count in enumerate(hist):
+        seen += count
+        if seen * 100 >= total * p:
+            return rounds
+    return MAX_ROUNDS
+
+
+def estimate(players: int, share: float, games: int, strategy: str, engine: str, seed=None) -> dict:
+    """Play one role mix at one lobby size, returns its row of the report"""
+    counts = roles.role_counts(players, config_for(share))
+    play = play_numpy if engine == "numpy" else play_python
+    wins, hist = play(games, counts, strategy, seed)
+    return {
+        "players": players,
+        "kraken_share": share,
+        "mix": dict((ROLE_NAMES[role], count) for role, count in counts if count),
+        "games": games,
+        "kraken_wins": wins[KRAKEN] / games,
+        "villager_wins": wins[VILLAGER] / games,
+        "unfinished": wins[0] / games,
+        "rounds_mean": sum(r * n for r, n in enumerate(hist)) / games,
+        "rounds_p10": percentile(hist, 10),
+        "rounds_p50": percentile(hist, 50),
+        "rounds_p90": percentile(hist, 90),
+        "rounds_hist": hist[:max(r for r, n in enumerate(hist) if n) + 1],
+    }
+
+
+def parse_players(text: str):
+    """'5-30' or '8,12,20', or a mix of both"""
+    sizes = []
+    for part in text.split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            sizes.extend(range(int(low), int(high) + 1))
+        else:
+            sizes.append(int(part))
+    return sizes
+
+
+def check(strategies, engine: str, seed=None) -> None:
+    """Both engines on the same mixes, the win rates should agree to within sampling noise"""
+    games = 4000
+    for strategy in strategies:
+        for players in (5, 8, 16):
+            fast = estimate(players, default_share(), games, strategy, engine, seed)
+            slow = estimate(players, default_share(), games, strategy, "python", seed)
+            diff = fast["kraken_wins"] - slow["kraken_wins"]
+            p = (fast["kraken_wins"] + slow["kraken_wins"]) / 2
+            sigma = (2 * p * (1 - p) / games) ** 0.5 or 1.0
+            print(f"{strategy:<9} {players:>3} players  {engine} {fast['kraken_wins']:.3f}  python {slow['kraken_wins']:.3f}  "
+                  f"rounds {fast['rounds_mean']:.2f}/{slow['rounds_mean']:.2f}  {diff / sigma:+.1f} sigma")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--players", default="5-30", help="lobby sizes, e.g. 5-30 or 8,12,20")
+    parser.add_argument("--kraken-share", default=None, help="comma separated shares of the lobby dealt Kraken")
+    parser.add_argument("--games", type=int, default=None,
+                        help="games per role mix and lobby size, %s or %s with --sweep" % (GAMES, SWEEP_GAMES))
+    parser.add_argument("--strategy", choices=STRATEGIES + ("all",), default="all")
+    parser.add_argument("--engine", choices=("numpy", "python"), default="numpy" if np is not None else "python")
+    parser.add_argument("--sweep", action="store_true", help="try every share in %s unless --kraken-share is given" % (SWEEP_SHARES,))
+    parser.add_argument("--target", type=float, default=0.5, help="Kraken win rate --sweep aims for")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--check", action="store_true", help="compare the numpy engine with the app's own classes")
+    parser.add_argument("--out", default=None, help="also write every row as JSON")
+    args = parser.parse_args(argv)
+    if args.engine == "numpy" and np is None:
+        parser.error("numpy isn't installed, use --engine python")
+    strategies = STRATEGIES if args.strategy == "all" else (args.strategy,)
+    if args.check:
+        check(strategies, args.engine, args.seed)
+        return
+
+    if args.kraken_share:
+        shares = [float(share) for share in args.kraken_share.split(",")]
+    else:
+        shares = SWEEP_SHARES if args.sweep else (default_share(),)
+    if args.games is None:
+        args.games = SWEEP_GAMES if args.sweep else GAMES
+    sizes = parse_players(args.players)
+    rows = []
+    start = time.perf_counter()
+    for strategy in strategies:
+        print(f"{strategy}: players share  mix                         kraken villager  rounds mean p10/p50/p90")
+        for players in sizes:
+            for share in shares:
+                row = estimate(players, share, args.games, strategy, args.engine, args.seed)
+                row["strategy"] = strategy
+                rows.append(row)
+                mix = " ".join(f"{name.split()[-1]}:{count}" for name, count in row["mix"].items())
+                print(f"  {players:>7} {share:>5.2f}  {mix:<27} {row['kraken_wins']:>6.1%} {row['villager_wins']:>8.1%}"
+                      f"  {row['rounds_mean']:>11.2f} {row['rounds_p10']}/{row['rounds_p50']}/{row['rounds_p90']}")
+    elapsed = time.perf_counter() - start
+    games = args.games * len(rows)
+    print(f"{games} games in {elapsed:.1f}s ({games / elapsed:.0f} games/s, {args.engine})")
+
+    if args.sweep:
+        for strategy in strategies:
+            print(f"{strategy}: Kraken share closest to a {args.target:.0%} win rate")
+            for players in sizes:
+                candidates = [row for row in rows if row["strategy"] == strategy and row["players"] == players]
+                best = min(candidates, key=lambda row: abs(row["kraken_wins"] - args.target))
+                print(f"  {players:>3} players  share {best['kraken_share']:.2f}  Kraken {best['mix'].get('Kraken', 0)}"
+                      f"  wins {best['kraken_wins']:.1%}")
+            # One share has to serve every lobby size in DEFAULT_CONFIG
+            misses = dict((share, sum(abs(row["kraken_wins"] - args.target) for row in rows
+                                      if row["strategy"] == strategy and row["kraken_share"] == share) / len(sizes))
+                          for share in shares)
+            share = min(misses, key=misses.get)
+            print(f"  every size: share {share:.2f}, Kraken win rate off by {misses[share]:.1%} on average")
+    if args.out:
+        report = {"strategies": list(strategies), "engine": args.engine, "max_rounds": MAX_ROUNDS, "rows": rows}
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Micro-benchmarks for the app's hot paths, run against the stand-in badge
+
+    python sim/bench.py --out bench_results.json
+
+Times screen rendering and list scrolling, packet dispatch per opcode (heartbeats and the
+failover replica included), vote tallying, role dealing, the instrumentation's own overhead and a frame of the scheduler, and writes every result to a JSON file so runs can be compared
+across releases.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "mafia"))
+sys.path.insert(0, HERE)
+
+import badge  # noqa: E402
+import protocol  # noqa: E402
+import stats  # noqa: E402
+from player import VotingResults, KRAKEN, DAY, WAITING  # noqa: E402
+from simulate import boot  # noqa: E402
+
+SIZES = (5, 50, 500)
+
+
+def measure(fn, number: int, repeat: int = 5) -> float:
+    """Best per-call time in seconds over a few repeats"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = (time.perf_counter() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class Bench:
+    def __init__(self, quick: bool = False):
+        self.scale = 10 if quick else 1
+        self.results = []
+
+    def run(self, name: str, fn, number: int, counters=None, **params) -> None:
+        number = max(1, number // self.scale)
+        seconds = measure(fn, number)
+        result = {"name": name, "params": params, "calls": number, "per_call_us": seconds * 1e6}
+        if counters:
+            result["counters"] = counters()
+        self.results.append(result)
+        label = " ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{name:<32} {label:<24} {seconds * 1e6:>10.2f} us")
+
+
+def make_host(players: int):
+    """A hosting badge with a full lobby and nothing left in its send queue"""
+    clock = badge.Clock()
+    bus = badge.Bus()
+    device = badge.Device(1, "host", clock)
+    bus.attach(device)
+    app = boot(device)
+    with device:
+        app.start_hosting()
+        for i in range(1, players):
+            app.add_player(f"player{i}", 100 + i)
+        app.game.take_deltas()
+    bus.queue = []
+    return device, app
+
+
+def make_client(players: int):
+    clock = badge.Clock()
+    bus = badge.Bus()
+    device = badge.Device(2, "player1", clock)
+    bus.attach(device)
+    app = boot(device)
+    host_device, host = make_host(players)
+    with device:
+        app.game_id = host.game_id
+        for packet in host.game.snapshot():
+            app.on_packet(badge.Packet(1, 2, 0, protocol.link(app.game_id, packet)), True)
+        app.handle_received()
+        app.slot = 1
+        app.host_address = 1
+    return device, app, host
+
+
+def bench_render(bench: Bench) -> None:
+    for players in SIZES:
+        device, app = make_host(players)
+        with device:
+            for index, name in enumerate(app.screens):
+                app.current_screen = index
+
+                def full():
+                    app.renderer.force()
+                    app.render_screen()
+
+                def display_work():
+                    # The stand-in's nice_text is a box fill, so count calls rather than trust its time
+                    before = (device.display.text_calls, device.display.blit_calls)
+                    full()
+                    return {"nice_text": device.display.text_calls - before[0], "blit": device.display.blit_calls - before[1]}
+                bench.run("render_screen.full", full, 2000, display_work, screen=name, players=players)
+
+                def skipped():
+                    app.render_screen()
+                bench.run("render_screen.skipped", skipped, 20000, screen=name, players=players)
+
+                if name in app.lists:
+                    def scroll():
+                        # One press of Right (or a page on lists without a cursor), back to the top at the end
+                        if not app.scroll_list(1):
+                            app.lists[name].page(app.list_length(name))
+                            app.renderer.invalidate("list")
+                        app.render_screen()
+                    bench.run("render_screen.scroll", scroll, 2000, screen=name, players=players)
+
+
+def bench_packets(bench: Bench) -> None:
+    for players in SIZES[:2]:
+        device, host = make_host(players)
+        client_device, client, _ = make_client(players)
+
+        def deliver(target_device, app, data: bytes, source: int, game: int = None):
+            packet = badge.Packet(source, target_device.address, 0, protocol.link(app.game_id if game is None else game, data))
+
+            def call():
+                # What the rx task does with it on the next frame is part of the cost
+                app.on_packet(packet, True)
+                app.handle_received()
+                target_device.bus.queue = []
+            return call
+
+        with device:
+            bench.run("on_packet", deliver(device, host, protocol.join_req("player1"), 101), 2000, opcode="JOIN_REQ", players=players)
+            bench.run("on_packet", deliver(device, host, protocol.vote(1, 2), 101), 20000, opcode="VOTE", players=players)
+            host.vote_queue = []
+            bench.run("on_packet", deliver(device, host, protocol.action(1, 2), 101), 20000, opcode="ACTION", players=players)
+        with client_device:
+            bench.run("on_packet", deliver(client_device, client, protocol.join_ack(1, "player1"), 1), 20000, opcode="JOIN_ACK", players=players)
+            bench.run("on_packet", deliver(client_device, client, protocol.role(1, KRAKEN), 1), 20000, opcode="ROLE", players=players)
+            snapshot = host.game.snapshot()[0]
+            bench.run("on_packet", deliver(client_device, client, snapshot, 1), 2000, opcode="SYNC", players=players)
+            bench.run("on_packet", deliver(client_device, client, protocol.heartbeat(0, 0, 1), 1), 20000, opcode="HEARTBEAT", players=players)
+            replica = protocol.replica(host.game.seq, host.game.stage, host.game.roster)[0]
+            bench.run("on_packet", deliver(client_device, client, replica, 1), 2000, opcode="REPLICA", players=players)
+
+            base = client.game.seq
+            delta = protocol.delta(base + 1, [protocol.op_vote(1, 2), protocol.op_alive(3, False), protocol.op_stage(DAY)])
+            apply = deliver(client_device, client, delta, 1)
+
+            def fresh_delta():
+                client.game.seq = base
+                apply()
+            bench.run("on_packet", fresh_delta, 20000, opcode="DELTA", players=players)
+            bench.run("on_packet", deliver(client_device, client, b"\x09\x01", 1), 20000, opcode="unknown", players=players)
+
+            # What another game's traffic costs a badge that isn't in it
+            other = client.game_id ^ 0x80
+            bench.run("on_packet", deliver(client_device, client, snapshot, 7, other), 20000, opcode="foreign SYNC", players=players)
+            beacon = protocol.beacon(players, WAITING, "host")
+            bench.run("on_packet", deliver(client_device, client, beacon, 7, other), 20000, opcode="foreign BEACON", players=players)
+
+
+def bench_votes(bench: Bench) -> None:
+    for players in SIZES:
+        names = [f"player{i}" for i in range(players)]
+        results = VotingResults()
+        state = {"i": 0}
+
+        def add_vote():
+            i = state["i"] = state["i"] + 1
+            results.add_vote(names[i % players], names[(i * 7) % players])
+        bench.run("VotingResults.add_vote", add_vote, 20000, players=players)
+        bench.run("VotingResults.get_elimination_candidate", results.get_elimination_candidate, 20000, players=players)
+        bench.run("VotingResults.display_results", results.display_results, 500, players=players)
+
+
+def bench_roles(bench: Bench) -> None:
+    # Slots are one byte on the wire, so a lobby tops out at 255
+    for players in (5, 50, 250):
+        device, app = make_host(players)
+
+        def deal():
+            app.assign_roles()
+            device.bus.queue = []
+        with device:
+            bench.run("App.assign_roles", deal, 200, players=players)
+
+
+def bench_stats(bench: Bench) -> None:
+    """What the always-on instrumentation costs every frame and every log call"""
+    numbers = stats.Stats()
+
+    def frame():
+        numbers.start_frame()
+        numbers.end_frame()
+    bench.run("Stats.frame", frame, 20000)
+    log = stats.Log(badge.BaseApp().logger)
+    bench.run("Log.debug", lambda: log.debug("Synced to seq %s", 1234), 20000, level="info")
+
+
+def bench_scheduler(bench: Bench) -> None:
+    """What on_packet costs now that it only queues, and one idle frame of every task"""
+    for players in SIZES[:2]:
+        device, host = make_host(players)
+        packet = badge.Packet(101, 1, 0, protocol.link(host.game_id, protocol.vote(1, 2)))
+
+        def queue():
+            host.on_packet(packet, True)
+            host.rx_queue = []
+        with device:
+            bench.run("on_packet.queue", queue, 20000, opcode="VOTE", players=players)
+            device.loop()
+
+            def frame():
+                device.loop()
+                device.bus.queue = []
+            bench.run("App.loop", frame, 2000, role="host", players=players)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--quick", action="store_true", help="tenth of the iterations, for smoke runs")
+    args = parser.parse_args(argv)
+
+    bench = Bench(args.quick)
+    bench_render(bench)
+    bench_packets(bench)
+    bench_votes(bench)
+    bench_roles(bench)
+    bench_stats(bench)
+    bench_scheduler(bench)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": bench.results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {len(bench.results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
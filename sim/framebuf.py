@@ -0,0 +1,49 @@
+"""Stand-in for MicroPython's framebuf, only MONO_HLSB and what the app uses"""
+
+MONO_HLSB = 3
+
+
+class FrameBuffer:
+    def __init__(self, buf, width: int, height: int, format: int, stride: int = None):
+        if format != MONO_HLSB:
+            raise ValueError("only MONO_HLSB is emulated")
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.stride = ((stride or width) + 7) // 8
+        self._runs = None
+
+    def pixel(self, x: int, y: int, color: int = None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0 if color is None else None
+        index = y * self.stride + x // 8
+        bit = 0x80 >> (x & 7)
+        if color is None:
+            return 1 if self.buf[index] & bit else 0
+        self._runs = None
+        if color:
+            self.buf[index] |= bit
+        else:
+            self.buf[index] &= ~bit & 0xFF
+
+    def fill(self, color: int) -> None:
+        self._runs = None
+        value = 0xFF if color else 0
+        for i in range(len(self.buf)):
+            self.buf[i] = value
+
+    def runs(self, color: int):
+        """(y, x0, x1) spans of one color, cached until the buffer is drawn on"""
+        if self._runs is None or self._runs[0] != color:
+            spans = []
+            for y in range(self.height):
+                start = None
+                for x in range(self.width + 1):
+                    hit = x < self.width and self.pixel(x, y) == color
+                    if hit and start is None:
+                        start = x
+                    elif not hit and start is not None:
+                        spans.append((y, start, x))
+                        start = None
+            self._runs = (color, spans)
+        return self._runs[1]
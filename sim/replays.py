@@ -0,0 +1,217 @@
+"""Read game replays copied off host badges and report on them
+
+    python sim/simulate.py --games 200 --loss 0.05 --replays replays/
+    python sim/replays.py replays/
+    python sim/replays.py replays/ --round 1 --out round1.json
+
+Files are streamed one at a time, so a whole event's worth of replays never
+has to fit in memory: paths -> file contents -> one summary per game -> running
+totals. Reports:
+  votes   who the final ballots at each resolution went to, by the voter's
+          role and the target's role
+  phases  how long each stage lasted, as bucketed histograms
+  link    the host's retransmit rate, frames given up on and duplicates,
+          from the link counters the host records every night
+With --round only that round of every game is read, found through the index
+at the end of each replay instead of decoding the rounds before it.
+"""
+import argparse
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "mafia"))
+
+import protocol  # noqa: E402
+import replay  # noqa: E402
+from player import ROLE_NAMES, STAGE_NAMES, RESOLUTION, OVER  # noqa: E402
+from stats import Histogram  # noqa: E402
+
+PHASE_BUCKETS = (250, 500, 1000, 2000, 5000, 10000, 30000, 60000, 120000, 300000)  # ms, upper bounds
+LINK_FIELDS = ("frames", "retransmits", "gave_up", "duplicates", "received")
+
+
+def replay_paths(paths):
+    """Every replay file named, directories are searched for *.bin"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".bin"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def contents(paths):
+    """(path, bytes) of one file at a time, files that aren't replays are skipped"""
+    for path in paths:
+        with open(path, "rb") as f:
+            buf = f.read()
+        try:
+            replay.check(buf)
+        except (ValueError, IndexError):
+            print(f"{path}: not a replay, skipped", file=sys.stderr)
+            continue
+        yield path, buf
+
+
+def setup(buf):
+    """Roles by slot, from the events before the game got going"""
+    for offset, kind, ms, fields in replay.read_events(buf):
+        if kind == replay.E_ROLES:
+            return fields[0]
+    return b""
+
+
+def from_round(buf, number: int):
+    """Events from the night that starts round number to the end of the game, found through the index"""
+    index, _ = replay.read_index(buf)
+    for round_number, offset, ms in index:
+        if round_number == number:
+            return replay.read_events(buf, offset, ms=ms)
+    return iter(())
+
+
+def summarize(buf, round_number: int = None):
+    """What the analyzer needs from one replay, with round_number only that round"""
+    roles = setup(buf)
+    if round_number is None:
+        events = replay.read_events(buf)
+    else:
+        events = from_round(buf, round_number)  # Read on into the next round, its night ends our last phase
+    summary = {"votes": [], "phases": [], "link": None, "winner": None, "rounds": 0}
+    ballots = {}
+    stage = None
+    since = None
+    first_link = None
+    last_link = None
+    for offset, kind, ms, fields in events:
+        if kind == replay.E_VOTE:
+            voter, target = fields
+            if target == protocol.NO_SLOT:
+                ballots.pop(voter, None)
+            else:
+                ballots[voter] = target
+        elif kind == replay.E_STAGE:
+            if stage is not None:
+                summary["phases"].append((stage, ms - since))
+            if replay.starts_round(stage, fields[0]):
+                if round_number is not None and summary["rounds"]:
+                    break
+                summary["rounds"] += 1
+            stage, since = fields[0], ms
+            if stage == RESOLUTION:
+                for voter, target in ballots.items():
+                    if voter < len(roles) and target < len(roles):
+                        summary["votes"].append((roles[voter], roles[target]))
+                ballots = {}
+            elif stage == OVER:
+                summary["winner"] = fields[1]
+        elif kind == replay.E_LINK:
+            if first_link is None:
+                first_link = fields
+            last_link = fields
+    if first_link is not None:
+        # The counters run on for the host's whole uptime, only the difference is this game's
+        summary["link"] = [last - first for first, last in zip(first_link, last_link)]
+    return summary
+
+
+def summaries(files, round_number: int = None):
+    for path, buf in files:
+        yield path, summarize(buf, round_number)
+
+
+class Totals:
+    """Running aggregates over every summary added"""
+    def __init__(self):
+        self.games = 0
+        self.wins = {}
+        self.rounds = 0
+        self.votes = {}  # (voter role, target role) -> ballots
+        self.phases = {}  # stage -> Histogram of ms
+        self.phase_ms = {}  # stage -> total ms, for the mean
+        self.link = [0] * len(LINK_FIELDS)
+        self.linked = 0  # games that had link counters
+
+    def add(self, summary) -> None:
+        self.games += 1
+        if summary["winner"] is not None:
+            team = ROLE_NAMES[summary["winner"]] if summary["winner"] < len(ROLE_NAMES) else "none"
+            self.wins[team] = self.wins.get(team, 0) + 1
+        self.rounds += summary["rounds"]
+        for flow in summary["votes"]:
+            self.votes[flow] = self.votes.get(flow, 0) + 1
+        for stage, ms in summary["phases"]:
+            histogram = self.phases.get(stage)
+            if histogram is None:
+                histogram = self.phases[stage] = Histogram(PHASE_BUCKETS)
+            histogram.add(ms)
+            self.phase_ms[stage] = self.phase_ms.get(stage, 0) + ms
+        if summary["link"] is not None:
+            self.linked += 1
+            for i, value in enumerate(summary["link"]):
+                self.link[i] += value
+
+    def report(self):
+        """Everything as plain data for JSON"""
+        frames, retransmits = self.link[0], self.link[1]
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "rounds": self.rounds,
+            "votes": [{"voter": ROLE_NAMES[voter], "target": ROLE_NAMES[target], "ballots": count}
+                      for (voter, target), count in sorted(self.votes.items())],
+            "phases": dict((STAGE_NAMES[stage], {
+                "count": histogram.total(),
+                "mean_ms": self.phase_ms[stage] // max(1, histogram.total()),
+                "p50_ms": min(histogram.percentile(50), histogram.max),
+                "p95_ms": min(histogram.percentile(95), histogram.max),
+                "max_ms": histogram.max,
+                "buckets": list(histogram.counts),
+            }) for stage, histogram in sorted(self.phases.items())),
+            "phase_buckets_ms": list(PHASE_BUCKETS),
+            "link": dict(zip(LINK_FIELDS, self.link), games=self.linked,
+                         retransmit_rate=retransmits / frames if frames else 0.0),
+        }
+
+
+def show(report) -> None:
+    print(f"{report['games']} games, {report['rounds']} rounds, wins: {report['wins']}")
+    print("votes at resolution, by role:")
+    by_voter = {}
+    for flow in report["votes"]:
+        by_voter[flow["voter"]] = by_voter.get(flow["voter"], 0) + flow["ballots"]
+    for flow in report["votes"]:
+        share = 100 * flow["ballots"] / by_voter[flow["voter"]]
+        print(f"  {flow['voter']:<20} -> {flow['target']:<20} {flow['ballots']:>7} ({share:.1f}%)")
+    print("phases:")
+    for stage, phase in report["phases"].items():
+        print(f"  {stage:<11} {phase['count']:>7} mean {phase['mean_ms']:>7}ms p50 {phase['p50_ms']:>7}ms "
+              f"p95 {phase['p95_ms']:>7}ms max {phase['max_ms']:>7}ms")
+    link = report["link"]
+    print(f"link: {link['frames']} frames, {link['retransmits']} retransmits ({100 * link['retransmit_rate']:.1f}%), "
+          f"{link['gave_up']} given up, {link['duplicates']} duplicates, {link['received']} messages in "
+          f"over {link['games']} games")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", help="replay files or directories of them")
+    parser.add_argument("--round", type=int, default=None, help="only read this round of every game")
+    parser.add_argument("--out", default=None, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    totals = Totals()
+    for path, summary in summaries(contents(replay_paths(args.paths)), args.round):
+        totals.add(summary)
+    report = totals.report()
+    show(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
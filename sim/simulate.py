@@ -0,0 +1,526 @@
+"""Play whole mafia games between simulated badges on one desktop
+
+    python sim/simulate.py --games 1000 --players 8 --loss 0.05
+    python sim/simulate.py --games 100 --failover
+    python sim/simulate.py --games 20 --rooms 12 --players 10
+    python sim/simulate.py --games 100 --stats
+    python sim/simulate.py --games 50 --replays replays/
+    python sim/simulate.py --games 5 --power
+    python sim/simulate.py --games 50 --players 20 --area 300 --range 100 --relay
+
+Each game: a host starts hosting, everyone else joins over the simulated
+radio, the host deals roles, then night actions and day votes repeat until
+one team wins. Prints throughput, packet counts and frame counters.
+With --failover the hosting badge walks out of range after the first night
+and the game carries on under its successor; prints how long that took and
+how much airtime the heartbeats cost.
+With --rooms several games run side by side on the same radio, every
+badge hears every other game's traffic; prints how much of it was dropped
+before decoding.
+With --stats the first badge collects everyone's stats over the radio at
+the end, the way a collector badge would at an event, and prints them.
+With --replays a player's badge copies the host's replay over the radio
+after every game and it's saved there, for sim/replays.py to read.
+With --power every phase runs to its deadline, actions are picked on the
+badges the way a player would, and the games are played twice: with power
+save off, the always-on baseline, then on. Prints each phase's estimated
+current draw per badge both ways, from power.py's numbers.
+With --area the badges are scattered over a square that many metres across
+and only hear each other within --range; with --relay the host relays its
+game. Prints how many badges got into each game, what share of the host's
+PHASE broadcasts reached the others and what that took on the air.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "mafia"))
+sys.path.insert(0, HERE)
+
+import badge  # noqa: E402  (the stand-in in this directory)
+import journal  # noqa: E402
+import protocol  # noqa: E402
+import election  # noqa: E402
+import power  # noqa: E402
+import stats  # noqa: E402
+from main2 import App, SNAPSHOT_INTERVAL  # noqa: E402
+from player import ROLE_NAMES, STAGE_NAMES, KRAKEN, COP, ORGANIZER, UNASSIGNED, OVER  # noqa: E402
+
+HOST = 1
+TICK = 0.05  # virtual seconds per frame
+JOIN_RETRY = 40  # ticks before a badge that hasn't been let in asks again
+
+
+def boot(device, app_class=App):
+    """Open the app on a device and load the rest of it, its journal goes to that device's own scratch flash"""
+    journal.JOURNAL_DIR = device.flash
+    app = device.run(app_class)
+    with device:
+        app.warm_up()
+    return app
+
+
+class Hall:
+    """One radio bus and clock shared by every room playing in it"""
+    def __init__(self, loss: float = 0.0, seed=None, radio_range: float = None):
+        self.clock = badge.Clock()
+        self.bus = badge.Bus(loss, seed, radio_range)
+        self.rooms = []
+        self.frames = 0
+
+    def next_address(self) -> int:
+        return HOST + sum(len(room.room) for room in self.rooms)
+
+    def step(self) -> None:
+        """Run every badge's loop once, then deliver what they sent"""
+        for room in self.rooms:
+            for device in room.devices:
+                device.loop()
+        self.bus.deliver()
+        self.clock.advance(TICK)
+        self.frames += 1
+        for room in self.rooms:
+            if not room.host.app.is_host and room.host in room.devices:
+                room.follow_host()
+
+    def play(self, max_rounds: int = 50, failover: bool = False):
+        """Play one game in every room at once, returns [(winning team, rounds played)] per room"""
+        games = [room.playing(max_rounds, failover) for room in self.rooms]
+        results = [None] * len(games)
+        while any(result is None for result in results):
+            for i, game in enumerate(games):
+                if results[i] is None:
+                    try:
+                        next(game)
+                    except StopIteration as done:
+                        results[i] = done.value
+        return results
+
+
+class Simulation:
+    """A room of badges running the app over a radio bus, shared with other rooms in the same hall"""
+    def __init__(self, players: int, loss: float = 0.0, seed=None, app_class=App, hall=None, patient: bool = False,
+                 area: float = None):
+        self.rng = random.Random(seed)
+        self.patient = patient  # wait out every phase's deadline instead of skipping ahead
+        self.area = area  # metres across the square the badges are scattered over, None puts them all in range
+        self.hall = hall or Hall(loss, seed)
+        self.clock = self.hall.clock
+        self.bus = self.hall.bus
+        self.devices = []
+        first = self.hall.next_address()
+        for i in range(players):
+            device = badge.Device(first + i, f"p{first + i - HOST}", self.clock)
+            if area is not None:
+                device.position = (self.rng.uniform(0, area), self.rng.uniform(0, area))
+            self.bus.attach(device)
+            boot(device, app_class)
+            self.devices.append(device)
+        self.room = list(self.devices)  # everyone, including badges that walked off
+        self.addresses = set(d.address for d in self.room)
+        self.host = self.devices[0]
+        self.failovers = []  # virtual seconds each failover took
+        self.spurious = 0  # takeovers from a host that was still there, lost heartbeats
+        self.hall.rooms.append(self)
+
+    @property
+    def frames(self) -> int:
+        return self.hall.frames
+
+    def step(self, ticks: int = 1) -> None:
+        """Run every badge in the hall once, then deliver what they sent"""
+        for _ in range(ticks):
+            self.hall.step()
+
+    def follow_host(self) -> None:
+        """The host stepped down for a newer one, keep driving whoever is hosting now"""
+        hosts = [d for d in self.devices if d.app.is_host]
+        if hosts:
+            self.spurious += 1
+            self.host = hosts[0]
+
+    def settle(self, max_ticks: int = 200) -> None:
+        """Step until the host has nothing left to send"""
+        for _ in range(max_ticks):
+            self.step()
+            if not self.busy():
+                return
+
+    def busy(self) -> bool:
+        """Whether anything is still on the air, queued to send or waiting to be applied"""
+        if self.host.app.game.pending or self.host.app.vote_queue:
+            return True
+        if any(packet.source in self.addresses for packet in self.bus.queue):
+            return True
+        for device in self.devices:
+            if device.app.rx_queue or device.app.tx_queue:
+                return True
+            for peer in device.app.transport.peers.values():
+                if peer.outbox or peer.unacked:
+                    return True
+        return False
+
+    def send_to_host(self, device, data: bytes) -> None:
+        if device is self.host:
+            # The host talks to itself without the radio
+            device.receive(badge.Packet(device.address, device.address, 0, protocol.link(device.app.game_id, data)))
+        else:
+            with device:
+                device.app.send(data, self.host.address)
+
+    def alive(self):
+        roster = self.host.app.game.roster
+        return [slot for slot in range(len(roster)) if roster.is_alive(slot)]
+
+    def winner(self):
+        """Name of the winning team once the host has called the game"""
+        host = self.host.app
+        if host.game.stage != OVER:
+            return None
+        return ROLE_NAMES[host.countdown[2]]
+
+    def drop(self, device) -> None:
+        """A badge walks out of range for the rest of the game"""
+        self.bus.detach(device)
+        self.devices.remove(device)
+
+    def failover(self, max_ticks: int = 400) -> float:
+        """Drop the host, step until its successor hosts and everyone follows, returns the virtual seconds it took"""
+        old = self.host
+        self.drop(old)
+        start = self.clock.now
+        for _ in range(max_ticks):
+            self.step()
+            hosts = [d for d in self.devices if d.app.is_host]
+            if len(hosts) == 1 and all(d.app.is_host or d.app.host_address == hosts[0].address for d in self.devices):
+                self.host = hosts[0]
+                elapsed = self.clock.now - start
+                self.failovers.append(elapsed)
+                return elapsed
+        raise RuntimeError("nobody took over hosting")
+
+    def advance(self) -> None:
+        """Skip to the host's next phase instead of waiting out its deadline"""
+        if self.patient:
+            self.wait_out()
+            return
+        with self.host:
+            self.host.app.advance_phase(self.clock.now)
+        self.settle()
+
+    def wait_out(self) -> None:
+        """Step until the host moves on by itself"""
+        host = self.host.app
+        stage = host.game.stage
+        for _ in range(int((host.phases.durations.get(stage, 0) + 10) / TICK)):
+            self.step()
+            if host.game.stage != stage:
+                break
+        else:
+            raise RuntimeError(f"{STAGE_NAMES[stage]} never ended")
+        self.settle()
+
+    def join_all(self, max_ticks: int = 400) -> None:
+        """Host a game, everyone else finds it in their browser and joins"""
+        with self.host:
+            self.host.app.start_hosting()
+        for tick in range(max_ticks):
+            waiting = [d for d in self.devices if d.app.slot is None]
+            if not waiting:
+                return
+            game = self.host.app.game_id
+            for device in waiting:
+                app = device.app
+                index = app.lobbies.find(game, self.host.address)
+                if index >= 0 and (app.game_id != game or tick % JOIN_RETRY == 0):
+                    with device:
+                        app.join_lobby(index)
+            self.step()
+            # Clients that missed the stage change only see it in a snapshot
+            self.host.app.last_snapshot -= 1.0
+        if self.area is None:
+            raise RuntimeError("players never finished joining")
+        # Scattered badges out of reach of the game just don't play
+
+    def night(self) -> None:
+        host = self.host.app
+        alive = self.alive()
+        roles = host.game.roster.roles
+        victims = [s for s in alive if roles[s] != KRAKEN]
+        for actor in alive:
+            role = roles[actor]
+            if role == KRAKEN and victims:
+                target = self.rng.choice(victims)
+            elif role in (COP, ORGANIZER):
+                target = self.rng.choice([s for s in alive if s != actor])
+            else:
+                continue
+            device = self.device_for(actor)
+            if self.patient and device is not self.host:
+                with device:
+                    device.app.night_action(target)  # Held for its action window in power save
+            else:
+                self.send_to_host(device, protocol.action(actor, target))
+        self.settle()
+        self.advance()  # dawn, then day unless the Krakens already won
+
+    def day(self) -> None:
+        self.advance()  # voting
+        alive = self.alive()
+        for voter in alive:
+            self.send_to_host(self.device_for(voter), protocol.vote(voter, self.rng.choice(alive)))
+        self.settle()
+        self.advance()  # resolution
+        self.advance()  # next night or game over
+
+    def device_for(self, slot: int):
+        address = self.host.app.game.roster.ids[slot] or self.host.address
+        return self.bus.devices[address]
+
+    def play(self, max_rounds: int = 50, failover: bool = False):
+        """Play one game, returns (winning team, rounds played)"""
+        for _ in self.playing(max_rounds, failover):
+            pass
+        return self.winner(), self.rounds
+
+    def playing(self, max_rounds: int = 50, failover: bool = False):
+        """Play one game a phase at a time, yields between phases so other rooms get a turn"""
+        self.rounds = 0
+        self.join_all()
+        if len(self.host.app.game.roster) < 3:
+            return None, 0  # Too few could reach the host to start
+        with self.host:
+            self.host.app.start_game()
+        self.settle()
+        for round_number in range(1, max_rounds + 1):
+            self.rounds = round_number
+            yield
+            self.night()
+            if self.winner():
+                return self.winner(), round_number
+            if failover and round_number == 1:
+                yield
+                self.step(int(SNAPSHOT_INTERVAL / TICK))  # Some of the day goes by first
+                self.failover()
+                self.settle()
+                if self.winner():
+                    return self.winner(), round_number
+            yield
+            self.day()
+            if self.winner():
+                return self.winner(), round_number
+        return None, max_rounds
+
+    def reset(self) -> None:
+        """Back to the home screen on every badge for the next game"""
+        for device in self.room:
+            if device not in self.devices:
+                self.bus.attach(device)  # Walked back into range
+        self.devices = list(self.room)
+        self.host = self.devices[0]
+        for device in self.devices:
+            with device:
+                app = device.app
+                app.is_host = False
+                app.slot = None
+                app.personal_player.role = UNASSIGNED
+                app.dawn = None
+                app.phases.reset()
+                app.personal_player.alive = True
+                app.game.reset()
+                app.voting.reset_round()
+                app.host_address = None
+                app.game_id = protocol.NO_GAME
+                app.last_beacon = None
+                app.lobbies.clear()
+                app.term = 0
+                app.host_slot = 0
+                app.successor = protocol.NO_SLOT
+                app.watch.stop()
+                app.replica.clear()
+                app.night = None
+                app.vote_queue = []
+                app.journal.clear()
+                app.replay.active = False  # A host that walked off never saw the end
+                app.held_action = None
+                app.fetch = None
+                app.rx_queue = []
+                app.tx_queue = []
+                for peer in app.transport.peers.values():
+                    # Nothing from the last game is still on its way
+                    peer.outbox = []
+                    peer.outbox_size = 0
+                    peer.unacked.clear()
+        self.bus.queue = [packet for packet in self.bus.queue if packet.source not in self.addresses]
+
+
+def collect(hall, devices, ticks: int = 100) -> None:
+    """The first badge asks the rest for their STATS, like a collector badge at an event"""
+    collector = devices[0]
+    with collector:
+        collector.app.collect_stats()
+    for _ in range(ticks):
+        hall.step()
+    reports = collector.app.collected
+    reports[collector.address] = collector.app.stats.export(collector.app.foreign)
+    print(f"stats: {len(reports)} of {len(devices)} badges reported")
+    for field in stats.EXPORT_FIELDS:
+        values = [values[stats.EXPORT_FIELDS.index(field)] for values in reports.values()]
+        values = [v for v in values if v != stats.UNKNOWN]
+        if values:
+            print(f"  {field:<14} min {min(values):>8} max {max(values):>8} total {sum(values):>10}")
+
+
+def fetch_replay(hall, room, path: str, max_ticks: int = 2000) -> int:
+    """A player's badge copies the host's replay over the radio and it's saved to path, returns its size"""
+    player = room.devices[-1]
+    with player:
+        player.app.fetch_replay(room.host.address)
+    for _ in range(max_ticks):
+        hall.step()
+        if player.app.fetch is None:
+            break
+    else:
+        raise RuntimeError("replay never finished copying")
+    fetched = player.app.fetched
+    shutil.copyfile(fetched.path, path)
+    return fetched.received
+
+
+def measure_power(args) -> None:
+    """Play the same games always on and in power save, print the estimated current per phase"""
+    results = []
+    for save in (False, True):
+        room = Simulation(args.players, args.loss, args.seed, patient=True)
+        for device in room.devices:
+            device.app.power_save = save
+        start = time.perf_counter()
+        for _ in range(args.games):
+            room.play(failover=args.failover)
+            room.reset()
+        seconds = {}
+        charge = {}
+        listening = {}
+        for device in room.room:
+            meter = device.app.meter
+            for stage, spent in meter.seconds.items():
+                seconds[stage] = seconds.get(stage, 0.0) + spent
+                charge[stage] = charge.get(stage, 0.0) + meter.charge.get(stage, 0.0)
+                listening[stage] = listening.get(stage, 0.0) + meter.listening.get(stage, 0.0)
+        transport = [d.app.transport for d in room.room]
+        print(f"{'power save' if save else 'always on'}: {args.games} games in {time.perf_counter() - start:.1f}s, "
+              f"{room.bus.sent} packets, {room.bus.asleep} missed asleep, {room.bus.dropped} lost, "
+              f"{sum(t.retransmits for t in transport)} retransmits, {sum(t.gave_up for t in transport)} given up")
+        results.append((seconds, charge, listening))
+    (base_seconds, base_charge, _), (seconds, charge, listening) = results
+    print("estimated current per badge:")
+    print(f"  {'stage':<11} {'always on':>10} {'power save':>11} {'saving':>7} {'rx on':>6}")
+    for stage in sorted(seconds):
+        if not seconds[stage] or not base_seconds.get(stage):
+            continue
+        base = base_charge[stage] / base_seconds[stage]
+        saved = charge[stage] / seconds[stage]
+        print(f"  {STAGE_NAMES[stage]:<11} {base:>8.1f}mA {saved:>9.1f}mA {100 * (1 - saved / base):>6.1f}% "
+              f"{100 * listening[stage] / seconds[stage]:>5.0f}%")
+    base = sum(base_charge.values()) / sum(base_seconds.values())
+    saved = sum(charge.values()) / sum(seconds.values())
+    print(f"  {'overall':<11} {base:>8.1f}mA {saved:>9.1f}mA {100 * (1 - saved / base):>6.1f}% "
+          f"(model: base {power.BASE_MA}mA, cpu {power.CPU_MA}mA, rx {power.RX_MA}mA, tx {power.TX_MA}mA)")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss probability")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--failover", action="store_true", help="the host leaves after the first night of every game")
+    parser.add_argument("--host-timeout", type=float, default=election.HOST_TIMEOUT)
+    parser.add_argument("--heartbeat", type=float, default=election.HEARTBEAT_INTERVAL, help="seconds between heartbeats")
+    parser.add_argument("--rooms", type=int, default=1, help="games played at once on the same radio")
+    parser.add_argument("--stats", action="store_true", help="collect every badge's stats over the radio at the end")
+    parser.add_argument("--replays", metavar="DIR", help="copy every game's replay off its host into this directory")
+    parser.add_argument("--power", action="store_true", help="compare estimated current draw always on and in power save")
+    parser.add_argument("--area", type=float, default=None, help="scatter the badges over a square this many metres across")
+    parser.add_argument("--range", type=float, default=100.0, help="metres a badge's radio reaches, with --area")
+    parser.add_argument("--relay", action="store_true", help="hosts relay their games badge to badge")
+    args = parser.parse_args(argv)
+    if args.power:
+        measure_power(args)
+        return
+
+    hall = Hall(args.loss, args.seed, None if args.area is None else args.range)
+    rooms = [Simulation(args.players, seed=None if args.seed is None else args.seed + i, hall=hall, area=args.area)
+             for i in range(args.rooms)]
+    devices = [device for room in rooms for device in room.room]
+    joined = 0
+    for device in devices:
+        device.app.relay_games = args.relay
+        device.app.watch.timeout = args.host_timeout
+        device.app.heartbeat_interval = args.heartbeat
+        if args.rooms > 1:
+            # Rooms wait their turn between phases, don't let the hosts' deadlines move them on meanwhile
+            device.app.phases.durations = dict((stage, 100 * seconds) for stage, seconds in device.app.phases.durations.items())
+    if args.replays:
+        os.makedirs(args.replays, exist_ok=True)
+    wins = {}
+    rounds = 0
+    replay_bytes = 0
+    start = time.perf_counter()
+    for game in range(args.games):
+        for winner, played in hall.play(failover=args.failover):
+            wins[winner] = wins.get(winner, 0) + 1
+            rounds += played
+        joined += sum(len(room.host.app.game.roster) for room in rooms)
+        if args.replays:
+            for number, room in enumerate(rooms):
+                replay_bytes += fetch_replay(hall, room, os.path.join(args.replays, f"game-{game}-room-{number}.bin"))
+        for room in rooms:
+            room.reset()
+    elapsed = time.perf_counter() - start
+
+    bus = hall.bus
+    games = args.games * args.rooms
+    drawn = sum(d.app.renderer.frames_drawn for d in devices)
+    skipped = sum(d.app.renderer.frames_skipped for d in devices)
+    print(f"{games} games of {args.players} in {elapsed:.2f}s ({games / elapsed:.1f} games/s)")
+    print(f"wins: {wins}, avg rounds: {rounds / games:.2f}")
+    print(f"packets: {bus.sent} sent, {bus.delivered} delivered, {bus.dropped} dropped, {bus.bytes_sent} bytes")
+    print(f"per game: {bus.sent / games:.1f} packets, {bus.bytes_sent / games:.0f} bytes, {hall.frames / args.games:.0f} frames")
+    print(f"frames: {drawn} drawn, {skipped} skipped")
+    heartbeats = sum(d.app.heartbeats for d in devices)
+    heartbeat_bytes = heartbeats * len(protocol.link(0, protocol.heartbeat(0, 0, 0)))
+    virtual = hall.frames * TICK
+    print(f"heartbeats: {heartbeats} sent, {heartbeat_bytes} bytes, {heartbeat_bytes / virtual:.1f} B/s, {100 * heartbeat_bytes / max(1, bus.bytes_sent):.1f}% of airtime")
+    if args.rooms > 1:
+        foreign = sum(d.app.foreign for d in devices)
+        print(f"hall: {args.rooms} rooms, {len(devices)} badges, {foreign} of {bus.delivered} packets "
+              f"({100 * foreign / max(1, bus.delivered):.1f}%) dropped unread as another game's")
+    if args.area is not None:
+        phases = sum(room.room[0].app.stats.packets_out[protocol.PHASE] for room in rooms)
+        heard = sum(d.app.stats.packets_in[protocol.PHASE] for room in rooms for d in room.room[1:])
+        relays = [d.app.relays for d in devices]
+        print(f"area: {args.area:.0f}m across, {args.range:.0f}m range, relay {'on' if args.relay else 'off'}: "
+              f"{joined / games:.1f} of {args.players} badges joined per game, "
+              f"{100 * heard / max(1, phases * (args.players - 1)):.1f}% of PHASE broadcasts delivered")
+        print(f"airtime: {bus.bytes_sent / games:.0f} bytes and {bus.sent / games:.1f} packets per game, "
+              f"{sum(r.forwarded for r in relays)} relayed, {sum(r.suppressed for r in relays)} suppressed, "
+              f"{sum(r.duplicates for r in relays)} duplicates heard")
+    if args.replays:
+        print(f"replays: {games} saved to {args.replays}, {replay_bytes / games:.0f} bytes each on average")
+    if args.stats:
+        collect(hall, devices)
+    failovers = sorted(t for room in rooms for t in room.failovers)
+    if failovers:
+        spurious = sum(room.spurious for room in rooms)
+        print(f"failover: {len(failovers)} takeovers, mean {sum(failovers) / len(failovers):.2f}s, "
+              f"median {failovers[len(failovers) // 2]:.2f}s, max {failovers[-1]:.2f}s (timeout {args.host_timeout}s), "
+              f"{spurious} spurious")
+
+
+if __name__ == "__main__":
+    main()
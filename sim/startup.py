@@ -0,0 +1,114 @@
+"""Cold-start timing for the app, from tapping its icon to a screen that takes input
+
+    python sim/startup.py --runs 20
+    python sim/startup.py --runs 20 --out startup_results.json
+
+Every run is a fresh interpreter with an empty bytecode cache, so each
+module is compiled from source the way MicroPython does on the badge.
+Times importing main2, on_open, the first frame (the welcome screen) and
+the second frame (warm_up plus the first real frame), and lists which app
+modules had been loaded by each point. Desktop milliseconds are only
+comparable with each other; the source bytes compiled before the welcome
+screen is what tracks the badge.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(HERE), "mafia")
+
+STEPS = ("import", "on_open", "welcome", "interactive")
+
+
+def app_modules():
+    """App modules loaded so far, name -> source bytes"""
+    loaded = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if os.path.dirname(os.path.abspath(path)) == APP_DIR:
+            loaded[name] = os.path.getsize(path)
+    return loaded
+
+
+def child() -> None:
+    """One cold start, prints its timings as JSON"""
+    sys.path.insert(0, APP_DIR)
+    sys.path.insert(0, HERE)
+    import badge  # The firmware is already loaded when an app opens
+
+    marks = {}
+    start = time.perf_counter()
+    from main2 import App
+    marks["import"] = time.perf_counter()
+
+    device = badge.Device(1, "p0", badge.Clock())
+    badge.Bus().attach(device)
+    app = device.app = App()
+    with device:
+        app.on_open()
+    marks["on_open"] = time.perf_counter()
+
+    device.loop()
+    marks["welcome"] = time.perf_counter()
+    if app.renderer.current != "welcome":
+        raise RuntimeError(f"first frame showed {app.renderer.current}, not the welcome screen")
+    welcome_modules = app_modules()
+
+    import journal  # warm_up would import it first thing anyway
+    journal.JOURNAL_DIR = device.flash  # Don't resume from whatever is lying around in mafia/
+    device.loop()
+    marks["interactive"] = time.perf_counter()
+    if not app.warm:
+        raise RuntimeError("second frame didn't finish starting up")
+
+    print(json.dumps({
+        "ms": dict((step, (marks[step] - start) * 1e3) for step in STEPS),
+        "welcome_modules": welcome_modules,
+        "modules": app_modules(),
+    }))
+
+
+def run_once() -> dict:
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child"], env=env, text=True)
+    return json.loads(out)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--out", default=None, help="also write the results here as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child()
+        return
+
+    runs = [run_once() for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, milliseconds since the tap (median, min)")
+    for step in STEPS:
+        times = [run["ms"][step] for run in runs]
+        print(f"  {step:<12} {median(times):>8.2f} {min(times):>8.2f}")
+    last = runs[-1]
+    for label, modules in (("welcome", last["welcome_modules"]), ("interactive", last["modules"])):
+        print(f"{label}: {len(modules)} modules, {sum(modules.values())} source bytes: {' '.join(sorted(modules))}")
+    if args.out:
+        report = {"runs": args.runs, "median_ms": dict((step, median([run["ms"][step] for run in runs])) for step in STEPS),
+                  "welcome_modules": last["welcome_modules"], "modules": last["modules"]}
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()